@@ -0,0 +1,16 @@
+from cs336_data.domain_index import C4_DOMAINS_INDEX, EXTRACTED_DOMAINS_INDEX, build_domain_index_from_csv
+
+# Offline step: compile the domain allowlists used by parallel_process_wets.py into
+# sorted-hash files that every worker memory-maps instead of parsing the CSVs
+C4_DOMAINS_CSV = "cs336-basics/sql-console-for-allenai-paloma.csv"
+EXTRACTED_DOMAINS_CSV = "cs336-basics/results_100000domains.csv"
+
+def build_domain_indexes():
+    # C4 entries are reduced to their registered domain, extracted entries are kept as listed
+    c4_count = build_domain_index_from_csv(C4_DOMAINS_CSV, C4_DOMAINS_INDEX, registered=True)
+    extracted_count = build_domain_index_from_csv(EXTRACTED_DOMAINS_CSV, EXTRACTED_DOMAINS_INDEX)
+    print(f"✅ Wrote {c4_count} C4 domains to {C4_DOMAINS_INDEX}")
+    print(f"✅ Wrote {extracted_count} extracted domains to {EXTRACTED_DOMAINS_INDEX}")
+
+if __name__ == "__main__":
+    build_domain_indexes()
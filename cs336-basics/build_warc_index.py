@@ -0,0 +1,18 @@
+import os
+import sys
+import time
+from pathlib import Path
+from cs336_data.warc_index import build_warc_indexes
+
+# Offline step: write a `.cdx` index (gzip member offset, length, WARC-Type and URI of every record)
+# next to each WET file, so parallel_process_wets.py splits files without probing them and
+# samplers can seek straight to records
+WET_DIR = "cs336-basics/wet_files"
+
+if __name__ == "__main__":
+    # Usage: python cs336-basics/build_warc_index.py [file.warc.gz ...]  (default: every WET file)
+    paths = sys.argv[1:] or sorted(Path(WET_DIR).glob("*.warc.wet.gz"))
+    start = time.perf_counter()
+    counts = build_warc_indexes(paths, num_workers=len(os.sched_getaffinity(0)))
+    print(f"✅ Indexed {sum(counts.values())} records in {len(counts)} files "
+          f"({len(paths) - len(counts)} already indexed) in {time.perf_counter() - start:.1f}s")
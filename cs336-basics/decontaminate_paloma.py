@@ -0,0 +1,120 @@
+import os
+import argparse
+import itertools
+import concurrent.futures
+from pathlib import Path
+from tqdm import tqdm
+from cs336_data.codecs import Codec, open_input
+from cs336_data.manifest import atomic_write
+from cs336_data.resharding import ShardInfo, clear_final_outputs, load_shard_manifest, write_shard_manifest
+from cs336_data.decontamination import DEFAULT_NGRAM, NgramIndex, iter_token_file_documents, write_ngram_index
+
+# Paloma C4 100-domains validation set written by load_and_tokenize.py, the dev set of train.py
+PALOMA_TOKENS = "cs336-basics/data/paloma/tokenized_paloma_c4_100_domains_validation.bin"
+# Sorted 64-bit hashes of its word n-grams (8 bytes per n-gram), memory-mapped by every worker;
+# the `decontaminate` pipeline stages read the same file
+NGRAM_INDEX = "cs336-basics/paloma_ngrams.npy"
+INPUT_DIR = "cs336-basics/final_output"
+OUTPUT_DIR = "cs336-basics/decontaminated_output"
+# Lines of a shard looked up in the index at once
+BATCH_LINES = 4096
+
+# N-gram index of the evaluation set, set by init_worker
+INDEX = None
+
+def init_worker(index_path, n):
+    global INDEX
+    INDEX = NgramIndex(index_path, n)
+
+def build_index(eval_tokens, eval_text, n):
+    """Hash the n-grams of the evaluation documents, either decoded from a token file or read
+    from a text file with one document per line."""
+    if eval_text:
+        with open(eval_text, encoding='utf-8') as f:
+            return write_ngram_index(tqdm(f, desc="Eval documents"), NGRAM_INDEX, n)
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    documents = iter_token_file_documents(eval_tokens, tokenizer.decode, eos_token_id=tokenizer.eos_token_id)
+    return write_ngram_index(tqdm(documents, desc="Eval documents"), NGRAM_INDEX, n)
+
+def decontaminate_shard(input_path, output_path):
+    """Copy a final output shard without the lines that share an n-gram with the evaluation set;
+    each line is one training document for parallel_tokenize_gz.py. Also counts the documents
+    (non-empty lines) and text bytes kept, as the shard manifest lists them."""
+    stats = {'lines': 0, 'contaminated_lines': 0, 'overlapping_ngrams': 0, 'documents': 0, 'bytes': 0}
+    with open_input(input_path, 'rt', encoding='utf-8') as fin, \
+            atomic_write(output_path, 'wt', opener=Codec.for_path(output_path).open) as fout:
+        while batch := list(itertools.islice(fin, BATCH_LINES)):
+            overlaps = INDEX.count_line_overlaps(batch)
+            kept = [line for line, count in zip(batch, overlaps) if not count]
+            fout.writelines(kept)
+            stats['documents'] += sum(1 for line in kept if line.strip())
+            stats['bytes'] += sum(len(line.encode('utf-8')) for line in kept)
+            stats['lines'] += len(batch)
+            stats['contaminated_lines'] += int((overlaps > 0).sum())
+            stats['overlapping_ngrams'] += int(overlaps.sum())
+    return stats
+
+def contamination_rate(stats):
+    return stats['contaminated_lines'] / max(stats['lines'], 1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove Paloma validation documents from the training shards")
+    parser.add_argument('--eval-tokens', default=PALOMA_TOKENS, help="uint16 GPT-2 token file of the evaluation set")
+    parser.add_argument('--eval-text', help="Evaluation set as raw text, one document per line, instead of --eval-tokens")
+    parser.add_argument('--ngram', type=int, default=DEFAULT_NGRAM, help="Words per n-gram")
+    parser.add_argument('--rebuild-index', action='store_true', help=f"Rebuild {NGRAM_INDEX} even if it exists")
+    parser.add_argument('--workers', type=int, default=len(os.sched_getaffinity(0)))
+    args = parser.parse_args()
+
+    if args.rebuild_index or not Path(NGRAM_INDEX).exists():
+        print(f"🔨 Building the n-gram index {NGRAM_INDEX}...")
+        num_ngrams = build_index(args.eval_tokens, args.eval_text, args.ngram)
+        print(f"✅ {num_ngrams:,} distinct {args.ngram}-grams ({num_ngrams * 8 / 2**20:.1f} MB)")
+
+    # Shards of a --shard-bytes/--shard-docs run are read in manifest order and keep their grouping
+    shards = load_shard_manifest(INPUT_DIR)
+    if shards is not None:
+        input_files = [Path(INPUT_DIR) / shard.path for shard in shards]
+        print(f"📦 Shard manifest: {len(shards)} shards, {sum(shard.documents for shard in shards):,} documents")
+    else:
+        input_files = sorted(Path(INPUT_DIR).glob("*.final.*"))
+    if not input_files:
+        raise FileNotFoundError(f"No .final.* files found in {INPUT_DIR}")
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    # Outputs of an earlier run would be read along with this one's
+    clear_final_outputs(OUTPUT_DIR)
+
+    total = {'lines': 0, 'contaminated_lines': 0, 'overlapping_ngrams': 0}
+    shard_stats = {}
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(NGRAM_INDEX, args.ngram)
+    ) as executor:
+        futures = {
+            executor.submit(decontaminate_shard, input_file, Path(OUTPUT_DIR) / input_file.name): input_file
+            for input_file in input_files
+        }
+        for future in concurrent.futures.as_completed(futures):
+            stats = future.result()
+            shard_stats[futures[future].name] = stats
+            for key in total:
+                total[key] += stats[key]
+            print(f"📄 {futures[future].name}: {stats['contaminated_lines']} of {stats['lines']} lines contaminated "
+                  f"({contamination_rate(stats):.3%}), {stats['overlapping_ngrams']} overlapping n-grams")
+
+    if shards is not None:
+        # Same shards, with the document and byte counts left after decontamination
+        decontaminated = [
+            ShardInfo(shard.path, shard_stats[shard.path]['documents'], shard_stats[shard.path]['bytes'],
+                      os.path.getsize(Path(OUTPUT_DIR) / shard.path))
+            for shard in shards
+        ]
+        manifest_path = write_shard_manifest(OUTPUT_DIR, decontaminated)
+        print(f"📦 Shard manifest written to {manifest_path}: "
+              f"{sum(shard.documents for shard in decontaminated):,} documents left")
+
+    print(f"\n📊 {total['contaminated_lines']} of {total['lines']} lines removed ({contamination_rate(total):.3%}), "
+          f"{total['overlapping_ngrams']} overlapping n-grams")
+    print(f"✅ Decontaminated shards written to {OUTPUT_DIR}; point parallel_tokenize_gz.py's input_dir there")
@@ -1,294 +1,947 @@
 import concurrent.futures
+import argparse
+import contextlib
+import multiprocessing
 import os
-import csv
-from collections import defaultdict
+import shutil
+import itertools
+import random
+from array import array
+from collections import defaultdict, deque
+import numpy as np
 from tqdm import tqdm
 from pathlib import Path
-from fastwarc.warc import ArchiveIterator, WarcRecordType
-from tldextract import TLDExtract
-from cs336_data.utilities import identify_language
-from cs336_data.utilities import exact_line_deduplication
-from cs336_data.minhash_deduplication import minhash_deduplication
-import re
-import gzip
-
-# Initialize TLDExtract
-tld_extractor = TLDExtract()
-
-# Load C4 domains and extract main domains
-def load_c4_domains(file_path):
-    domains = set()
-    with open(file_path, 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            full_subdomain = row['subdomain']
-            clean_subdomain = '_'.join(full_subdomain.split('_')[1:])
-            extracted = tld_extractor(clean_subdomain)
-            main_domain = f"{extracted.domain}.{extracted.suffix}"
-            domains.add(main_domain)
-    return domains
-
-def load_extracted_domains(file_path):
-    domains = set()
-    try:
-        with open(file_path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                full_subdomain = row['subdomain']
-                # 移除前面的編號部分（如 "123_"）
-                clean_subdomain = '_'.join(full_subdomain.split('_')[1:])
-                domains.add(clean_subdomain)
-    except Exception as e:
-        print(f"⚠️ 無法讀取 {file_path}：{e}")
-    return domains
-
-C4_DOMAINS = load_c4_domains("cs336-basics/sql-console-for-allenai-paloma.csv")
-EXTRACTED_DOMAINS = load_extracted_domains("cs336-basics/results_100000domains.csv")
-
-# Load bad words from file
-def load_bad_words(file_path="cs336-basics/bad_words_en.txt"):
-    bad_words_set = set()
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                phrase = line.strip().lower()
-                if phrase:
-                    bad_words_set.add(phrase)
-    except FileNotFoundError:
-        print(f"⚠️ 警告：找不到 {file_path}，使用默認過濾規則或請確認檔案存在。")
-    return bad_words_set
-
-BAD_WORDS = load_bad_words()
-
-# C4 heuristic functions
-def ends_with_punctuation(line):
-    return line.strip().endswith(('.', '!', '?', '"', "’", "”"))
-
-def count_words(line):
-    return len(line.strip().split())
-
-def is_junk_line(line):
-    return (
-        'javascript' in line.lower() or
-        'lorem ipsum' in line.lower() or
-        '{' in line or
-        '}' in line
-    )
+from fastwarc.warc import WarcRecordType
+from cs336_data.utilities import INFERENCE_SOCKET_ENV, find_duplicate_lines, iter_unique_lines, read_lines as read_cleaned_lines
+from cs336_data.minhash_deduplication import minhash_keep_ids
+from cs336_data.url_dedup import hash_url, SharedBloomFilter
+from cs336_data.manifest import RunManifest, atomic_write
+from cs336_data.lease_queue import LeaseQueue
+from cs336_data.codecs import Codec
+from cs336_data.resharding import ShardWriter, balanced_target, clear_final_outputs
+from cs336_data.worker_pool import PreloadedPool, format_startups
+from cs336_data.quality_sketch import ScoreSketch, exact_cutoff_for_top
+from cs336_data.pipeline import Document, build_pipeline, load_pipeline_config, register_stage
+from cs336_data.warc_reader import iter_warc_records
+from cs336_data.warc_index import (
+    build_warc_indexes,
+    ensure_warc_index,
+    iter_indexed_records,
+    sample_index_fraction,
+    split_indexed_warc_file,
+)
+from cs336_data.dry_run import DryRunSample, estimate_run, format_estimate, profile_documents
+from cs336_data.token_budget import TokenBudget
+from cs336_data.boilerplate import BoilerplateStripper
+from cs336_data.threshold_sweep import FeatureTable, format_sweep, load_sweep_grid, sweep
+from cs336_data.domain_index import C4_DOMAINS_INDEX, EXTRACTED_DOMAINS_INDEX, DomainIndex, url_registered_domain
+from build_domain_index import build_domain_indexes
 
-def contains_bad_word(text):
-    return any(word in text.lower() for word in BAD_WORDS)
+# Domain allowlists, precompiled by build_domain_index.py and memory-mapped, and the pipeline built
+# from PIPELINE_CONFIG_PATH; loaded by get_pipeline, so importing this script loads nothing
+PIPELINE_CONFIG_PATH = "cs336_data/configs/wet_c4.yaml"
+C4_DOMAINS = None
+EXTRACTED_DOMAINS = None
+PIPELINE_CONFIG = None
+PIPELINE = None
 
-def count_sentences(text):
-    return len(re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', text.strip()))
+# Seen-URL filter shared by all workers, set by init_worker
+# Sized for the allowlisted records of 5000 WET files; false positives drop ~0.1% of unique URLs
+URL_DEDUP_CAPACITY = 50_000_000
+URL_DEDUP_ERROR_RATE = 1e-3
+SEEN_URLS = None
+# Shards are split into work units of about this many compressed bytes (a 100 MB WET gives ~6), and
+# at most MAX_PENDING_PER_CPU units per worker are submitted ahead, so idle workers take over the
+# rest of a large shard instead of waiting for one straggler
+WET_CHUNK_BYTES = 16 << 20
+MAX_PENDING_PER_CPU = 2
+# In work-queue mode, steps 2-4 are the one task of this sub-queue of the queue directory: one host
+# runs them while the others wait, and one of those takes them over if its lease expires
+FINALIZE_QUEUE = "finalize"
+FINALIZE_TASK = "dedup"
+# (h1, h2) hash pairs of the URLs this worker added to SEEN_URLS for the current shard;
+# saved next to the shard output so a resumed run can restore them
+INSERTED_URL_HASHES = array('Q')
 
-def count_lines_in_file(file_path):
-    """Helper: Count number of non-empty lines in a file"""
-    count = 0
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    count += 1
-    except Exception as e:
-        print(f"Error counting lines in {file_path}: {e}")
-    return count
-
-# Process WET file and write plain .txt output
-def process_single_wet_file(input_path: str, output_dir: str):
+# Quality score and line count of every document a unit writes, saved next to its output, so
+# --quality-top can pick an exact cutoff over the whole run and drop documents without re-scoring
+DOC_SCORE_DTYPE = np.dtype([('score', '<f4'), ('lines', '<u4')])
+# Per-shard quality histograms are logged with this many bins over [0, 1]
+QUALITY_HISTOGRAM_BINS = 10
+
+# Modules workers start with: this script (domain tables, TLD extractor, the pipeline with its
+# fastText models and bad-word matcher, loaded by get_pipeline), loaded once and shared copy-on-write
+WORKER_PRELOAD = ["__main__"]
+
+# Log file of the run, opened by main
+LOG_FILE = None
+
+# Directory for per-unit Parquet annotation files (--annotations), set by init_worker
+ANNOTATIONS_DIR = None
+
+# Shared token counter of a --token-budget run, set by init_worker; workers report the text they
+# keep every BUDGET_REPORT_EVERY records
+TOKEN_BUDGET = None
+BUDGET_REPORT_EVERY = 256
+
+def init_worker(seen_urls, annotations_dir=None, token_budget=None):
+    global SEEN_URLS, ANNOTATIONS_DIR, TOKEN_BUDGET
+    SEEN_URLS = seen_urls
+    ANNOTATIONS_DIR = annotations_dir
+    TOKEN_BUDGET = token_budget
+
+# Pipeline stages that need this script's domain tables and shared URL filter
+@register_stage("domain", cost=5, reject_rate=0.95)
+def domain_stage():
+    def fn(doc, stats):
+        # Extract main domain
+        main_domain = url_registered_domain(doc.url)
+        doc.meta['domain'] = main_domain
+
+        # Check against C4 and Extracted domains
+        in_c4 = main_domain in C4_DOMAINS
+        in_extracted = main_domain in EXTRACTED_DOMAINS
+
+        if not in_c4 and not in_extracted:
+            return False
+        if not in_c4:
+            stats['not_in_c4_but_in_extracted'] += 1
+        elif not in_extracted:
+            stats['not_in_extracted_but_in_c4'] += 1
+        else:
+            stats['in_both_domains'] += 1
+        return True
+    return fn
+
+@register_stage("url_dedup", cost=3, reject_rate=0.1, side_effects=True)
+def url_dedup_stage():
+    def fn(doc, stats):
+        # Skip URLs already seen in this or another shard, before decoding the payload
+        if SEEN_URLS is None:
+            return True
+        url_hash = hash_url(doc.url)
+        if SEEN_URLS.add_hash(*url_hash):
+            return False
+        INSERTED_URL_HASHES.extend(url_hash)
+        return True
+    return fn
+
+@register_stage("boilerplate", cost=100, transform=True, side_effects=True)
+def boilerplate_stage(min_pages=3, min_fraction=0.05, max_domains=8192, width=1024, depth=4):
+    # Per-domain line tables of this worker, built up over every unit it processes
+    stripper = BoilerplateStripper(min_pages, min_fraction, max_domains, width, depth)
+
+    def batch(docs, stats):
+        groups = defaultdict(list)
+        for doc in docs:
+            groups[doc.meta.get('domain') or url_registered_domain(doc.url)].append(doc)
+        for domain, group in groups.items():
+            for doc, text in zip(group, stripper.strip(domain, [doc.text for doc in group], stats)):
+                doc.text = text
+        return [True] * len(docs)
+
+    def fn(doc, stats):
+        return batch([doc], stats)[0]
+    fn.batch = batch
+    return fn
+
+def get_pipeline():
+    """The pipeline of this process, built on first use after loading the domain allowlists
+    (compiled first if missing); workers forked afterwards share both copy-on-write."""
+    global C4_DOMAINS, EXTRACTED_DOMAINS, PIPELINE_CONFIG, PIPELINE
+    if PIPELINE is None:
+        if not (Path(C4_DOMAINS_INDEX).exists() and Path(EXTRACTED_DOMAINS_INDEX).exists()):
+            build_domain_indexes()
+        C4_DOMAINS = DomainIndex(C4_DOMAINS_INDEX)
+        EXTRACTED_DOMAINS = DomainIndex(EXTRACTED_DOMAINS_INDEX)
+        PIPELINE_CONFIG = load_pipeline_config(PIPELINE_CONFIG_PATH)
+        PIPELINE = build_pipeline(PIPELINE_CONFIG)
+    return PIPELINE
+
+# With the boilerplate stage, units read their records grouped by registered domain (through the
+# WET index) and run the pipeline on each domain's records as one batch, of at most
+# DOMAIN_BATCH_DOCS records
+DOMAIN_BATCH_DOCS = 1024
+
+def groups_by_domain(pipeline):
+    return any(stage.name == 'boilerplate' for stage in pipeline.stages)
+
+def log(msg):
+    print(msg)
+    if LOG_FILE is not None:
+        LOG_FILE.write(msg + "\n")
+        LOG_FILE.flush()
+
+def log_worker_pool(executor):
+    log(f"👷 Workers ({executor.start_method}):")
+    for line in format_startups(executor.worker_startups(), executor.worker_memory()):
+        log(f"  {line}")
+
+def format_bytes(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+def url_hashes_path(cleaned_path):
+    return Path(cleaned_path).with_suffix('.urls.bin')
+
+def quality_scores_path(cleaned_path):
+    return Path(cleaned_path).with_suffix('.quality.bin')
+
+def unit_outputs(cleaned_path):
+    return [Path(cleaned_path), url_hashes_path(cleaned_path), quality_scores_path(cleaned_path)]
+
+def read_quality_lines(cleaned_path, cutoff):
+    """Lines of the documents in a cleaned file whose quality score is at least `cutoff`."""
+    doc_scores = np.fromfile(quality_scores_path(cleaned_path), dtype=DOC_SCORE_DTYPE)
+    # Only '\n' ends a line, as in the line counts written by process_wet_range
+    with open(cleaned_path, encoding='utf-8', newline='\n') as f:
+        for score, num_lines in doc_scores:
+            lines = itertools.islice(f, int(num_lines))
+            if score >= cutoff:
+                yield from lines
+            else:
+                deque(lines, maxlen=0)
+
+def quality_histogram(stats):
+    return [stats[f'quality_hist_{i}'] for i in range(QUALITY_HISTOGRAM_BINS)]
+
+def restore_seen_urls(seen_urls, cleaned_path):
+    """Re-add the URLs a shard finished in an earlier run inserted into the shared filter."""
+    hashes = array('Q')
+    with open(url_hashes_path(cleaned_path), 'rb') as f:
+        hashes.frombytes(f.read())
+    for i in range(0, len(hashes), 2):
+        seen_urls.add_hash(hashes[i], hashes[i + 1])
+
+def iter_domain_batches(input_path, byte_range, stats, allowlisted_only=True):
+    """Yield (documents, compressed bytes) batches of the conversion records of (a byte range of) a
+    WET file, one registered domain at a time, in order of first appearance within the range.
+
+    With `allowlisted_only`, records of domains in neither allowlist are dropped by the URI in the
+    index, without reading them, and counted under the `domain` stage's rejection counter."""
+    entries = [entry for entry in ensure_warc_index(input_path) if entry.record_type == 'conversion'
+               and (byte_range is None or byte_range[0] <= entry.offset < byte_range[1])]
+    domain_stat = next((stage.stat for stage in get_pipeline().stages if stage.name == 'domain'), None)
+    groups = defaultdict(list)
+    for entry in entries:
+        domain = url_registered_domain(entry.uri)
+        if allowlisted_only and domain_stat and domain not in C4_DOMAINS and domain not in EXTRACTED_DOMAINS:
+            stats['total_records'] += 1
+            stats[domain_stat] += 1
+            continue
+        groups[domain].append(entry)
+    for group in groups.values():
+        for start in range(0, len(group), DOMAIN_BATCH_DOCS):
+            batch = group[start:start + DOMAIN_BATCH_DOCS]
+            # Records are only valid until the next one is read, so the payloads are read up front
+            docs = [Document(url=record.headers.get('WARC-Target-URI', ''), raw=record.reader.read())
+                    for record in iter_indexed_records(input_path, batch, parse_http=False)]
+            yield docs, sum(entry.length for entry in batch)
+
+# Process (a byte range of) a WET file and write plain .txt output
+def process_wet_range(input_path, output_path, byte_range=None):
+    pipeline = get_pipeline()
+    stats = defaultdict(int)
+    del INSERTED_URL_HASHES[:]
+    doc_scores = []
+
+    # Outputs only appear under their final names once the unit is complete
+    with contextlib.ExitStack() as stack:
+        out_file = stack.enter_context(atomic_write(output_path, 'w', encoding='utf-8'))
+        annotations = None
+        if ANNOTATIONS_DIR is not None:
+            from cs336_data.annotations import AnnotationWriter
+            annotations = stack.enter_context(AnnotationWriter(Path(ANNOTATIONS_DIR) / f"{Path(output_path).stem}.parquet"))
+
+        # Kept text and input bytes not reported to TOKEN_BUDGET yet
+        unreported_text = unreported_input = 0
+
+        def write(doc, kept):
+            nonlocal unreported_text
+            if annotations is not None:
+                annotations.add(doc, kept)
+            if kept:
+                out_file.write(f"{doc.text}\n")
+                num_lines = doc.text.count('\n') + 1
+                stats['output_lines'] += num_lines
+                text_bytes = len(doc.text.encode('utf-8')) + 1
+                stats['output_text_bytes'] += text_bytes
+                unreported_text += text_bytes
+                if 'quality_score' in doc.meta:
+                    doc_scores.append((doc.meta['quality_score'], num_lines))
+
+        if groups_by_domain(pipeline):
+            # Annotations cover every record, so only skip unread records without them
+            for docs, input_bytes in iter_domain_batches(input_path, byte_range, stats, allowlisted_only=annotations is None):
+                stats['total_records'] += len(docs)
+                for doc, kept in zip(docs, pipeline.process_batch(docs, stats)):
+                    write(doc, kept)
+                if TOKEN_BUDGET is not None:
+                    TOKEN_BUDGET.add(unreported_text, input_bytes)
+                    unreported_input += input_bytes
+                    unreported_text = 0
+        else:
+            records = iter_warc_records(input_path, record_types=WarcRecordType.conversion, parse_http=False, byte_range=byte_range)
+            for record in records:
+                stats['total_records'] += 1
+                if TOKEN_BUDGET is not None and stats['total_records'] % BUDGET_REPORT_EVERY == 0:
+                    # Positions are relative to the start of the unit
+                    TOKEN_BUDGET.add(unreported_text, record.stream_pos - unreported_input)
+                    unreported_input = record.stream_pos
+                    unreported_text = 0
+                doc = Document(url=record.headers.get('WARC-Target-URI', ''), reader=record.reader)
+                write(doc, pipeline.process(doc, stats))
+    with atomic_write(url_hashes_path(output_path), 'wb') as url_file:
+        INSERTED_URL_HASHES.tofile(url_file)
+    with atomic_write(quality_scores_path(output_path), 'wb') as score_file:
+        np.array(doc_scores, dtype=DOC_SCORE_DTYPE).tofile(score_file)
+
+    # The unit's sketch (of kept and rejected documents) is journaled as a coarse histogram
+    sketch = stats.pop('quality_sketch', None)
+    if sketch is not None:
+        for i, count in enumerate(sketch.histogram(QUALITY_HISTOGRAM_BINS)):
+            stats[f'quality_hist_{i}'] = count
+
+    stats['bytes_read'] = byte_range[1] - byte_range[0] if byte_range else os.path.getsize(input_path)
+    if TOKEN_BUDGET is not None:
+        TOKEN_BUDGET.add(unreported_text, stats['bytes_read'] - unreported_input)
+    stats['bytes_written'] = sum(os.path.getsize(path) for path in unit_outputs(output_path))
+    return output_path, stats
+
+def dry_run_shard(input_path, entries):
+    """Measure the pipeline on the sampled records of a WET file, writing nothing (--dry-run)."""
+    records = iter_indexed_records(input_path, entries, parse_http=False)
+    docs = (Document(url=record.headers.get('WARC-Target-URI', ''), reader=record.reader) for record in records)
+    return profile_documents(get_pipeline(), docs, defaultdict(int))
+
+def sweep_range(input_path, byte_range, sweep_stages):
+    """Features of the records of a WET byte range that only `sweep_stages` could reject (--sweep)."""
+    pipeline = get_pipeline()
+    table = FeatureTable(sweep_stages)
     stats = defaultdict(int)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(exist_ok=True)
+    if groups_by_domain(pipeline):
+        # Batched by domain like process_wet_range, so the boilerplate tables strip the same lines;
+        # records outside the allowlists are read too, so the table counts every record
+        for docs, _ in iter_domain_batches(input_path, byte_range, stats, allowlisted_only=False):
+            pipeline.process_batch(docs, stats, sweep_stages=sweep_stages)
+            for doc in docs:
+                table.add(doc)
+        return table
+    for record in iter_warc_records(input_path, record_types=WarcRecordType.conversion, parse_http=False, byte_range=byte_range):
+        doc = Document(url=record.headers.get('WARC-Target-URI', ''), reader=record.reader)
+        # Rejections by the swept stages do not stop the document
+        pipeline.process(doc, stats, sweep_stages=sweep_stages)
+        table.add(doc)
+    return table
+
+def cleaned_output_path(input_path, output_dir):
     base_name = Path(input_path).stem.replace('.warc.wet', '')
-    temp_output_path = output_dir / f"{base_name}.cleaned.txt"
-    
-    with open(temp_output_path, 'w', encoding='utf-8') as out_file:
-        with open(input_path, 'rb') as stream:
-            for record in ArchiveIterator(stream):
-                if record.record_type == WarcRecordType.conversion:
-                    stats['total_records'] += 1
-                    url = record.headers.get('WARC-Target-URI', '')
-                    text_content = record.reader.read().decode('utf-8', errors='ignore')
-                    
-                    # Extract main domain
-                    extracted = tld_extractor(url)
-                    main_domain = f"{extracted.domain}.{extracted.suffix}"
-
-                    # Check against C4 and Extracted domains
-                    in_c4 = main_domain in C4_DOMAINS
-                    in_extracted = main_domain in EXTRACTED_DOMAINS
-
-                    if not in_c4 and not in_extracted:
-                        stats['not_in_any_domains'] += 1
-                        continue
-                    else:
-                        if not in_c4:
-                            stats['not_in_c4_but_in_extracted'] += 1
-                        elif not in_extracted:
-                            stats['not_in_extracted_but_in_c4'] += 1
-                        else:
-                            stats['in_both_domains'] += 1
-                    
-                    # Language filtering
-                    language_code, score = identify_language(text_content)
-                    if not (language_code == "en" and score > 0.85):
-                        stats['not_english'] += 1
-                        continue
-                    
-                    # Line cleaning based on C4 heuristics
-                    cleaned_lines = []
-                    lines = text_content.split('\n')
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        if not ends_with_punctuation(line):
-                            continue
-                        if count_words(line) < 3:
-                            continue
-                        if is_junk_line(line):
-                            continue
-                        cleaned_lines.append(line)
-                    cleaned_text = '\n'.join(cleaned_lines)
-                    
-                    if count_sentences(cleaned_text) < 5:
-                        stats['too_few_sentences'] += 1
-                        continue
-                    # if contains_bad_word(cleaned_text):
-                    #     stats['bad_content'] += 1
-                    #     continue
-                    
-                    out_file.write(f"{cleaned_text}\n")
-    
-    # Add final counts
-    stats['output_lines'] = count_lines_in_file(temp_output_path)
-    return temp_output_path, stats
-
-# Compress final output to .gz
-def compress_final_output(input_files, output_dir):
-    output_dir = Path(output_dir)
-    output_dir.mkdir(exist_ok=True)
-    final_files = []
-    for input_file in input_files:
-        base_name = Path(input_file).stem
-        output_path = output_dir / f"{base_name}.final.gz"
-        with open(input_file, 'r', encoding='utf-8') as fin, \
-             gzip.open(output_path, 'wt', encoding='utf-8') as fout:
-            for line in fin:
-                fout.write(line)
-        final_files.append(output_path)
-    return final_files
+    return Path(output_dir) / f"{base_name}.cleaned.txt"
 
-# Main execution
-if __name__ == "__main__":
-    # Setup logging file
-    log_path = Path("processing_log.txt")
-    log_file = open(log_path, "w", encoding="utf-8")
-    def log(msg):
-        print(msg)
-        log_file.write(msg + "\n")
-        log_file.flush()
-    
-    # CPU setup
-    num_cpus = len(os.sched_getaffinity(0))
-    executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_cpus)
-    
-    # Input WET files — get ALL .warc.wet.gz files
-    wet_dir = Path("cs336-basics/wet_files")
-    wet_filepaths = sorted(wet_dir.glob("*.warc.wet.gz"))
-    if not wet_filepaths:
-        raise FileNotFoundError(f"No WET files found in {wet_dir}")
-    print(f"✅ Found and selected {len(wet_filepaths)} WET files for processing")
-    
-    # Step 1: Process WET files → Plain .txt
-    temp_cleaned_dir = Path("cs336-basics/temp_cleaned")
-    futures = []
+def process_single_wet_file(input_path: str, output_dir: str):
+    Path(output_dir).mkdir(exist_ok=True)
+    return process_wet_range(input_path, cleaned_output_path(input_path, output_dir))
+
+def plan_work_units(input_path, output_dir):
+    """Split a WET file into (input_path, output_path, byte_range) units; a file that fits in one
+    unit writes its .cleaned.txt directly, otherwise every range writes a part merged later.
+    Record offsets come from the file's index (build_warc_index.py) when it has one."""
+    output_path = cleaned_output_path(input_path, output_dir)
+    ranges = split_indexed_warc_file(input_path, WET_CHUNK_BYTES)
+    if len(ranges) == 1:
+        return [(input_path, output_path, None)]
+    return [
+        (input_path, output_path.with_name(f"{output_path.stem}.part{i:04d}.txt"), byte_range)
+        for i, byte_range in enumerate(ranges)
+    ]
+
+def range_key(unit):
+    input_path, _, (start, end) = unit
+    return f"{Path(input_path).name}:{start}-{end}"
+
+def merge_parts(part_paths, output_path):
+    """Concatenate the part outputs (and URL hash and score files) of one shard in order, then delete them."""
+    with contextlib.ExitStack() as stack:
+        out_files = [stack.enter_context(atomic_write(path, 'wb')) for path in unit_outputs(output_path)]
+        for part_path in part_paths:
+            for part_output, out_file in zip(unit_outputs(part_path), out_files):
+                with open(part_output, 'rb') as f:
+                    shutil.copyfileobj(f, out_file)
+    for part_path in part_paths:
+        for part_output in unit_outputs(part_path):
+            os.remove(part_output)
+
+def submit_bounded(executor, fn, units, max_pending):
+    """Submit `fn(*unit)` for each unit, keeping at most `max_pending` in flight, and yield
+    (unit, future) pairs as they finish. `units` is consumed lazily."""
+    units = iter(units)
+    pending = {}
+    for unit in units:
+        pending[executor.submit(fn, *unit)] = unit
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            unit = pending.pop(future)
+            next_unit = next(units, None)
+            if next_unit is not None:
+                pending[executor.submit(fn, *next_unit)] = next_unit
+            yield unit, future
+
+def queue_worker(queue_dir, wet_dir, output_dir, lease_timeout):
+    """Process WET files claimed from the shared work queue until every file is done or failed."""
+    queue = LeaseQueue(queue_dir, lease_timeout=lease_timeout)
+    processed = 0
+    with queue.keep_alive():
+        for name in queue.iter_claimed(poll_interval=min(30, lease_timeout / 4)):
+            try:
+                temp_file, stats = process_single_wet_file(Path(wet_dir) / name, output_dir)
+            except Exception as exc:
+                queue.fail(name, repr(exc))
+                continue
+            queue.complete(name, {'outputs': [str(path) for path in unit_outputs(temp_file)], 'stats': stats})
+            processed += 1
+    return processed
+
+def top_fraction(value):
+    """argparse type of --quality-top: a fraction in (0, 1]."""
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a fraction in (0, 1]")
+    return fraction
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=len(os.sched_getaffinity(0)),
+                        help="Worker processes on this host")
+    parser.add_argument('--queue-dir',
+                        help="Shared work-queue directory; run the script with the same directory on several "
+                             "hosts (from the same shared checkout) to split the WET files between them")
+    parser.add_argument('--lease-timeout', type=float, default=600,
+                        help="Seconds without a heartbeat after which a worker's WET file is reclaimed")
+    parser.add_argument('--annotations',
+                        help="Also write the scores and rejection reason of every record as Parquet files to this directory")
+    parser.add_argument('--codec', type=Codec.parse, default=Codec('gzip', level=9),
+                        help="Final output codec as name[:level[:threads]], e.g. gzip:6, gzip:6:8 or zstd:3:8; "
+                             "the default gzip:9 is the level the output was always written with (compare others "
+                             "with cs336_data/script/benchmark_codecs.py)")
+    parser.add_argument('--start-method', choices=['fork', 'forkserver', 'spawn'], default='fork',
+                        help="How workers start: forked from this process or from a fork server that has loaded the "
+                             "models and tables once (shared copy-on-write), or spawned and loading everything again")
+    parser.add_argument('--experimental-inference-server', metavar='SOCKET',
+                        help="Experimental: get the fastText predictions from an inference server already running on "
+                             "this Unix socket (python -m cs336_data.inference_server) instead of loading the models; "
+                             "saves memory with --start-method spawn, but predicts more slowly than local models")
+    parser.add_argument('--quality-top', type=top_fraction, metavar='FRACTION',
+                        help="Only keep this fraction of the documents, the best by quality score across all "
+                             "shards; needs the quality_score stage enabled in cs336_data/configs/wet_c4.yaml")
+    parser.add_argument('--shard-bytes', type=int, metavar='BYTES',
+                        help="Write the final output as evenly sized shards of about this many text bytes, "
+                             "regardless of input file boundaries, with a shards.json manifest")
+    parser.add_argument('--shard-docs', type=int, metavar='DOCUMENTS',
+                        help="Like --shard-bytes, with shards of about this many documents (non-empty lines)")
+    parser.add_argument('--dry-run', type=float, metavar='FRACTION',
+                        help="Only run the filters on this fraction of the records, sampled evenly across the WET "
+                             "files, and estimate the yield and run time of the full run; writes no output")
+    parser.add_argument('--dry-run-cores', type=int,
+                        help="Core count to estimate the wall-clock time for (default: --workers)")
+    parser.add_argument('--dry-run-seed', type=int, default=0)
+    parser.add_argument('--token-budget', type=float, metavar='TOKENS',
+                        help="Stop starting new WET files once the text kept so far and expected from the files in "
+                             "progress reaches this many (estimated GPT-2) tokens, e.g. 2e9; files are processed in "
+                             "a random order so the output stays representative")
+    parser.add_argument('--budget-seed', type=int, default=0, help="Seed of the file order of --token-budget")
+    parser.add_argument('--no-line-dedup', action='store_true',
+                        help="Skip the corpus-wide exact line deduplication, e.g. when the boilerplate stage "
+                             "strips each domain's repeated template lines instead")
+    parser.add_argument('--sweep', metavar='GRID',
+                        help="Threshold grid (e.g. cs336_data/configs/sweep_thresholds.yaml) to evaluate in one "
+                             "pass over every record, reporting what each setting keeps, instead of running")
+    args = parser.parse_args()
+    if args.token_budget is not None and args.queue_dir:
+        parser.error("--token-budget needs one host; it cannot be combined with --queue-dir")
+    return args
+
+def run_dry_run(args, wet_filepaths):
+    """Profile the pipeline on a sample of records read through the WET indexes (built here if
+    missing; the full run uses them too) and extrapolate to every record."""
+    log(f"🧪 Dry run: sampling {args.dry_run:.2%} of the records of {len(wet_filepaths)} WET files")
+    build_warc_indexes(wet_filepaths, num_workers=args.workers)
+    population, sample = sample_index_fraction(wet_filepaths, args.dry_run, record_type="conversion",
+                                               seed=args.dry_run_seed)
+    with PreloadedPool(args.workers, start_method=args.start_method, preload=WORKER_PRELOAD) as executor:
+        samples = list(executor.map(dry_run_shard, sample.keys(), sample.values()))
+    estimate = estimate_run(DryRunSample.concatenate(samples), population, args.dry_run_cores or args.workers)
+    for line in format_estimate(estimate):
+        log(line)
+    log("⚠️ URL, line and MinHash deduplication are not simulated, so the kept text and tokens are upper "
+        "bounds; the wall-clock time assumes the work divides evenly between the cores")
+
+def run_sweep(args, wet_filepaths):
+    """Score every record once with the swept stages never stopping it, then evaluate each
+    setting of the grid on the collected features."""
+    grid = load_sweep_grid(args.sweep)
+    log(f"🧪 Threshold sweep of {', '.join(grid)} over {len(wet_filepaths)} WET files")
+    units = [(path, byte_range) for path in wet_filepaths
+             for byte_range in split_indexed_warc_file(path, WET_CHUNK_BYTES)]
+    table = FeatureTable(list(grid))
+    with PreloadedPool(args.workers, start_method=args.start_method, preload=WORKER_PRELOAD) as executor:
+        for unit_table in tqdm(executor.map(sweep_range, *zip(*units), itertools.repeat(list(grid))),
+                               total=len(units), desc="Sweeping"):
+            table.extend(unit_table)
+    for line in format_sweep(sweep(table, PIPELINE_CONFIG, grid), table, PIPELINE_CONFIG):
+        log(line)
+    log("⚠️ URL, line and MinHash deduplication are not applied; tokens are estimated from the kept text")
+
+def process_from_queue(args, queue, wet_dir, wet_filepaths, temp_cleaned_dir, mp_context):
+    """Step 1 in work-queue mode: every host claims WET files from the queue until none are left.
+    Returns the cleaned files and summed stats of every host's WET files, and the failure count."""
+    queue.add(wet_filepath.name for wet_filepath in wet_filepaths)
+    retried = queue.retry_failed()
+    if retried:
+        log(f"♻️ Retrying {len(retried)} WET files that failed in an earlier run")
+    # URLs are only deduplicated between the workers of one host; duplicates across hosts are left
+    # to the line and MinHash deduplication steps
+    seen_urls = SharedBloomFilter(capacity=URL_DEDUP_CAPACITY, error_rate=URL_DEDUP_ERROR_RATE, context=mp_context)
+    temp_cleaned_dir.mkdir(exist_ok=True)
+
+    log(f"📊 STEP 1: Raw Conversion Extraction (work queue {args.queue_dir}, {len(queue.unfinished())} WET files left)")
+    with PreloadedPool(
+        args.workers,
+        start_method=args.start_method,
+        preload=WORKER_PRELOAD,
+        initializer=init_worker,
+        initargs=(seen_urls, args.annotations)
+    ) as executor:
+        workers = [
+            executor.submit(queue_worker, args.queue_dir, wet_dir, temp_cleaned_dir, args.lease_timeout)
+            for _ in range(args.workers)
+        ]
+        processed = sum(future.result() for future in workers)
+        log_worker_pool(executor)
+    log(f"✅ Work queue drained, {processed} WET files processed on this host")
+
+    total_stats = defaultdict(int)
+    temp_files = []
+    results = queue.results()
     for wet_filepath in wet_filepaths:
-        future = executor.submit(
-            process_single_wet_file,
-            wet_filepath,
-            temp_cleaned_dir
-        )
-        futures.append(future)
-    
+        if wet_filepath.name not in results:
+            continue
+        result = results[wet_filepath.name]
+        temp_files.append(Path(result['outputs'][0]))
+        for key in result['stats']:
+            total_stats[key] += result['stats'][key]
+    failures = queue.failures()
+    for name, error in failures.items():
+        log(f"Task generated an exception: {name}: {error}")
+    return temp_files, total_stats, len(failures)
+
+def log_shard_stats(temp_file, stats):
+    log(f"📄 {temp_file.name}:")
+    log(f"  Total conversion records: {stats['total_records']}")
+    log(f"  Not in any domains (C4 & extracted): {stats['not_in_any_domains']}")
+    log(f"  Not in C4 but in extracted: {stats['not_in_c4_but_in_extracted']}")
+    log(f"  Not in extracted but in C4: {stats['not_in_extracted_but_in_c4']}")
+    log(f"  In both domains: {stats['in_both_domains']}")
+    log(f"  Duplicate URL: {stats['duplicate_url']}")
+    log(f"  Not English: {stats['not_english']}")
+    log(f"  C4 lines dropped (empty / no punctuation / < 3 words / junk): "
+        f"{stats['c4_empty_lines']} / {stats['c4_no_punctuation_lines']} / "
+        f"{stats['c4_short_lines']} / {stats['c4_junk_lines']}, kept: {stats['c4_kept_lines']}")
+    if stats.get('boilerplate_pages'):
+        log(f"  Domain boilerplate: stripped {stats.get('boilerplate_lines', 0)} lines "
+            f"({format_bytes(stats.get('boilerplate_bytes', 0))}) from "
+            f"{stats.get('boilerplate_stripped_pages', 0)} of {stats['boilerplate_pages']} pages; "
+            f"{stats.get('boilerplate_known_pages', 0)} pages had a domain table already, "
+            f"{stats.get('boilerplate_evicted_domains', 0)} tables evicted")
+    log(f"  Too few sentences: {stats['too_few_sentences']}")
+    log(f"  Bad content: {stats['bad_content']}")
+    if any(quality_histogram(stats)):
+        log(f"  Low quality: {stats['low_quality']}")
+        log(f"  Quality score histogram ({QUALITY_HISTOGRAM_BINS} bins over [0, 1]): {quality_histogram(stats)}")
+    log(f"  Final output lines: {stats['output_lines']}")
+
+def process_on_this_host(args, manifest, wet_filepaths, temp_cleaned_dir, mp_context):
+    """Step 1 on one host, resuming from the shards and parts journaled in the manifest and, with
+    --token-budget, stopping once the budget is met. Returns the cleaned files, the summed stats
+    and the failure count."""
+    seen_urls = SharedBloomFilter(capacity=URL_DEDUP_CAPACITY, error_rate=URL_DEDUP_ERROR_RATE, context=mp_context)
+    token_budget = None
+    if args.token_budget is not None:
+        token_budget = TokenBudget(int(args.token_budget), context=mp_context)
+
+    def count_towards_budget(stats):
+        token_budget.schedule(stats['bytes_read'])
+        token_budget.add(stats.get('output_text_bytes', 0), stats['bytes_read'])
+
     total_stats = defaultdict(int)
     temp_files = []
+    pending_filepaths = []
+    for wet_filepath in wet_filepaths:
+        entry = manifest.get('process', wet_filepath.name)
+        if entry is None:
+            pending_filepaths.append(wet_filepath)
+            continue
+        temp_file = Path(next(iter(entry['outputs'])))
+        temp_files.append(temp_file)
+        restore_seen_urls(seen_urls, temp_file)
+        for key in entry['stats']:
+            total_stats[key] += entry['stats'][key]
+        if token_budget is not None:
+            count_towards_budget(entry['stats'])
+    log(f"♻️ Resuming with {len(temp_files)} of {len(wet_filepaths)} WET files already processed")
+    if token_budget is not None:
+        # A random order keeps the files processed before the budget is met representative of all
+        random.Random(args.budget_seed).shuffle(pending_filepaths)
+        log(f"🎯 Token budget: {token_budget.tokens:,} tokens, {token_budget.kept_tokens:,.0f} kept so far")
+
+    # Parts of shards an earlier run did not finish; their URLs go back into the filter first
+    finished_parts = manifest.finished('process_range')
+    for entry in finished_parts.values():
+        restore_seen_urls(seen_urls, next(iter(entry['outputs'])))
+
+    temp_cleaned_dir.mkdir(exist_ok=True)
+    executor = PreloadedPool(
+        args.workers,
+        start_method=args.start_method,
+        preload=WORKER_PRELOAD,
+        initializer=init_worker,
+        initargs=(seen_urls, args.annotations, token_budget)
+    )
+    units_left = {}
+    shard_parts = defaultdict(list)
+    shard_stats = defaultdict(lambda: defaultdict(int))
+    failed_shards = set()
+    progress = tqdm(total=len(pending_filepaths))
+
+    def finish_unit(unit, stats):
+        wet_filepath, output_path, byte_range = unit
+        if stats is None:
+            failed_shards.add(wet_filepath)
+        else:
+            shard_parts[wet_filepath].append(output_path)
+            for key in stats:
+                shard_stats[wet_filepath][key] += stats[key]
+        units_left[wet_filepath] -= 1
+        if units_left[wet_filepath] or wet_filepath in failed_shards:
+            return
+
+        # Last unit of the shard: merge its parts and journal it like a single-unit shard
+        temp_file = cleaned_output_path(wet_filepath, temp_cleaned_dir)
+        if byte_range is not None:
+            merge_parts(sorted(shard_parts.pop(wet_filepath)), temp_file)
+        stats = shard_stats.pop(wet_filepath)
+        manifest.record('process', wet_filepath.name, outputs=unit_outputs(temp_file), stats=stats)
+        temp_files.append(temp_file)
+        for key in stats:
+            total_stats[key] += stats[key]
+        progress.update()
+        log_shard_stats(temp_file, stats)
+
+    skipped_shards = []
+
+    def iter_units():
+        # Shards are only split once workers get to them, so work starts right away
+        for wet_filepath in pending_filepaths:
+            # Once the budget is projected to be met no new shard starts; units of shards
+            # already started are still handed out, so every started shard is finished
+            if token_budget is not None and token_budget.met():
+                skipped_shards.append(wet_filepath)
+                continue
+            try:
+                units = plan_work_units(wet_filepath, temp_cleaned_dir)
+            except Exception as exc:
+                log(f"Task generated an exception: {exc}")
+                failed_shards.add(wet_filepath)
+                continue
+            units_left[wet_filepath] = len(units)
+            for unit in units:
+                entry = unit[2] and finished_parts.get(range_key(unit))
+                if entry:
+                    if token_budget is not None:
+                        count_towards_budget(entry['stats'])
+                    finish_unit(unit, entry['stats'])
+                else:
+                    if token_budget is not None:
+                        token_budget.schedule(unit[2][1] - unit[2][0] if unit[2] else os.path.getsize(unit[0]))
+                    yield unit
+
     log("📊 STEP 1: Raw Conversion Extraction")
-    for future in tqdm(concurrent.futures.as_completed(futures), total=len(wet_filepaths)):
+    for unit, future in submit_bounded(executor, process_wet_range, iter_units(), MAX_PENDING_PER_CPU * args.workers):
         try:
-            temp_file, stats = future.result()
-            temp_files.append(temp_file)
-            for key in stats:
-                total_stats[key] += stats[key]
-            log(f"📄 {temp_file.name}:")
-            log(f"  Total conversion records: {stats['total_records']}")
-            log(f"  Not in any domains (C4 & extracted): {stats['not_in_any_domains']}")
-            log(f"  Not in C4 but in extracted: {stats['not_in_c4_but_in_extracted']}")
-            log(f"  Not in extracted but in C4: {stats['not_in_extracted_but_in_c4']}")
-            log(f"  In both domains: {stats['in_both_domains']}")
-            log(f"  Not English: {stats['not_english']}")
-            log(f"  Too few sentences: {stats['too_few_sentences']}")
-            log(f"  Bad content: {stats['bad_content']}")
-            log(f"  Final output lines: {stats['output_lines']}")
+            output_path, stats = future.result()
         except Exception as exc:
             log(f"Task generated an exception: {exc}")
-    
+            stats = None
+        else:
+            # Parts of split shards are journaled too, so a resumed run only redoes missing ranges
+            if unit[2] is not None:
+                manifest.record('process_range', range_key(unit), outputs=unit_outputs(output_path), stats=stats)
+        finish_unit(unit, stats)
+    progress.close()
+    log_worker_pool(executor)
+    executor.shutdown()
+    if token_budget is not None:
+        log(f"🎯 Kept about {token_budget.kept_tokens:,.0f} of the {token_budget.tokens:,} token budget "
+            f"before deduplication; {len(skipped_shards)} WET files not started")
+    return temp_files, total_stats, len(failed_shards)
+
+def log_step1_summary(total_stats):
     log("\n📊 總結（第一階段）：")
     log(f"總共處理的 conversion 數量: {total_stats['total_records']}")
     log(f"不屬於任何 domain (C4 & extracted) 的 conversion 數量: {total_stats['not_in_any_domains']}")
     log(f"屬於 extracted domain 但不屬於 C4 的 conversion 數量: {total_stats['not_in_c4_but_in_extracted']}")
     log(f"屬於 C4 domain 但不屬於 extracted 的 conversion 數量: {total_stats['not_in_extracted_but_in_c4']}")
     log(f"同時屬於兩者的 conversion 數量: {total_stats['in_both_domains']}")
+    log(f"因 URL 重複被跳過的 conversion 數量: {total_stats['duplicate_url']}")
     log(f"屬於 C4 或 extracted 但非英文的 conversion 數量: {total_stats['not_english']}")
+    log(f"C4 規則移除的行數: 空行 {total_stats['c4_empty_lines']}, 無結尾標點 {total_stats['c4_no_punctuation_lines']}, "
+        f"少於 3 個字 {total_stats['c4_short_lines']}, 垃圾內容 {total_stats['c4_junk_lines']}（保留 {total_stats['c4_kept_lines']}）")
     log(f"因句子太少被過濾的 conversion 數量: {total_stats['too_few_sentences']}")
     log(f"因包含不良字詞被過濾的 conversion 數量: {total_stats['bad_content']}")
+    if any(quality_histogram(total_stats)):
+        log(f"因品質分數過低被過濾的 conversion 數量: {total_stats['low_quality']}")
+        log(f"品質分數分布（{QUALITY_HISTOGRAM_BINS} 個區間）: {quality_histogram(total_stats)}")
 
-    # Step 2: Exact line deduplication
-    line_deduplicated_dir = Path("cs336-basics/line_deduplicated")
-    exact_line_deduplication(temp_files, line_deduplicated_dir)
-    log("\n📊 STEP 2: Line Deduplication Summary")
-    line_deduplicated_files = list(line_deduplicated_dir.glob("*.cleaned.txt"))
-    total_before = sum(count_lines_in_file(f) for f in temp_files)
-    total_after = sum(count_lines_in_file(f) for f in line_deduplicated_files)
-    log(f"Lines before line deduplication: {total_before}")
-    log(f"Lines after line deduplication: {total_after}")
-    log(f"Removed by line deduplication: {total_before - total_after} lines")
-    
-    # Delete first-stage files
-    for f in temp_files:
-        os.remove(f)
-    log("✅ Deleted temporary cleaned files")
+def quality_line_reader(quality_top, temp_files):
+    """Reader of the cleaned lines that keeps the top quality_top fraction of every kept document,
+    by the exact cutoff over the scores buffered in step 1."""
+    doc_scores = [np.fromfile(quality_scores_path(f), dtype=DOC_SCORE_DTYPE)['score'] for f in temp_files]
+    all_scores = np.concatenate(doc_scores) if doc_scores else np.zeros(0, dtype=np.float32)
+    quality_cutoff = exact_cutoff_for_top(all_scores, quality_top)
+    sketch = sum((ScoreSketch.from_scores(scores) for scores in doc_scores), ScoreSketch())
+    sketch_cutoff = sketch.cutoff_for_top(quality_top)
+    log(f"\n📊 Quality cutoff for the top {quality_top:.1%}: {quality_cutoff:.4f} "
+        f"(merged shard sketches: {sketch_cutoff:.3f}), keeping "
+        f"{int((all_scores >= quality_cutoff).sum())} of {len(all_scores)} documents")
 
-    # Step 3: Minhash deduplication
-    final_output_dir = Path("cs336-basics/final_output")
-    minhash_deduplication(
-        input_files=[str(f) for f in line_deduplicated_files],
+    def read_lines(path):
+        return read_quality_lines(path, quality_cutoff)
+    return read_lines
+
+def write_final_output(args, final_output_dir, kept_files, read_kept_lines, total_text_bytes, total_docs, dedup_stats):
+    """Step 4: write the kept lines of the kept files, compressed; one output per input file, or
+    with --shard-bytes/--shard-docs shards of even size, the targets spread over the known totals.
+    Returns the written files."""
+    final_output_dir.mkdir(exist_ok=True)
+    # Outputs of an earlier run, possibly in the other mode: a stale manifest or stale shards
+    # would be read along with this run's outputs
+    stale = clear_final_outputs(final_output_dir)
+    if stale:
+        log(f"🧹 Removed {len(stale)} outputs of an earlier run from {final_output_dir}")
+    compressed_files = []
+    if args.shard_bytes or args.shard_docs:
+        writer = ShardWriter(
+            final_output_dir,
+            codec=args.codec,
+            target_bytes=balanced_target(total_text_bytes, args.shard_bytes) if args.shard_bytes else None,
+            target_documents=balanced_target(total_docs, args.shard_docs) if args.shard_docs else None,
+        )
+        with writer:
+            for path in kept_files:
+                writer.writelines(read_kept_lines(path))
+                dedup_stats['bytes_read'] += os.path.getsize(path)
+        shards = writer.shards
+        compressed_files = [final_output_dir / shard.path for shard in shards] + [writer.manifest_path]
+        dedup_stats['bytes_written'] += sum(shard.compressed_bytes for shard in shards)
+        log(f"\n📦 Resharded {len(kept_files)} files into {len(shards)} shards (manifest: {writer.manifest_path})")
+        if shards:
+            shard_docs = [shard.documents for shard in shards]
+            shard_bytes = [shard.bytes for shard in shards]
+            log(f"Documents per shard min/max: {min(shard_docs)}/{max(shard_docs)}, "
+                f"text per shard min/max: {format_bytes(min(shard_bytes))}/{format_bytes(max(shard_bytes))}")
+    else:
+        for path in kept_files:
+            output_path = final_output_dir / f"{path.stem}.final{args.codec.suffix or '.txt'}"
+            with atomic_write(output_path, 'wt', opener=args.codec.open) as fout:
+                fout.writelines(read_kept_lines(path))
+            dedup_stats['bytes_read'] += os.path.getsize(path)
+            dedup_stats['bytes_written'] += os.path.getsize(output_path)
+            compressed_files.append(output_path)
+    return compressed_files
+
+def deduplicate_and_write(args, manifest, temp_files, total_stats, final_output_dir):
+    """Steps 2-4: line and MinHash deduplication only decide which lines and files to keep; the
+    cleaned files are read once per decision and the only thing written is the compressed output."""
+    # Sorted, so MinHash keeps the same file of each near-duplicate cluster on every run
+    temp_files = sorted(temp_files)
+    cleaned_bytes = sum(os.path.getsize(f) for f in temp_files)
+    dedup_stats = defaultdict(int)
+
+    # Quality cutoff: documents below it are skipped by every later step
+    read_lines = read_cleaned_lines
+    if args.quality_top is not None:
+        read_lines = quality_line_reader(args.quality_top, temp_files)
+
+    # Step 2: Exact line deduplication → hashes of lines to drop
+    if args.no_line_dedup:
+        duplicate_lines = set()
+    else:
+        duplicate_lines = find_duplicate_lines(temp_files, dedup_stats, read_lines=read_lines)
+        dedup_stats['bytes_read'] += cleaned_bytes
+
+    def read_kept_lines(path):
+        return iter_unique_lines(path, duplicate_lines, read_lines=read_lines)
+
+    # Step 3: Minhash deduplication → indices of files to keep
+    lines_after_line_dedup = {}
+    text_bytes_after_line_dedup = {}
+    def load_deduplicated_text(i):
+        lines = list(read_kept_lines(temp_files[i]))
+        dedup_stats['bytes_read'] += os.path.getsize(temp_files[i])
+        lines_after_line_dedup.setdefault(i, sum(1 for line in lines if line.strip()))
+        text = ''.join(lines)
+        text_bytes_after_line_dedup.setdefault(i, len(text.encode('utf-8')))
+        return text
+
+    keep_ids = minhash_keep_ids(
+        load_deduplicated_text,
+        num_docs=len(temp_files),
         num_hashes=128,
         num_bands=4,
         ngrams=5,
         jaccard_threshold=0.8,
-        output_directory=final_output_dir
     )
+    total_after_line = sum(lines_after_line_dedup.values())
+    if args.no_line_dedup:
+        dedup_stats['lines'] = total_after_line
+    total_after_minhash = sum(lines_after_line_dedup[i] for i in keep_ids)
+
+    log("\n📊 STEP 2: Line Deduplication Summary")
+    log(f"Lines before line deduplication: {dedup_stats['lines']}")
+    log(f"Lines after line deduplication: {total_after_line}")
+    log(f"Removed by line deduplication: {dedup_stats['lines'] - total_after_line} lines")
     log("\n📊 STEP 3: MinHash Deduplication Summary")
-    final_files = list(final_output_dir.glob("*.txt"))
-    total_after_line = sum(count_lines_in_file(f) for f in line_deduplicated_files)
-    total_after_minhash = sum(count_lines_in_file(f) for f in final_files)
     log(f"Lines before minhash deduplication: {total_after_line}")
     log(f"Lines after minhash deduplication: {total_after_minhash}")
     log(f"Removed by minhash deduplication: {total_after_line - total_after_minhash} lines")
 
-    # Delete second-stage files
-    for f in line_deduplicated_files:
-        os.remove(f)
-    log("✅ Deleted line-deduplicated files")
+    compressed_files = write_final_output(
+        args, final_output_dir, [temp_files[i] for i in sorted(keep_ids)], read_kept_lines,
+        total_text_bytes=sum(text_bytes_after_line_dedup[i] for i in keep_ids),
+        total_docs=total_after_minhash, dedup_stats=dedup_stats,
+    )
+    manifest.record('compress', 'all', outputs=compressed_files, stats={
+        'lines_before': dedup_stats['lines'],
+        'lines_after_line_dedup': total_after_line,
+        'lines_after_minhash': total_after_minhash,
+        'bytes_read': dedup_stats['bytes_read'],
+        'bytes_written': dedup_stats['bytes_written'],
+    })
+
+    # Delete first-stage files
+    for f in temp_files:
+        for path in unit_outputs(f):
+            os.remove(path)
+    log("✅ Final output compressed and temporary cleaned files deleted")
+
+    log("\n📊 I/O Summary")
+    log(f"STEP 1: read {format_bytes(total_stats['bytes_read'])} of WET files, wrote {format_bytes(total_stats['bytes_written'])}")
+    if total_stats.get('boilerplate_pages'):
+        pages = total_stats['boilerplate_pages']
+        log(f"Domain boilerplate: {total_stats.get('boilerplate_known_pages', 0) / pages:.1%} of {pages} pages had "
+            f"a domain table already, {total_stats.get('boilerplate_stripped_pages', 0) / pages:.1%} lost lines, "
+            f"{total_stats.get('boilerplate_evicted_domains', 0)} tables evicted")
+    log(f"STEPS 2-4: read {format_bytes(dedup_stats['bytes_read'])} "
+        f"({dedup_stats['bytes_read'] / max(cleaned_bytes, 1):.1f} passes over {format_bytes(cleaned_bytes)} of cleaned text), "
+        f"wrote {format_bytes(dedup_stats['bytes_written'])}")
 
-    # Step 4: Compress final deduplicated files
-    compress_final_output(final_files, final_output_dir)
+def run(args):
+    if args.experimental_inference_server:
+        # Inherited by the workers, so no process loads the models itself
+        os.environ[INFERENCE_SOCKET_ENV] = args.experimental_inference_server
+    # Loaded before any pool starts, so every forked worker shares the tables and models
+    pipeline = get_pipeline()
+    if args.quality_top is not None and 'quality_score' not in {stage.name for stage in pipeline.stages}:
+        log("❌ --quality-top needs the quality_score stage; enable it in cs336_data/configs/wet_c4.yaml")
+        return 1
+    mp_context = multiprocessing.get_context(args.start_method)
 
-    # Delete uncompressed final files
-    for f in final_files:
-        os.remove(f)
-    log("✅ Final output compressed and old files deleted")
+    # Finished shards and steps are journaled here; rerunning the script resumes from it
+    manifest = RunManifest("cs336-basics/run_manifest.jsonl")
+
+    # Input WET files — get ALL .warc.wet.gz files
+    wet_dir = Path("cs336-basics/wet_files")
+    wet_filepaths = sorted(wet_dir.glob("*.warc.wet.gz"))
+    if not wet_filepaths:
+        raise FileNotFoundError(f"No WET files found in {wet_dir}")
+    print(f"✅ Found and selected {len(wet_filepaths)} WET files for processing")
+
+    if args.dry_run is not None:
+        run_dry_run(args, wet_filepaths)
+        return 0
+    if args.sweep is not None:
+        run_sweep(args, wet_filepaths)
+        return 0
+
+    # The last step deletes the cleaned files, so a finished run has nothing left to resume
+    compressed_entry = manifest.get('compress', 'all')
+
+    # Step 1: Process WET files → Plain .txt
+    if groups_by_domain(pipeline) and not compressed_entry:
+        # Units of the boilerplate stage read their records by domain through the indexes
+        build_warc_indexes(wet_filepaths, num_workers=args.workers)
+    temp_cleaned_dir = Path("cs336-basics/temp_cleaned")
+    if args.annotations:
+        Path(args.annotations).mkdir(parents=True, exist_ok=True)
+    queue = LeaseQueue(args.queue_dir, lease_timeout=args.lease_timeout) if args.queue_dir else None
+    if compressed_entry:
+        log("♻️ STEP 1: skipped, already finished in an earlier run")
+    else:
+        if queue is not None:
+            temp_files, total_stats, failed = process_from_queue(
+                args, queue, wet_dir, wet_filepaths, temp_cleaned_dir, mp_context)
+        else:
+            temp_files, total_stats, failed = process_on_this_host(
+                args, manifest, wet_filepaths, temp_cleaned_dir, mp_context)
+        log_step1_summary(total_stats)
+        # Deduplication needs every shard; stop here and let a rerun retry only the failed ones
+        if failed:
+            log(f"❌ {failed} WET files failed, rerun the script to retry them")
+            return 1
+
+    final_output_dir = Path("cs336-basics/final_output")
+    if compressed_entry:
+        log("♻️ STEPS 2-4: skipped, already finished in an earlier run")
+    elif queue is None:
+        deduplicate_and_write(args, manifest, temp_files, total_stats, final_output_dir)
+    else:
+        def finalize():
+            # Taken over from a host that died after journaling the output: only its cleanup is left
+            if RunManifest(manifest.path).get('compress', 'all'):
+                log("♻️ STEPS 2-4: already finished by the host that held the lease")
+                return
+            deduplicate_and_write(args, manifest, temp_files, total_stats, final_output_dir)
+
+        finalize_queue = LeaseQueue(Path(args.queue_dir) / FINALIZE_QUEUE, lease_timeout=args.lease_timeout)
+        finalize_queue.retry_failed()
+        if not finalize_queue.run_once(FINALIZE_TASK, finalize, poll_interval=min(30, args.lease_timeout / 4)):
+            log("✅ Another host merged the results and ran the deduplication steps")
+            return 0
 
     log("\n✅ 所有處理完成！")
     log(f"最終結果已寫入：{final_output_dir}")
-    log_file.close()
\ No newline at end of file
+    return 0
+
+def main():
+    global LOG_FILE
+    args = parse_args()
+    # Setup logging file (appended to, so a resumed run keeps the log of the earlier attempt)
+    LOG_FILE = open("processing_log.txt", "a", encoding="utf-8")
+    try:
+        return run(args)
+    finally:
+        LOG_FILE.close()
+
+if __name__ == "__mp_main__":
+    # Fork-server and spawned workers import this script under this name (WORKER_PRELOAD); the fork
+    # server loads the tables and models here once for every worker it forks
+    get_pipeline()
+
+# Main execution
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,16 +1,22 @@
 import os
-import gzip
+import random
 import numpy as np
 from tqdm import tqdm
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
 from transformers import GPT2TokenizerFast
+from cs336_data.codecs import open_input
+from cs336_data.resharding import load_shard_manifest
 
 # Configuration
-input_dir = "cs336-basics/final_output"     # Folder containing .final.gz files
+input_dir = "cs336-basics/final_output"     # Folder containing .final.gz / .final.zst files
 output_dir = "cs336-basics/tokenized_output/splits"  # Output directory for .bin files
 output_prefix = "gpt2_data"
 chunksize = 100
+# Stop after the file that brings the total to this many tokens (None tokenizes everything); files
+# are then tokenized in a random order so the ones used stay representative of all of them
+token_budget = None
+budget_seed = 0
 
 # Create output directory
 Path(output_dir).mkdir(exist_ok=True)
@@ -30,8 +36,8 @@ def tokenize_line_and_add_eos(line):
     return encoded + [tokenizer.eos_token_id]
 
 def read_gz_file(file_path):
-    """Read lines from a .gz file"""
-    with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+    """Read lines from a (compressed) final output file"""
+    with open_input(file_path, 'rt', encoding='utf-8') as f:
         return [line for line in f if line.strip()]
 
 def process_file(file_path):
@@ -44,17 +50,32 @@ def process_file(file_path):
 
 if __name__ == "__main__":
     print("🔍 Reading input files...")
-    input_files = list(Path(input_dir).glob("*.final.gz"))
+    # Shards written with --shard-bytes/--shard-docs are evenly sized, so every group of
+    # split_size shards holds about the same number of documents
+    shards = load_shard_manifest(input_dir)
+    if shards is not None:
+        input_files = [Path(input_dir) / shard.path for shard in shards]
+        shard_documents = {file: shard.documents for file, shard in zip(input_files, shards)}
+        print(f"📦 Shard manifest: {len(shards)} shards, {sum(shard_documents.values()):,} documents")
+    else:
+        input_files = list(Path(input_dir).glob("*.final.*"))
+        shard_documents = None
     if not input_files:
-        raise FileNotFoundError(f"No .final.gz files found in {input_dir}")
+        raise FileNotFoundError(f"No .final.* files found in {input_dir}")
+    if token_budget is not None:
+        random.Random(budget_seed).shuffle(input_files)
+        print(f"🎯 Token budget: {token_budget:,} tokens")
 
     print(f"🧠 Loading and tokenizing {len(input_files)} files...")
 
     split_size = 50
+    total_tokens = 0
 
     for i, start_idx in enumerate(range(0, len(input_files), split_size)):
         group = input_files[start_idx : start_idx + split_size]
         print(f"ParallelGroup {i} → Files: {len(group)}")
+        if shard_documents is not None:
+            print(f"📄 Documents: {sum(shard_documents[file] for file in group):,}")
 
         all_ids = []
 
@@ -66,6 +87,9 @@ if __name__ == "__main__":
             except Exception as e:
                 print(f"\n⚠️ Error processing file {file}: {e}")
                 continue
+            total_tokens += len(ids)
+            if token_budget is not None and total_tokens >= token_budget:
+                break
 
         print(f"🔢 Total tokens: {len(all_ids):,}")
 
@@ -77,4 +101,8 @@ if __name__ == "__main__":
 
         ids_array.tofile(train_output)
 
-        print(f"\n💾 Saved {len(ids_array):,} training tokens to {train_output}")
\ No newline at end of file
+        print(f"\n💾 Saved {len(ids_array):,} training tokens to {train_output}")
+
+        if token_budget is not None and total_tokens >= token_budget:
+            print(f"🎯 Token budget reached: {total_tokens:,} tokens")
+            break
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cs336_data.manifest import atomic_write
+from cs336_data.pipeline import Document
+
+# One row per document, kept or rejected; scores of stages that did not run on a document are null
+ANNOTATION_SCHEMA = pa.schema([
+    ('url', pa.string()),
+    ('domain', pa.string()),
+    ('kept', pa.bool_()),
+    ('rejected_by', pa.string()),
+    ('language', pa.string()),
+    ('language_score', pa.float32()),
+    ('nsfw_label', pa.string()),
+    ('nsfw_score', pa.float32()),
+    ('toxic_label', pa.string()),
+    ('toxic_score', pa.float32()),
+    ('quality_label', pa.string()),
+    ('quality_score', pa.float32()),
+    ('gopher_pass', pa.bool_()),
+    ('num_sentences', pa.int32()),
+    ('bad_word_matches', pa.int32()),
+    ('eval_overlaps', pa.int32()),
+    ('emails', pa.int32()),
+    ('phones', pa.int32()),
+    ('ips', pa.int32()),
+    ('text', pa.string()),
+])
+
+
+class AnnotationWriter:
+    """Write the annotations `Pipeline` stages leave in `doc.meta` to a Parquet file, one row group
+    per `row_group_size` documents.
+
+    The file only appears under `path` once the writer is closed. Texts of rejected documents are
+    kept too unless `rejected_text=False`, so a re-filter can produce output without re-extraction.
+    """
+
+    def __init__(self, path: str | os.PathLike, row_group_size: int = 10_000, rejected_text: bool = True):
+        self.row_group_size = row_group_size
+        self.rejected_text = rejected_text
+        self.columns = {name: [] for name in ANNOTATION_SCHEMA.names}
+        self.num_rows = 0
+        self._file_cm = atomic_write(path, 'wb')
+        self._writer = pq.ParquetWriter(self._file_cm.__enter__(), ANNOTATION_SCHEMA, compression='zstd')
+
+    def add(self, doc: Document, kept: bool) -> None:
+        row = {
+            **doc.meta,
+            'url': doc.url,
+            'kept': kept,
+            'text': doc.text if kept or self.rejected_text else None,
+        }
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        self.num_rows += 1
+        if len(self.columns['url']) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.columns['url']:
+            self._writer.write_table(pa.Table.from_pydict(self.columns, schema=ANNOTATION_SCHEMA))
+            self.columns = {name: [] for name in ANNOTATION_SCHEMA.names}
+
+    def close(self, discard: bool = False) -> None:
+        if not discard:
+            self.flush()
+        self._writer.close()
+        if discard:
+            self._file_cm.__exit__(RuntimeError, RuntimeError("discarded"), None)
+        else:
+            self._file_cm.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+
+def load_annotations(path: str | os.PathLike, filter=None, columns: list[str] | None = None) -> pa.Table:
+    """Read one annotation file or a directory of them, e.g. to re-filter with new thresholds:
+
+        import pyarrow.compute as pc
+        table = load_annotations("cs336-basics/annotations", columns=['url', 'text'],
+                                 filter=(pc.field('language') == 'en') & (pc.field('language_score') > 0.9))
+        df = table.to_pandas()
+    """
+    return ds.dataset(path, format='parquet').to_table(filter=filter, columns=columns)
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+
+import mmh3
+import numpy as np
+
+# Counters saturate instead of wrapping
+MAX_COUNT = np.iinfo(np.uint16).max
+
+
+def hash_lines(lines: list[str]) -> np.ndarray:
+    """128-bit hashes of `lines`, as an (n, 2) array of the 64-bit halves."""
+    return np.array([mmh3.hash64(line, signed=False) for line in lines], dtype=np.uint64).reshape(-1, 2)
+
+
+class CountMinSketch:
+    """Count-min sketch of `depth` rows of `width` 16-bit counters. Estimates never undercount;
+    conservative updates (only raising the counters that hold the current minimum) keep the
+    overcount from colliding keys well below the usual e / width of the total."""
+
+    def __init__(self, width: int = 1024, depth: int = 4):
+        self.width = width
+        self.counts = np.zeros((depth, width), dtype=np.uint16)
+        self._rows = np.arange(depth, dtype=np.uint64)
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        # Kirsch-Mitzenmacher double hashing: one column per row from each 128-bit hash
+        return ((hashes[:, :1] + self._rows * hashes[:, 1:]) % np.uint64(self.width)).astype(np.intp)
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        columns = self._columns(hashes)
+        return self.counts[np.arange(len(self.counts)), columns].min(axis=1)
+
+    def add(self, hashes: np.ndarray) -> None:
+        """Count each of `hashes` once."""
+        columns = self._columns(hashes)
+        raised = np.minimum(self.estimate(hashes).astype(np.uint32) + 1, MAX_COUNT).astype(np.uint16)
+        for row, counts in enumerate(self.counts):
+            np.maximum.at(counts, columns[:, row], raised)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.counts.nbytes
+
+
+class BoilerplateStripper:
+    """Strips a domain's template lines (navigation, footers, cookie notices): lines that occur on
+    at least `min_pages` pages of the same registered domain, and at least `min_fraction` of the
+    pages seen from it.
+
+    Every domain gets a count-min table of how many pages each (stripped, non-empty) line was on;
+    only the `max_domains` most recently used tables are kept, so memory stays at
+    `max_domains * depth * width * 2` bytes (64 MB by default) however many domains go by. Tables
+    live as long as the stripper, so a domain's counts build up over every group of its pages it
+    is given; a worker sees thousands of domains per WET file, so many small tables carry over far
+    more than a few large ones, and `min_fraction` keeps the overcount of large domains in narrow
+    tables from reaching the threshold.
+    """
+
+    def __init__(self, min_pages: int = 3, min_fraction: float = 0.05, max_domains: int = 8192,
+                 width: int = 1024, depth: int = 4):
+        self.min_pages = min_pages
+        self.min_fraction = min_fraction
+        self.max_domains = max_domains
+        self.width = width
+        self.depth = depth
+        # Domain -> [sketch, pages counted], least recently used first
+        self.tables = OrderedDict()
+
+    def _table(self, domain: str, stats: dict | None) -> list:
+        table = self.tables.get(domain)
+        if table is None:
+            if len(self.tables) >= self.max_domains:
+                self.tables.popitem(last=False)
+                if stats is not None:
+                    stats['boilerplate_evicted_domains'] += 1
+            table = self.tables[domain] = [CountMinSketch(self.width, self.depth), 0]
+        self.tables.move_to_end(domain)
+        return table
+
+    def strip(self, domain: str, texts: list[str], stats: dict | None = None) -> list[str]:
+        """Count every page of `texts` (pages of `domain`) first, then strip the lines that count
+        as boilerplate, so a group of pages is stripped against all of its own lines too.
+
+        Counts in `stats`: `boilerplate_pages` given, `boilerplate_known_pages` of them whose
+        domain already had a table (how much counts carry over between groups),
+        `boilerplate_stripped_pages` that lost a line, and the stripped `boilerplate_lines` and
+        their `boilerplate_bytes`."""
+        if stats is not None:
+            stats['boilerplate_pages'] += len(texts)
+            if domain in self.tables:
+                stats['boilerplate_known_pages'] += len(texts)
+        table = self._table(domain, stats)
+        sketch = table[0]
+        pages = []
+        for text in texts:
+            lines = text.split('\n')
+            keys = sorted({line.strip() for line in lines} - {''})
+            hashes = hash_lines(keys)
+            if keys:
+                sketch.add(hashes)
+            table[1] += 1
+            pages.append((lines, dict(zip(keys, range(len(keys)))), hashes))
+
+        threshold = max(self.min_pages, self.min_fraction * table[1])
+        stripped_texts = []
+        for lines, positions, hashes in pages:
+            if not positions:
+                stripped_texts.append('\n'.join(lines))
+                continue
+            boilerplate = sketch.estimate(hashes) >= threshold
+            kept = [line for line in lines if not (line.strip() and boilerplate[positions[line.strip()]])]
+            if stats is not None and len(kept) < len(lines):
+                stats['boilerplate_stripped_pages'] += 1
+                stats['boilerplate_lines'] += len(lines) - len(kept)
+                stats['boilerplate_bytes'] += sum(len(line.encode('utf-8')) + 1 for line in lines) - \
+                    sum(len(line.encode('utf-8')) + 1 for line in kept)
+            stripped_texts.append('\n'.join(kept))
+        return stripped_texts
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(sketch.size_bytes for sketch, _ in self.tables.values())
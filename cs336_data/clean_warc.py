@@ -0,0 +1,137 @@
+import os
+import argparse
+import contextlib
+from collections import defaultdict
+from tqdm import tqdm
+from fastwarc.warc import WarcRecordType
+
+from cs336_data.warc_reader import iter_warc_records
+from cs336_data.warc_index import build_warc_indexes, iter_indexed_records, sample_index_fraction
+from cs336_data.dry_run import estimate_run, format_estimate, profile_documents
+from cs336_data.pipeline import Document, build_pipeline, cascade_report, load_pipeline_config, run_parallel
+from cs336_data.threshold_sweep import FeatureTable, format_sweep, load_sweep_grid, sweep
+
+# Cleans the responses of a WARC file into fastText training examples for the quality classifier:
+#   python -m cs336_data.clean_warc --warc FILE --label LABEL --output FILE --config CONFIG
+# cs336_data/script/clean_warc_cc.py and clean_warc_wiki.py run it with the settings of the negative
+# and positive examples.
+#
+# The pipeline pulls one record at a time through every stage, so only a single document
+# (or, in parallel mode, a bounded number of chunks) is in memory no matter how large the WARC is.
+
+# gather response
+def extract_response(warc_file_path, stats, test_count=None):
+    iterator = iter_warc_records(warc_file_path, record_types=WarcRecordType.response, parse_http=True)
+    for record in tqdm(iterator, desc="Processing WARC Records"):
+        stats['responses'] += 1
+        yield Document(url=record.headers.get('WARC-Target-URI', ''), raw=record.reader.read())
+        if test_count is not None and stats['responses'] > test_count:
+            break
+
+def save_to_fasttext_format(docs, output_path, label, stats):
+    with open(output_path, "w", encoding="utf-8") as f:
+        for doc in docs:
+            cleaned_text = doc.text.replace("\n", " ").strip()
+            if cleaned_text:
+                f.write(f"__label__{label} {cleaned_text}\n")
+                stats['saved'] += 1
+
+def print_stats(pipeline, stats, output_path):
+    print(f"Finished getting {stats['responses']} responses")
+    print(f"Stage order: {' -> '.join(stage.name for stage in pipeline.stages)}")
+    for stage in pipeline.stages:
+        if not stage.transform:
+            print(f"  {stage.name}: removed {stats[stage.stat]}")
+    if pipeline.adaptive:
+        print("Filter cascade (measured over all workers):")
+        print("\n".join(cascade_report(pipeline, stats)))
+    print(f"Number of masked emails: {stats['emails']}, phones: {stats['phones']}, ips: {stats['ips']}")
+    print(f"Saved {stats['saved']} of {stats['documents']} texts to {output_path}")
+
+def dry_run(args, config, stats):
+    build_warc_indexes([args.warc], num_workers=1)
+    population, sample = sample_index_fraction([args.warc], args.dry_run, record_type="response", seed=args.dry_run_seed)
+    records = (record for path, entries in sample.items() for record in iter_indexed_records(path, entries, parse_http=True))
+    docs = (Document(url=record.headers.get('WARC-Target-URI', ''), raw=record.reader.read()) for record in records)
+    estimate = estimate_run(profile_documents(build_pipeline(config), docs, stats), population, args.workers)
+    print("\n".join(format_estimate(estimate)))
+
+def threshold_sweep(args, config, stats):
+    grid = load_sweep_grid(args.sweep)
+    table = FeatureTable(list(grid))
+    # Rejections by the swept stages do not stop a document, so the table gets all their scores
+    sweep_config = dict(config, sweep_stages=list(grid))
+    responses = extract_response(args.warc, stats, args.test_count)
+    if args.workers > 1:
+        docs = run_parallel(sweep_config, responses, stats, num_workers=args.workers, chunk_size=args.chunk_size,
+                            annotate=table.add, preload=args.preload)
+    else:
+        docs = build_pipeline(sweep_config).run(responses, stats, annotate=table.add)
+    for _ in docs:
+        pass
+    print("\n".join(format_sweep(sweep(table, config, grid), table, config)))
+
+def clean(args, config, stats):
+    responses = extract_response(args.warc, stats, args.test_count)
+    with contextlib.ExitStack() as stack:
+        annotate = None
+        if args.annotations is not None:
+            from cs336_data.annotations import AnnotationWriter
+            annotate = stack.enter_context(AnnotationWriter(args.annotations)).add
+
+        if args.workers > 1:
+            # The pipeline here only describes stage order and counters
+            pipeline = build_pipeline(config, instantiate=False)
+            docs = run_parallel(config, responses, stats, num_workers=args.workers, chunk_size=args.chunk_size,
+                                annotate=annotate, preload=args.preload)
+        else:
+            pipeline = build_pipeline(config)
+            docs = pipeline.run(responses, stats, annotate=annotate)
+
+        # Nothing runs until the writer starts pulling documents through the chain
+        save_to_fasttext_format(docs, args.output, args.label, stats)
+    print_stats(pipeline, stats, args.output)
+
+def parse_args(argv=None, **defaults):
+    """Command-line settings; `defaults` (warc, label, output, config) are those of an entry point."""
+    parser = argparse.ArgumentParser(description="Clean the responses of a WARC file into fastText training examples")
+    for name, description in [
+        ('warc', "WARC file to read the responses from"),
+        ('label', "fastText label of the examples, e.g. cc or wiki"),
+        ('output', "fastText training file to write"),
+        ('config', "Pipeline config, e.g. cs336_data/configs/clean_warc_cc.yaml"),
+    ]:
+        parser.add_argument(f'--{name}', default=defaults.get(name), required=name not in defaults,
+                            help=description)
+    parser.add_argument('--test-count', type=int, help="Only read about this many responses")
+    parser.add_argument('--annotations',
+                        help="Parquet file with the scores, URL and rejection reason of every document, kept or "
+                             "not; set `annotate_all: true` in the config to score rejected documents with every stage")
+    parser.add_argument('--workers', type=int, default=len(os.sched_getaffinity(0)),
+                        help="1 runs every stage in this process; more spreads chunks of records over worker processes")
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help="Load the models in every worker instead of once here, before forking the workers")
+    parser.add_argument('--dry-run', type=float, metavar='FRACTION',
+                        help="Only run the filters on this fraction of the responses and estimate the yield and run "
+                             "time of the full run at --workers cores, without writing anything")
+    parser.add_argument('--dry-run-seed', type=int, default=0)
+    parser.add_argument('--sweep', metavar='GRID',
+                        help="Grid of stage thresholds (e.g. cs336_data/configs/sweep_thresholds.yaml) to evaluate in "
+                             "a single pass instead of writing the output: reports the documents, bytes and tokens "
+                             "each setting keeps")
+    return parser.parse_args(argv)
+
+def main(argv=None, **defaults):
+    args = parse_args(argv, **defaults)
+    stats = defaultdict(int)
+    config = load_pipeline_config(args.config)
+    if args.dry_run is not None:
+        dry_run(args, config, stats)
+    elif args.sweep is not None:
+        threshold_sweep(args, config, stats)
+    else:
+        clean(args, config, stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+from dataclasses import dataclass
+from typing import IO
+
+from xopen import xopen
+
+# Codec name -> (file suffix, xopen format)
+CODECS = {
+    'none': ('', None),
+    'gzip': ('.gz', 'gz'),
+    'zstd': ('.zst', 'zst'),
+}
+
+
+@dataclass(frozen=True)
+class Codec:
+    """How a pipeline output is compressed.
+
+    Goes through xopen, which compresses gzip with python-isal (igzip) or pigz and zstd with
+    zstandard or the `zstd` binary. `threads=0` compresses in-process, `None` lets xopen pick
+    (up to 4 threads), any other value sets the number of compression threads. `level=None` uses
+    xopen's default (1 for gzip, 3 for zstd).
+    """
+    name: str = 'gzip'
+    level: int | None = None
+    threads: int | None = None
+
+    def __post_init__(self):
+        if self.name not in CODECS:
+            raise ValueError(f"Unknown codec '{self.name}', available codecs: {sorted(CODECS)}")
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Codec':
+        """Parse `name[:level[:threads]]`, e.g. `gzip`, `gzip:6` or `zstd:3:8`."""
+        name, *rest = spec.split(':')
+        level = int(rest[0]) if len(rest) > 0 and rest[0] else None
+        threads = int(rest[1]) if len(rest) > 1 and rest[1] else None
+        return cls(name, level, threads)
+
+    @classmethod
+    def for_path(cls, path: str | os.PathLike) -> 'Codec':
+        """The codec a file name's suffix stands for, with default settings."""
+        suffix = os.path.splitext(path)[1]
+        return cls(next((name for name, (codec_suffix, _) in CODECS.items() if codec_suffix and codec_suffix == suffix), 'none'))
+
+    @property
+    def suffix(self) -> str:
+        return CODECS[self.name][0]
+
+    def open(self, path: str | os.PathLike, mode: str = 'rt', **kwargs) -> IO:
+        """Open `path` with this codec regardless of its suffix, so it also works with the temporary
+        names of `atomic_write`."""
+        if self.name == 'none':
+            if 'b' not in mode:
+                kwargs.setdefault('encoding', 'utf-8')
+            return open(path, mode, **kwargs)
+        return xopen(path, mode, compresslevel=self.level, threads=self.threads, format=CODECS[self.name][1], **kwargs)
+
+
+def open_input(path: str | os.PathLike, mode: str = 'rt', threads: int | None = None, **kwargs) -> IO:
+    """Open a possibly compressed pipeline file for reading; the codec is detected from the file."""
+    return xopen(path, mode, threads=threads, **kwargs)
@@ -0,0 +1,88 @@
+import os
+import re
+from collections.abc import Callable, Iterable, Iterator
+
+import mmh3
+import numpy as np
+
+from cs336_data.manifest import atomic_write
+
+# Evaluation sets are matched on lowercased word n-grams, so tokenization and whitespace differences
+# between the eval copy and the training copy of a document do not hide an overlap
+WORD_PATTERN = re.compile(r"\w+")
+DEFAULT_NGRAM = 13
+GPT2_EOS_TOKEN_ID = 50256
+# Odd 64-bit multiplier folding consecutive word hashes into one n-gram hash (wraps mod 2**64)
+_NGRAM_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def word_hashes(text: str) -> np.ndarray:
+    words = WORD_PATTERN.findall(text.lower())
+    return np.fromiter((mmh3.hash64(word, signed=False)[0] for word in words), dtype=np.uint64, count=len(words))
+
+
+def ngram_hashes(text: str, n: int = DEFAULT_NGRAM) -> np.ndarray:
+    """64-bit hashes of every n consecutive words of `text`; empty for texts shorter than n words."""
+    words = word_hashes(text)
+    num_ngrams = len(words) - n + 1
+    if num_ngrams <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    hashes = words[:num_ngrams].copy()
+    for k in range(1, n):
+        hashes *= _NGRAM_MULTIPLIER
+        hashes += words[k:k + num_ngrams]
+    return hashes
+
+
+def iter_token_file_documents(
+    token_path: str | os.PathLike, decode: Callable[[list[int]], str], eos_token_id: int = GPT2_EOS_TOKEN_ID
+) -> Iterator[str]:
+    """Decode the documents of a uint16 token file (e.g. the output of load_and_tokenize.py), which
+    are separated by `eos_token_id`."""
+    tokens = np.fromfile(token_path, dtype=np.uint16)
+    start = 0
+    for end in np.flatnonzero(tokens == eos_token_id):
+        yield decode(tokens[start:end].tolist())
+        start = end + 1
+    if start < len(tokens):
+        yield decode(tokens[start:].tolist())
+
+
+def write_ngram_index(texts: Iterable[str], output_path: str | os.PathLike, n: int = DEFAULT_NGRAM) -> int:
+    """Write the sorted, unique n-gram hashes of `texts` as a .npy file; returns the entry count."""
+    parts = [ngram_hashes(text, n) for text in texts]
+    hashes = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.uint64)
+    with atomic_write(output_path, 'wb') as f:
+        np.save(f, hashes)
+    return len(hashes)
+
+
+class NgramIndex:
+    """Memory-mapped n-gram hashes of an evaluation set written by `write_ngram_index`; `n` must be
+    the one the index was written with."""
+
+    def __init__(self, index_path: str | os.PathLike, n: int = DEFAULT_NGRAM):
+        self.hashes = np.load(index_path, mmap_mode='r')
+        self.n = n
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Which of `hashes` are in the index, as a boolean array; one vectorized binary search."""
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[positions] == hashes
+
+    def count_overlaps(self, text: str) -> int:
+        """Number of n-grams of `text` that also occur in the evaluation set."""
+        return int(self.contains(ngram_hashes(text, self.n)).sum())
+
+    def count_line_overlaps(self, lines: list[str]) -> np.ndarray:
+        """`count_overlaps` of each line, with a single lookup for all of them."""
+        hashes = [ngram_hashes(line, self.n) for line in lines]
+        if not hashes:
+            return np.zeros(0, dtype=np.int64)
+        line_ids = np.repeat(np.arange(len(lines)), [len(h) for h in hashes])
+        return np.bincount(line_ids[self.contains(np.concatenate(hashes))], minlength=len(lines))
@@ -0,0 +1,82 @@
+import os
+import csv
+import functools
+from collections.abc import Iterable
+from urllib.parse import urlsplit
+
+import mmh3
+import numpy as np
+from tldextract import TLDExtract
+
+from cs336_data.manifest import atomic_write
+
+# Domain allowlists compiled by cs336-basics/build_domain_index.py (relative to the repo root),
+# memory-mapped by every worker of cs336-basics/parallel_process_wets.py
+C4_DOMAINS_INDEX = "cs336-basics/c4_domains.npy"
+EXTRACTED_DOMAINS_INDEX = "cs336-basics/extracted_domains.npy"
+
+# Bundled Public Suffix List snapshot only, so no process ever tries to fetch it over the network
+_tld_extractor = TLDExtract(suffix_list_urls=())
+
+
+def domain_hash(domain: str) -> int:
+    return mmh3.hash64(domain, signed=False)[0]
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def registered_domain(host: str) -> str:
+    """`domain.suffix` of a host, e.g. `blog.example.co.uk` -> `example.co.uk`, cached per host."""
+    extracted = _tld_extractor(host)
+    return f"{extracted.domain}.{extracted.suffix}"
+
+
+def url_registered_domain(url: str) -> str:
+    try:
+        host = urlsplit(url).netloc
+    except ValueError:
+        host = ""
+    # Same result as running TLDExtract on the full URL, but many URLs share one cache entry
+    return registered_domain(host or url)
+
+
+def write_domain_index(domains: Iterable[str], output_path: str | os.PathLike) -> int:
+    """Write the sorted, unique 64-bit hashes of `domains` as a .npy file; returns the entry count."""
+    hashes = np.unique(np.fromiter((domain_hash(domain) for domain in domains), dtype=np.uint64))
+    with atomic_write(output_path, 'wb') as f:
+        np.save(f, hashes)
+    return len(hashes)
+
+
+def load_subdomains_csv(file_path: str | os.PathLike, registered: bool = False) -> set[str]:
+    """Read a `subdomain` CSV whose rows look like `123_www.example.com`, optionally reducing each
+    entry to its registered domain."""
+    domains = set()
+    with open(file_path, encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            # 移除前面的編號部分（如 "123_"）
+            clean_subdomain = '_'.join(row['subdomain'].split('_')[1:])
+            domains.add(registered_domain(clean_subdomain) if registered else clean_subdomain)
+    return domains
+
+
+def build_domain_index_from_csv(
+    csv_path: str | os.PathLike, index_path: str | os.PathLike, registered: bool = False
+) -> int:
+    return write_domain_index(load_subdomains_csv(csv_path, registered=registered), index_path)
+
+
+class DomainIndex:
+    """Memory-mapped set of domains written by `write_domain_index`; every process mapping the same
+    file shares its pages, and a lookup is one binary search."""
+
+    def __init__(self, index_path: str | os.PathLike):
+        self.hashes = np.load(index_path, mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __contains__(self, domain: str) -> bool:
+        h = np.uint64(domain_hash(domain))
+        i = np.searchsorted(self.hashes, h)
+        return i < len(self.hashes) and self.hashes[i] == h
@@ -0,0 +1,180 @@
+import math
+import time
+import statistics
+from dataclasses import dataclass
+from collections.abc import Iterable
+
+import numpy as np
+
+from cs336_data.pipeline import Document, Pipeline
+
+# Average UTF-8 bytes per GPT-2 token of English web text, for token estimates without a tokenizer
+GPT2_BYTES_PER_TOKEN = 4.0
+
+
+@dataclass
+class DryRunSample:
+    """Per-document measurements of a pipeline run over a sample of records."""
+    # Stage names in the order they ran
+    stage_names: list[str]
+    # Index of the stage that rejected each document, len(stage_names) if it was kept
+    rejected_at: np.ndarray
+    # Nanoseconds each stage spent on each document (documents x stages)
+    stage_ns: np.ndarray
+    # Nanoseconds from reading the record to the pipeline's decision
+    total_ns: np.ndarray
+    # UTF-8 bytes of text written for each kept document, 0 for rejected ones
+    kept_bytes: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.rejected_at)
+
+    @classmethod
+    def concatenate(cls, samples: list['DryRunSample']) -> 'DryRunSample':
+        samples = [sample for sample in samples if len(sample)]
+        if not samples:
+            raise ValueError("No documents were sampled")
+        if any(sample.stage_names != samples[0].stage_names for sample in samples):
+            raise ValueError("Samples were measured with different stage orders")
+        return cls(
+            samples[0].stage_names,
+            np.concatenate([sample.rejected_at for sample in samples]),
+            np.concatenate([sample.stage_ns for sample in samples]),
+            np.concatenate([sample.total_ns for sample in samples]),
+            np.concatenate([sample.kept_bytes for sample in samples]),
+        )
+
+
+def profile_documents(pipeline: Pipeline, docs: Iterable[Document], stats: dict) -> DryRunSample:
+    """Run `docs` through `pipeline` one at a time and measure each; reading a document from `docs`
+    counts towards its time. The pipeline is switched to profiling, which times every stage."""
+    pipeline.profile = True
+    names = [stage.name for stage in pipeline.stages]
+    rejected_at, stage_ns, total_ns, kept_bytes = [], [], [], []
+    docs = iter(docs)
+    while True:
+        start = time.perf_counter_ns()
+        doc = next(docs, None)
+        if doc is None:
+            break
+        before = [list(pipeline.observed[name]) for name in names]
+        kept = pipeline.process(doc, stats)
+        total_ns.append(time.perf_counter_ns() - start)
+        after = [pipeline.observed[name] for name in names]
+        stage_ns.append([a[1] - b[1] for a, b in zip(after, before)])
+        rejections = [a[2] - b[2] for a, b in zip(after, before)]
+        rejected_at.append(len(names) if kept else next(i for i, count in enumerate(rejections) if count))
+        kept_bytes.append(len(doc.text.encode('utf-8')) + 1 if kept else 0)
+    return DryRunSample(
+        names,
+        np.array(rejected_at, dtype=np.int16),
+        np.array(stage_ns, dtype=np.int64).reshape(-1, len(names)),
+        np.array(total_ns, dtype=np.int64),
+        np.array(kept_bytes, dtype=np.int64),
+    )
+
+
+@dataclass
+class Interval:
+    estimate: float
+    low: float
+    high: float
+
+    def format(self, scale: float = 1.0, spec: str = ",.0f") -> str:
+        return f"{self.estimate / scale:{spec}} [{self.low / scale:{spec}}, {self.high / scale:{spec}}]"
+
+
+def proportion_interval(successes: int, trials: int, population: int, confidence: float) -> Interval:
+    """Wilson score interval of a proportion, scaled to `population`."""
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    p = successes / trials
+    center = (p + z * z / (2 * trials)) / (1 + z * z / trials)
+    half = z / (1 + z * z / trials) * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials))
+    return Interval(p * population, max(center - half, 0) * population, min(center + half, 1) * population)
+
+
+def total_interval(values: np.ndarray, population: int, confidence: float) -> Interval:
+    """Normal interval of the population total of a per-record quantity measured on a sample
+    drawn without replacement."""
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    n = len(values)
+    mean = float(values.mean())
+    std = float(values.std(ddof=1)) if n > 1 else 0.0
+    correction = math.sqrt(max(1 - n / population, 0))
+    half = z * std / math.sqrt(n) * correction
+    return Interval(mean * population, max(mean - half, 0) * population, (mean + half) * population)
+
+
+@dataclass
+class DryRunEstimate:
+    sampled: int
+    population: int
+    confidence: float
+    num_cores: int
+    bytes_per_token: float
+    # Documents left after each stage, by stage name in run order
+    survivors: dict[str, Interval]
+    # CPU-hours spent in each stage
+    stage_cpu_hours: dict[str, Interval]
+    kept_bytes: Interval
+    tokens: Interval
+    # CPU-hours including reading the records
+    cpu_hours: Interval
+    wall_hours: Interval
+
+
+def estimate_run(
+    sample: DryRunSample,
+    population: int,
+    num_cores: int,
+    confidence: float = 0.95,
+    bytes_per_token: float = GPT2_BYTES_PER_TOKEN,
+) -> DryRunEstimate:
+    """Extrapolate a sample of `population` records to the full run on `num_cores` cores, assuming
+    the work divides evenly between them."""
+    n = len(sample)
+    survivors = {
+        name: proportion_interval(int((sample.rejected_at > i).sum()), n, population, confidence)
+        for i, name in enumerate(sample.stage_names)
+    }
+    stage_cpu_hours = {
+        name: _scaled(total_interval(sample.stage_ns[:, i], population, confidence), 1 / 3.6e12)
+        for i, name in enumerate(sample.stage_names)
+    }
+    kept_bytes = total_interval(sample.kept_bytes, population, confidence)
+    cpu_hours = _scaled(total_interval(sample.total_ns, population, confidence), 1 / 3.6e12)
+    return DryRunEstimate(
+        sampled=n,
+        population=population,
+        confidence=confidence,
+        num_cores=num_cores,
+        bytes_per_token=bytes_per_token,
+        survivors=survivors,
+        stage_cpu_hours=stage_cpu_hours,
+        kept_bytes=kept_bytes,
+        tokens=_scaled(kept_bytes, 1 / bytes_per_token),
+        cpu_hours=cpu_hours,
+        wall_hours=_scaled(cpu_hours, 1 / num_cores),
+    )
+
+
+def _scaled(interval: Interval, factor: float) -> Interval:
+    return Interval(interval.estimate * factor, interval.low * factor, interval.high * factor)
+
+
+def format_estimate(estimate: DryRunEstimate) -> list[str]:
+    lines = [
+        f"Sampled {estimate.sampled:,} of {estimate.population:,} records "
+        f"({estimate.sampled / estimate.population:.2%}), {estimate.confidence:.0%} confidence intervals in brackets",
+        "Documents left after each stage, CPU-hours in the stage:",
+    ]
+    for name, survivors in estimate.survivors.items():
+        lines.append(f"  {name}: {survivors.format()} ({survivors.estimate / estimate.population:.1%}), "
+                     f"{estimate.stage_cpu_hours[name].format(spec=',.2f')} CPU-h")
+    lines += [
+        f"Kept text: {estimate.kept_bytes.format(2**30, ',.2f')} GB, "
+        f"about {estimate.tokens.format(1e9, ',.2f')}B tokens at {estimate.bytes_per_token} bytes/token",
+        f"CPU time: {estimate.cpu_hours.format(spec=',.2f')} CPU-h, "
+        f"wall-clock at {estimate.num_cores} cores: {estimate.wall_hours.format(spec=',.2f')} h",
+    ]
+    return lines
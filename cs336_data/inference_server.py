@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+from dataclasses import dataclass, field
+from collections.abc import Callable
+
+import numpy as np
+
+# Every message is a 4-byte big-endian length followed by that many bytes of JSON
+_HEADER = struct.Struct("!I")
+
+
+def _send(sock: socket.socket, message: dict) -> None:
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes | None:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock: socket.socket) -> dict | None:
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    return json.loads(_recv_exactly(sock, _HEADER.unpack(header)[0]))
+
+
+@dataclass
+class _Request:
+    texts: list[str]
+    k: int
+    done: threading.Event = field(default_factory=threading.Event)
+    reply: dict | None = None
+
+
+class _ModelBatcher(threading.Thread):
+    """Owns one model; gathers the requests of all connections into micro-batches of at most
+    `max_batch` texts, waiting at most `max_delay` seconds after the first request of a batch.
+
+    Clients wait for each reply before sending again, so once every connection that could still
+    send to this model (`senders()`: those that have used it and are not waiting on another model)
+    has a request in the batch, no other can arrive and the batch is predicted without waiting out
+    the deadline.
+    """
+
+    def __init__(self, model_path: str, max_batch: int, max_delay: float, senders: Callable[[], int]):
+        super().__init__(daemon=True)
+        import fasttext
+        self.model = fasttext.load_model(model_path)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.senders = senders
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_delay
+            while size < self.max_batch and len(batch) < self.senders():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                size += len(batch[-1].texts)
+            self._predict(batch)
+
+    def _predict(self, batch: list[_Request]) -> None:
+        for k in {request.k for request in batch}:
+            requests = [request for request in batch if request.k == k]
+            texts = [text for request in requests for text in request.texts]
+            try:
+                labels, scores = self.model.predict(texts, k=k)
+            except Exception:
+                # One bad text (e.g. with a newline) fails the whole call; only its own request
+                # should get the error
+                for request in requests:
+                    self._predict_one(request)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for request in requests:
+                end = start + len(request.texts)
+                self._reply(request, labels[start:end], scores[start:end])
+                start = end
+
+    def _predict_one(self, request: _Request) -> None:
+        try:
+            labels, scores = self.model.predict(request.texts, k=request.k)
+        except Exception as exc:
+            request.reply = {'error': repr(exc)}
+            request.done.set()
+            return
+        self.batches += 1
+        self.texts += len(request.texts)
+        self._reply(request, labels, scores)
+
+    @staticmethod
+    def _reply(request: _Request, labels, scores) -> None:
+        request.reply = {
+            'labels': [list(item) for item in labels],
+            'scores': [[float(score) for score in item] for item in scores],
+        }
+        request.done.set()
+
+
+class InferenceServer:
+    """Serve fastText models to every pipeline worker over a Unix socket, so each model is held
+    once instead of once per worker and predictions run in batches.
+
+    Models are loaded on first use by path. Each connection is one synchronous client; requests
+    from all connections to the same model are batched together by `_ModelBatcher`.
+    """
+
+    def __init__(self, socket_path: str, max_batch: int = 256, max_delay: float = 0.002):
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batchers: dict[str, _ModelBatcher] = {}
+        self.lock = threading.Lock()
+        # Model path -> open connections that have sent it a request
+        self.users: dict[str, set[int]] = {}
+        # Connection -> model path of its request in flight
+        self.waiting_on: dict[int, str] = {}
+
+    def _senders(self, model_path: str) -> int:
+        """Connections that may still send a request to `model_path`'s current batch."""
+        with self.lock:
+            return sum(1 for conn_id in self.users[model_path] if self.waiting_on.get(conn_id, model_path) == model_path)
+
+    def _batcher(self, model_path: str) -> _ModelBatcher:
+        with self.lock:
+            if model_path not in self.batchers:
+                self.users[model_path] = set()
+                batcher = _ModelBatcher(model_path, self.max_batch, self.max_delay, lambda: self._senders(model_path))
+                batcher.start()
+                self.batchers[model_path] = batcher
+            return self.batchers[model_path]
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        try:
+            self._serve_requests(conn)
+        finally:
+            conn.close()
+            with self.lock:
+                for users in self.users.values():
+                    users.discard(id(conn))
+
+    def _serve_requests(self, conn: socket.socket) -> None:
+        conn_id = id(conn)
+        while (message := _recv(conn)) is not None:
+            if message.get('stats'):
+                _send(conn, {name: {'batches': b.batches, 'texts': b.texts} for name, b in self.batchers.items()})
+                continue
+            try:
+                request = _Request(message['texts'], message.get('k', 1))
+                batcher = self._batcher(message['model'])
+            except Exception as exc:
+                _send(conn, {'error': repr(exc)})
+                continue
+            with self.lock:
+                self.users[message['model']].add(conn_id)
+                self.waiting_on[conn_id] = message['model']
+            batcher.requests.put(request)
+            request.done.wait()
+            with self.lock:
+                del self.waiting_on[conn_id]
+            _send(conn, request.reply)
+
+    def serve_forever(self, ready: threading.Event | None = None) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(self.socket_path)
+            server.listen()
+            if ready is not None:
+                ready.set()
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class InferenceClient:
+    """Connection to an `InferenceServer`; reconnects after a fork, so each process has its own."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._sock = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _request(self, message: dict) -> dict:
+        with self._lock:
+            if self._sock is None or self._pid != os.getpid():
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._sock.connect(self.socket_path)
+                self._pid = os.getpid()
+            _send(self._sock, message)
+            reply = _recv(self._sock)
+        if reply is None:
+            raise ConnectionError(f"Inference server at {self.socket_path} closed the connection")
+        if 'error' in reply:
+            raise RuntimeError(f"Inference server error: {reply['error']}")
+        return reply
+
+    def predict(self, model_path: str, texts: list[str], k: int = 1) -> tuple[list[list[str]], list[list[float]]]:
+        reply = self._request({'model': model_path, 'texts': texts, 'k': k})
+        return reply['labels'], reply['scores']
+
+    def stats(self) -> dict:
+        """Batches and texts predicted so far, per model."""
+        return self._request({'stats': True})
+
+
+# One client per socket path, shared by every model of this process, so a worker holds a single
+# connection however many models it uses
+_CLIENTS: dict[str, InferenceClient] = {}
+
+
+def shared_client(socket_path: str) -> InferenceClient:
+    if socket_path not in _CLIENTS:
+        _CLIENTS[socket_path] = InferenceClient(socket_path)
+    return _CLIENTS[socket_path]
+
+
+class RemoteModel:
+    """Stand-in for a `fasttext` model whose `predict` runs on an `InferenceServer`."""
+
+    def __init__(self, client: InferenceClient, model_path: str):
+        self.client = client
+        self.model_path = os.path.abspath(model_path)
+
+    def predict(self, text: str | list[str], k: int = 1):
+        if isinstance(text, str):
+            labels, scores = self.client.predict(self.model_path, [text], k)
+            return tuple(labels[0]), np.array(scores[0])
+        labels, scores = self.client.predict(self.model_path, list(text), k)
+        return [list(item) for item in labels], [np.array(item) for item in scores]
+
+
+def start_inference_server(socket_path: str, max_batch: int = 256, max_delay: float = 0.002):
+    """Run an `InferenceServer` in a child process and return the process once it accepts connections."""
+    import multiprocessing
+    ready = multiprocessing.get_context("fork").Event()
+
+    def serve():
+        server = InferenceServer(socket_path, max_batch, max_delay)
+        listening = threading.Event()
+        threading.Thread(target=server.serve_forever, args=(listening,), daemon=True).start()
+        listening.wait()
+        ready.set()
+        threading.Event().wait()
+
+    process = multiprocessing.get_context("fork").Process(target=serve, daemon=True)
+    process.start()
+    ready.wait()
+    return process
+
+
+if __name__ == "__main__":
+    # Experimental: python -m cs336_data.inference_server --socket /tmp/fasttext.sock, then run the
+    # pipeline with CS336_EXPERIMENTAL_FASTTEXT_SOCKET=/tmp/fasttext.sock (or parallel_process_wets.py
+    # --experimental-inference-server /tmp/fasttext.sock) so load_fasttext_model uses this server
+    parser = argparse.ArgumentParser(description="Serve fastText models to pipeline workers over a Unix socket "
+                                                 "(experimental; slower than models loaded in each worker)")
+    parser.add_argument('--socket', default="/tmp/cs336_fasttext.sock")
+    parser.add_argument('--max-batch', type=int, default=256, help="Most texts predicted in one call")
+    parser.add_argument('--max-delay', type=float, default=0.002,
+                        help="Seconds a request may wait for others to join its batch")
+    args = parser.parse_args()
+    print(f"Serving fastText models on {args.socket}")
+    InferenceServer(args.socket, args.max_batch, args.max_delay).serve_forever()
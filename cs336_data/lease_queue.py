@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import random
+import socket
+import threading
+import contextlib
+from pathlib import Path
+from collections.abc import Callable, Iterable
+
+from cs336_data.manifest import atomic_write
+
+
+class LeaseQueue:
+    """Work queue kept in a (shared) directory, so any number of processes on any number of hosts
+    can split a fixed set of tasks.
+
+    Layout under `root`:
+      tasks/<key>   one empty file per task, created by `add`
+      leases/<key>  held by the worker processing the task; created with O_EXCL and kept alive by
+                    touching it, so a lease whose mtime is older than `lease_timeout` belongs to a
+                    crashed worker and can be taken over
+      done/<key>    JSON result of a finished task, renamed into place atomically
+      failed/<key>  JSON error of a task that raised; skipped until `retry_failed`
+
+    A task is finished once its done file exists. Races between workers can at worst make two of
+    them process the same task, never lose one, so task outputs should be written atomically.
+    """
+
+    def __init__(self, root: str | os.PathLike, lease_timeout: float = 300.0, worker_id: str | None = None):
+        self.root = Path(root)
+        self.lease_timeout = lease_timeout
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.held: set[str] = set()
+        for name in ('tasks', 'leases', 'done', 'failed', 'clock'):
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def add(self, keys: Iterable[str]) -> None:
+        """Add tasks; keys must be valid file names. Adding an existing task is a no-op."""
+        for key in keys:
+            (self.root / 'tasks' / key).touch()
+
+    def keys(self) -> list[str]:
+        return sorted(os.listdir(self.root / 'tasks'))
+
+    def _is_settled(self, key: str) -> bool:
+        return (self.root / 'done' / key).exists() or (self.root / 'failed' / key).exists()
+
+    def unfinished(self) -> list[str]:
+        """Tasks that are neither done nor failed, whether leased or not."""
+        return [key for key in self.keys() if not self._is_settled(key)]
+
+    def _fs_now(self) -> float:
+        # Lease ages are measured against the shared filesystem's clock, not this host's
+        clock = self.root / 'clock' / self.worker_id
+        clock.touch()
+        return os.stat(clock).st_mtime
+
+    def try_lease(self, key: str, now: float | None = None) -> bool:
+        """Take the lease of `key` if it is free or expired."""
+        path = self.root / 'leases' / key
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            now = self._fs_now() if now is None else now
+            try:
+                if now - os.stat(path).st_mtime < self.lease_timeout:
+                    return False
+                # Expired: move it aside; of several workers racing here only one rename succeeds
+                expired = path.with_name(f"{key}.expired-{self.worker_id}")
+                os.rename(path, expired)
+            except FileNotFoundError:
+                return False
+            if now - os.stat(expired).st_mtime < self.lease_timeout:
+                # Another worker took the lease over between our stat and rename; give it back
+                os.rename(expired, path)
+                return False
+            os.unlink(expired)
+            return self.try_lease(key, now)
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.worker_id)
+        self.held.add(key)
+        return True
+
+    def claim(self) -> str | None:
+        """Lease an unfinished task, or return None if every unfinished task is leased by a live worker."""
+        keys = self.keys()
+        # Workers walk the tasks in different orders so they rarely race for the same lease
+        random.Random(self.worker_id).shuffle(keys)
+        now = self._fs_now()
+        for key in keys:
+            if self._is_settled(key) or not self.try_lease(key, now):
+                continue
+            # It may have been finished by the worker whose lease just expired or was released
+            if self._is_settled(key):
+                self.release(key)
+                continue
+            return key
+        return None
+
+    def owns(self, key: str) -> bool:
+        """Whether the lease of `key` is (still) this worker's; it may have expired and been taken over."""
+        try:
+            with open(self.root / 'leases' / key, encoding='utf-8') as f:
+                return f.read() == self.worker_id
+        except FileNotFoundError:
+            return False
+
+    def heartbeat(self) -> None:
+        """Refresh every lease this worker holds; leases taken over by another worker are dropped."""
+        for key in list(self.held):
+            if not self.owns(key):
+                self.held.discard(key)
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(self.root / 'leases' / key)
+
+    @contextlib.contextmanager
+    def keep_alive(self, interval: float | None = None):
+        """Refresh the held leases from a background thread while the block runs."""
+        stop = threading.Event()
+        interval = interval or self.lease_timeout / 4
+
+        def beat():
+            while not stop.wait(interval):
+                self.heartbeat()
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+    def release(self, key: str) -> None:
+        self.held.discard(key)
+        # A late complete/fail must not remove the lease of a worker that took the task over
+        if self.owns(key):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.root / 'leases' / key)
+
+    def _write_record(self, kind: str, key: str, record: dict) -> None:
+        record = {'worker': self.worker_id, 'finished_at': time.time(), **record}
+        with atomic_write(self.root / kind / key, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+
+    def complete(self, key: str, result: dict | None = None) -> None:
+        self._write_record('done', key, {'result': result or {}})
+        self.release(key)
+
+    def fail(self, key: str, error: str) -> None:
+        self._write_record('failed', key, {'error': error})
+        self.release(key)
+
+    def retry_failed(self) -> list[str]:
+        """Make failed tasks claimable again; returns their keys."""
+        keys = [key for key in sorted(os.listdir(self.root / 'failed')) if not key.startswith('.')]
+        for key in keys:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.root / 'failed' / key)
+        return keys
+
+    def _read_records(self, kind: str) -> dict[str, dict]:
+        records = {}
+        for key in sorted(os.listdir(self.root / kind)):
+            # Skip temporary files of writes in progress
+            if key.startswith('.'):
+                continue
+            with open(self.root / kind / key, encoding='utf-8') as f:
+                records[key] = json.load(f)
+        return records
+
+    def results(self) -> dict[str, dict]:
+        """Results of all finished tasks, keyed by task."""
+        return {key: record['result'] for key, record in self._read_records('done').items()}
+
+    def failures(self) -> dict[str, str]:
+        return {key: record['error'] for key, record in self._read_records('failed').items()}
+
+    def iter_claimed(self, poll_interval: float = 5.0):
+        """Yield claimed tasks until every task is done or failed; waits while the remaining tasks
+        are leased by other workers, and takes over those whose worker died."""
+        while True:
+            key = self.claim()
+            if key is not None:
+                yield key
+            elif not self.unfinished():
+                return
+            else:
+                time.sleep(poll_interval)
+
+    def run_once(self, key: str, fn: Callable[[], dict | None], poll_interval: float = 5.0) -> bool:
+        """Run `fn` as the task `key` on exactly one of the workers calling this, the others waiting
+        until it is done; if the worker running it dies, its lease expires and a waiting worker runs
+        it again. Returns whether `fn` ran in this worker; raises RuntimeError if it failed in another.
+
+        `key` should be the only task of this queue, or workers claiming tasks would take it too."""
+        self.add([key])
+        ran = False
+        with self.keep_alive():
+            for claimed in self.iter_claimed(poll_interval):
+                try:
+                    result = fn()
+                except Exception as exc:
+                    self.fail(claimed, repr(exc))
+                    raise
+                self.complete(claimed, result)
+                ran = True
+        failures = self.failures()
+        if not ran and key in failures:
+            raise RuntimeError(f"Task {key} failed in another worker: {failures[key]}")
+        return ran
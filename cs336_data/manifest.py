@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import hashlib
+import contextlib
+from pathlib import Path
+
+
+def file_sha256(path: str | os.PathLike, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_write(path: str | os.PathLike, mode: str = 'w', opener=open, **kwargs):
+    """Write to a temporary file next to `path` and rename it into place only once the block succeeds,
+    so readers (and resumed runs) never see a half-written file. `opener` can be e.g. `gzip.open`."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    try:
+        with opener(tmp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class RunManifest:
+    """Append-only JSONL journal of finished work units, keyed by (step, key).
+
+    Every entry records the unit's output files with their size and sha256, and its stats. A unit
+    counts as done on a later run only while its outputs are still on disk and unchanged, so a
+    restarted run can skip exactly the work that survived.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from a crash mid-append
+                        continue
+                    self.entries[(entry['step'], entry['key'])] = entry
+
+    def record(self, step: str, key: str, outputs: list[os.PathLike] = (), stats: dict | None = None) -> dict:
+        entry = {
+            'step': step,
+            'key': str(key),
+            'outputs': {
+                str(path): {'bytes': os.path.getsize(path), 'sha256': file_sha256(path)}
+                for path in outputs
+            },
+            'stats': dict(stats or {}),
+            'finished_at': time.time(),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[(step, str(key))] = entry
+        return entry
+
+    def finished(self, step: str) -> dict[str, dict]:
+        """Entries of every finished unit of `step`, keyed by unit key."""
+        return {key: self.get(step, key) for entry_step, key in self.entries
+                if entry_step == step and self.get(step, key) is not None}
+
+    def get(self, step: str, key: str, verify_checksums: bool = False) -> dict | None:
+        """Return the entry of a finished unit, or None if it never finished or its outputs are gone."""
+        entry = self.entries.get((step, str(key)))
+        if entry is None:
+            return None
+        for path, info in entry['outputs'].items():
+            if not os.path.exists(path) or os.path.getsize(path) != info['bytes']:
+                return None
+            if verify_checksums and file_sha256(path) != info['sha256']:
+                return None
+        return entry
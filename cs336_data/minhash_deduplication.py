@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from typing import List, Set, Dict, Tuple
+from collections.abc import Callable
 from collections import defaultdict
 from datasketch import MinHash, MinHashLSH
 from unidecode import unidecode
@@ -25,44 +26,37 @@ def get_word_ngrams(text: str, n: int) -> Set[str]:
     )
 
 
-def minhash_deduplication(
-    input_files: List[os.PathLike],
+def minhash_keep_ids(
+    load_text: Callable[[int], str],
+    num_docs: int,
     num_hashes: int,
     num_bands: int,
     ngrams: int,
     jaccard_threshold: float,
-    output_directory: os.PathLike,
-):
+) -> Set[int]:
+    """Decide which of `num_docs` documents survive MinHash deduplication without writing anything.
+
+    `load_text(i)` returns the text of document `i`; it is called once per document for the
+    signatures and again only for the documents of candidate pairs, so texts never need to be held
+    in memory together. Empty documents are dropped; of each cluster of near-duplicates the lowest
+    index is kept.
+    """
     assert num_hashes % num_bands == 0, "num_hashes must be divisible by num_bands"
     num_rows = num_hashes // num_bands
 
-    # Step 1: Load all documents and normalize
-    doc_id_to_path = {}
-    original_texts = {}
-
-    for idx, input_file in enumerate(input_files):
-        input_path = Path(input_file)
-        with open(input_path, 'r', encoding='utf-8', errors='ignore') as f:
-            raw_text = f.read()
-        normalized_text = normalize_text(raw_text)
+    # Step 1: Generate MinHash signatures of the non-empty documents
+    signatures = {}
+    for doc_id in range(num_docs):
+        normalized_text = normalize_text(load_text(doc_id))
         if not normalized_text.strip():
             continue  # skip empty docs
-
-        doc_id_to_path[idx] = input_path
-        original_texts[idx] = raw_text
-
-    # Step 2: Generate MinHash signatures
-    signatures = {}
-    for doc_id, raw_text in original_texts.items():
-        normalized_text = normalize_text(raw_text)
         ngram_set = get_word_ngrams(normalized_text, ngrams)
 
         m = MinHash(num_perm=num_hashes)
-        for ngram in ngram_set:
-            m.update(ngram.encode('utf-8'))
+        m.update_batch([ngram.encode('utf-8') for ngram in ngram_set])
         signatures[doc_id] = m
 
-    # Step 3: Build LSH index and find candidate pairs
+    # Step 2: Build LSH index and find candidate pairs
     lsh = MinHashLSH(
         threshold=0.0,
         num_perm=num_hashes,
@@ -79,20 +73,18 @@ def minhash_deduplication(
             if doc_id < other_id:
                 candidate_pairs.add((doc_id, other_id))
 
-    # Step 4: Compute actual Jaccard and filter duplicates
+    # Step 3: Compute actual Jaccard and filter duplicates
     duplicate_pairs = []
     for a, b in candidate_pairs:
-        text_a = normalize_text(original_texts[a])
-        text_b = normalize_text(original_texts[b])
-        set_a = get_word_ngrams(text_a, ngrams)
-        set_b = get_word_ngrams(text_b, ngrams)
+        set_a = get_word_ngrams(normalize_text(load_text(a)), ngrams)
+        set_b = get_word_ngrams(normalize_text(load_text(b)), ngrams)
         intersection = len(set_a & set_b)
         union = len(set_a | set_b)
         jaccard = intersection / union if union else 0.0
         if jaccard >= jaccard_threshold:
             duplicate_pairs.append((a, b))
 
-    # Step 5: Cluster using Union-Find
+    # Step 4: Cluster using Union-Find
     parent = {}
 
     def find(x):
@@ -107,20 +99,34 @@ def minhash_deduplication(
         union(a, b)
 
     clusters = defaultdict(list)
-    for doc_id in doc_id_to_path:
+    for doc_id in signatures:
         root = find(doc_id)
         clusters[root].append(doc_id)
 
-    keep_ids = {min(group) for group in clusters.values()}
+    return {min(group) for group in clusters.values()}
+
+
+def minhash_deduplication(
+    input_files: List[os.PathLike],
+    num_hashes: int,
+    num_bands: int,
+    ngrams: int,
+    jaccard_threshold: float,
+    output_directory: os.PathLike,
+):
+    def load_text(doc_id):
+        with open(input_files[doc_id], 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read()
+
+    keep_ids = minhash_keep_ids(load_text, len(input_files), num_hashes, num_bands, ngrams, jaccard_threshold)
 
-    # Step 6: Write output files
+    # Write output files
     output_dir = Path(output_directory)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    for doc_id, input_file in zip(doc_id_to_path.keys(), input_files):
-        input_path = Path(input_file)
+    for doc_id in sorted(keep_ids):
+        input_path = Path(input_files[doc_id])
         output_path = output_dir / input_path.name
-        if doc_id in keep_ids:
-            with open(input_file, 'r', encoding='utf-8') as fin, \
-                 open(output_path, 'w', encoding='utf-8') as fout:
-                fout.write(fin.read())
+        with open(input_path, 'r', encoding='utf-8') as fin, \
+             open(output_path, 'w', encoding='utf-8') as fout:
+            fout.write(fin.read())
@@ -0,0 +1,73 @@
+import re
+from collections import deque
+from collections.abc import Iterable
+
+# Words are runs of \w; every other non-space character is a token of its own, so "s&m" and
+# "g-spot" keep their punctuation and phrases can only match on word boundaries
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over word tokens for a fixed list of (multi-word) phrases.
+
+    Built once per process; `match` then finds every occurrence of every phrase in one pass over
+    the document's tokens, independent of the number of phrases.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        # Number of phrases ending at each node, including those reached through failure links
+        self.outputs: list[int] = [0]
+
+        for phrase in phrases:
+            tokens = tokenize(phrase)
+            if not tokens:
+                continue
+            node = 0
+            for token in tokens:
+                if token not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(0)
+                    self.goto[node][token] = len(self.goto) - 1
+                node = self.goto[node][token]
+            self.outputs[node] = 1
+
+        # Breadth-first failure links; children of the root fail back to the root
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token, 0)
+                self.outputs[child] += self.outputs[self.fail[child]]
+                queue.append(child)
+
+        # Tokens that occur in no phrase always lead back to the root
+        self.vocabulary = {token for edges in self.goto for token in edges}
+
+    def match(self, text: str) -> tuple[bool, int]:
+        """Return whether any phrase occurs in `text` and the total number of occurrences."""
+        goto, fail, outputs, vocabulary = self.goto, self.fail, self.outputs, self.vocabulary
+        tokens = tokenize(text)
+        # Most documents contain no phrase token at all; that check runs at C speed
+        if vocabulary.isdisjoint(tokens):
+            return False, 0
+        count = 0
+        node = 0
+        for token in tokens:
+            if token not in vocabulary:
+                node = 0
+                continue
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            count += outputs[node]
+        return count > 0, count
@@ -0,0 +1,654 @@
+import os
+import math
+import time
+import concurrent.futures
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any
+from collections.abc import Callable, Iterable, Iterator
+
+import numpy as np
+from omegaconf import DictConfig, ListConfig, OmegaConf
+
+from cs336_data.utilities import extract_text_from_html_bytes, identify_language
+from cs336_data.utilities import mask_emails, mask_phone_numbers, mask_ips
+from cs336_data.utilities import classify_nsfw, classify_toxic_speech
+from cs336_data.utilities import gopher_quality_filter, classify_quality, classify_quality_batch
+from cs336_data.utilities import c4_filter_lines, count_sentences
+from cs336_data.utilities import load_bad_words
+from cs336_data.phrase_matcher import PhraseMatcher
+from cs336_data.quality_sketch import ScoreSketch
+from cs336_data.decontamination import NgramIndex, DEFAULT_NGRAM
+from cs336_data.worker_pool import PreloadedPool
+from cs336_data.utilities import load_fasttext_model
+from cs336_data.utilities import LID_MODEL_PATH, NSFW_MODEL_PATH, TOXIC_MODEL_PATH, QUALITY_MODEL_PATH
+
+
+@dataclass
+class Document:
+    url: str = ""
+    text: str = ""
+    raw: bytes | None = None
+    # Unread payload (e.g. a WARC record reader); only read once a stage needs the bytes
+    reader: Any = None
+    meta: dict = field(default_factory=dict)
+
+    def read_raw(self) -> bytes:
+        if self.raw is None and self.reader is not None:
+            self.raw = self.reader.read()
+            self.reader = None
+        return self.raw or b""
+
+
+# A stage function returns False to reject the document; transforms may rewrite `doc.text`.
+# It may also carry a `batch(docs, stats) -> list[bool]` attribute, which `Pipeline.process_batch`
+# calls once for all documents of a batch instead (e.g. to score them with one model call).
+StageFn = Callable[[Document, dict], bool]
+
+
+@dataclass
+class StageSpec:
+    name: str
+    factory: Callable[..., StageFn]
+    cost: float
+    reject_rate: float
+    transform: bool
+    side_effects: bool = False
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: StageFn
+    cost: float
+    reject_rate: float
+    transform: bool
+    stat: str
+    side_effects: bool = False
+
+
+STAGES: dict[str, StageSpec] = {}
+
+
+def register_stage(
+    name: str, cost: float, reject_rate: float = 0.0, transform: bool = False, side_effects: bool = False
+):
+    """Register a stage factory under `name`.
+
+    `cost` is the expected time per document in microseconds and `reject_rate` the expected fraction
+    of documents the stage drops; both only drive the default ordering and can be overridden per run.
+    Transforms rewrite the document and are never moved across. Stages with `side_effects` change
+    state that outlives the document (e.g. a seen-URL filter), so they never run on a document
+    another stage has rejected, even with `annotate_all`; in a sweep they still run on documents
+    only swept stages rejected, since other thresholds would keep them.
+    """
+    def decorator(factory):
+        STAGES[name] = StageSpec(name, factory, cost, reject_rate, transform, side_effects)
+        return factory
+    return decorator
+
+
+# Estimated (cost, reject_rate) of a stage
+StageEstimate = Callable[[Stage], tuple[float, float]]
+
+
+def declared_estimate(stage: Stage) -> tuple[float, float]:
+    return stage.cost, stage.reject_rate
+
+
+def order_stages(stages: list[Stage], estimate: StageEstimate = declared_estimate) -> list[Stage]:
+    """Order filters cheap-and-selective first without moving them across transforms.
+
+    Between two transforms, sorting independent filters by cost / reject_rate minimizes the
+    expected cost per document.
+    """
+    def rank(stage):
+        cost, reject_rate = estimate(stage)
+        return cost / reject_rate if reject_rate > 0 else math.inf
+
+    ordered, segment = [], []
+    for stage in stages:
+        if stage.transform:
+            ordered.extend(sorted(segment, key=rank))
+            ordered.append(stage)
+            segment = []
+        else:
+            segment.append(stage)
+    ordered.extend(sorted(segment, key=rank))
+    return ordered
+
+
+def expected_cost(stages: list[Stage], estimate: StageEstimate = declared_estimate) -> float:
+    """Expected cost per document of running `stages` in order, stopping at the first rejection."""
+    total, reach = 0.0, 1.0
+    for stage in stages:
+        cost, reject_rate = estimate(stage)
+        total += reach * cost
+        reach *= 1.0 - reject_rate
+    return total
+
+
+# Observations an adaptive pipeline needs before a stage's measured cost and rejection rate
+# outweigh the declared ones
+ADAPTIVE_PRIOR_DOCUMENTS = 10
+
+
+class Pipeline:
+    def __init__(
+        self,
+        stages: list[Stage],
+        reorder: bool = True,
+        annotate_all: bool = False,
+        adaptive: bool = False,
+        adapt_every: int = 1000,
+        profile: bool = False,
+        sweep_stages: Iterable[str] = (),
+    ):
+        self.stages = order_stages(stages) if reorder or adaptive else list(stages)
+        # Run every stage even after a rejection, so each document gets every score in `doc.meta`
+        self.annotate_all = annotate_all
+        # Time every stage and reorder the filters by their measured cost and rejection rate every
+        # `adapt_every` documents; filters between two transforms must be independent
+        self.adaptive = adaptive
+        self.adapt_every = adapt_every
+        # Time every stage like an adaptive pipeline, but keep the order
+        self.profile = profile
+        # Stages whose rejections do not stop a document, so a threshold sweep sees the scores of
+        # every document they could let through with other thresholds; every rejecting stage is
+        # listed in `doc.meta['rejected_stages']`
+        self.sweep_stages = set(sweep_stages)
+        # Stage name -> [calls, nanoseconds, rejections] seen by this pipeline
+        self.observed = {stage.name: [0, 0, 0] for stage in stages}
+        self.documents = 0
+
+    def observed_estimate(self, stage: Stage) -> tuple[float, float]:
+        """Measured (cost in microseconds, reject_rate) of a stage, starting from the declared values."""
+        calls, nanoseconds, rejections = self.observed[stage.name]
+        weight = calls + ADAPTIVE_PRIOR_DOCUMENTS
+        return ((nanoseconds / 1000 + stage.cost * ADAPTIVE_PRIOR_DOCUMENTS) / weight,
+                (rejections + stage.reject_rate * ADAPTIVE_PRIOR_DOCUMENTS) / weight)
+
+    def _observe(self, stage: Stage, stats: dict, calls: int, nanoseconds: int, rejections: int) -> None:
+        observed = self.observed[stage.name]
+        observed[0] += calls
+        observed[1] += nanoseconds
+        observed[2] += rejections
+        # Also counted in the stats, so `cascade_report` can merge them across workers
+        stats[f'cascade_{stage.name}_calls'] += calls
+        stats[f'cascade_{stage.name}_ns'] += nanoseconds
+        stats[f'cascade_{stage.name}_rejections'] += rejections
+
+    def _adapt(self, num_docs: int, stats: dict) -> None:
+        before = self.documents // self.adapt_every
+        self.documents += num_docs
+        if self.documents // self.adapt_every == before:
+            return
+        stages = order_stages(self.stages, self.observed_estimate)
+        if [stage.name for stage in stages] != [stage.name for stage in self.stages]:
+            stats['cascade_reorders'] += 1
+            self.stages = stages
+
+    def _run_stage(self, stage: Stage, doc: Document, stats: dict) -> bool:
+        if not (self.adaptive or self.profile):
+            return stage.fn(doc, stats)
+        start = time.perf_counter_ns()
+        passed = stage.fn(doc, stats)
+        self._observe(stage, stats, 1, time.perf_counter_ns() - start, not passed)
+        return passed
+
+    def _continues(self, doc: Document, sweep_stages: set[str]) -> bool:
+        if 'rejected_by' not in doc.meta:
+            return True
+        return bool(sweep_stages) and all(name in sweep_stages for name in doc.meta['rejected_stages'])
+
+    def process(self, doc: Document, stats: dict, sweep_stages: Iterable[str] | None = None) -> bool:
+        """Run every stage on one document, stopping at the first rejection unless `annotate_all`.
+
+        The counter of the first rejecting stage is recorded as `doc.meta['rejected_by']`.
+        `sweep_stages` overrides the pipeline's own for this call, so one pipeline can serve both
+        sweeps and normal runs.
+        """
+        sweep_stages = self.sweep_stages if sweep_stages is None else set(sweep_stages)
+        stats['documents'] += 1
+        if self.adaptive:
+            self._adapt(1, stats)
+        for stage in self.stages:
+            if stage.side_effects and not self._continues(doc, sweep_stages):
+                continue
+            if self._run_stage(stage, doc, stats):
+                continue
+            if 'rejected_by' not in doc.meta:
+                stats[stage.stat] += 1
+                doc.meta['rejected_by'] = stage.stat
+            if sweep_stages:
+                doc.meta.setdefault('rejected_stages', []).append(stage.name)
+            if not self.annotate_all and stage.name not in sweep_stages:
+                return False
+        if 'rejected_by' in doc.meta:
+            return False
+        stats['kept'] += 1
+        return True
+
+    def process_batch(
+        self, docs: list[Document], stats: dict, sweep_stages: Iterable[str] | None = None
+    ) -> list[bool]:
+        """`process` for a list of documents, run stage by stage so batched stages see every
+        document still in the running at once. Gives the same results as `process` on each
+        document in turn, as long as no two stages share state across documents."""
+        sweep_stages = self.sweep_stages if sweep_stages is None else set(sweep_stages)
+        stats['documents'] += len(docs)
+        if self.adaptive:
+            self._adapt(len(docs), stats)
+        active = docs
+        for stage in self.stages:
+            if not active:
+                break
+            running = [doc for doc in active if self._continues(doc, sweep_stages)] if stage.side_effects else active
+            if not running:
+                continue
+            batch_fn = getattr(stage.fn, 'batch', None)
+            start = time.perf_counter_ns()
+            passed = batch_fn(running, stats) if batch_fn is not None else [stage.fn(doc, stats) for doc in running]
+            if self.adaptive or self.profile:
+                self._observe(stage, stats, len(running), time.perf_counter_ns() - start, passed.count(False))
+            for doc, ok in zip(running, passed):
+                if ok:
+                    continue
+                if 'rejected_by' not in doc.meta:
+                    stats[stage.stat] += 1
+                    doc.meta['rejected_by'] = stage.stat
+                if sweep_stages:
+                    doc.meta.setdefault('rejected_stages', []).append(stage.name)
+            if not self.annotate_all:
+                active = [doc for doc in active if self._continues(doc, sweep_stages)]
+        kept = ['rejected_by' not in doc.meta for doc in docs]
+        stats['kept'] += sum(kept)
+        return kept
+
+    def run(
+        self,
+        docs: Iterable[Document],
+        stats: dict,
+        annotate: Callable[[Document, bool], None] | None = None,
+        batch_size: int = 1,
+    ) -> Iterator[Document]:
+        """Yield the kept documents; `annotate(doc, kept)` additionally sees every document. With
+        `batch_size > 1`, documents go through `process_batch` that many at a time."""
+        if batch_size > 1:
+            batches = ((chunk, self.process_batch(chunk, stats)) for chunk in _chunks(docs, batch_size))
+            results = ((doc, kept) for chunk, flags in batches for doc, kept in zip(chunk, flags))
+        else:
+            results = ((doc, self.process(doc, stats)) for doc in docs)
+        for doc, kept in results:
+            if annotate is not None:
+                annotate(doc, kept)
+            if kept:
+                yield doc
+
+
+def build_pipeline(config: dict | DictConfig, instantiate: bool = True) -> Pipeline:
+    """Build a pipeline from a config with a `stages` list; each entry names a registered stage and
+    may override `cost`, `reject_rate`, the rejection counter `stat`, set `enabled: false`, or pass
+    any other key to the stage factory. `annotate_all: true` scores rejected documents with every
+    stage as well; `sweep_stages` lists stages whose rejections do not stop a document (see
+    `cs336_data.threshold_sweep`).
+
+    With `instantiate=False` the stage factories are not called (no models are loaded); the result
+    only describes the stage order and counters.
+    """
+    config = to_config_dict(config)
+
+    stages = []
+    for entry in config['stages']:
+        params = dict(entry)
+        name = params.pop('name')
+        if not params.pop('enabled', True):
+            continue
+        if name not in STAGES:
+            raise KeyError(f"Unknown pipeline stage '{name}', registered stages: {sorted(STAGES)}")
+        spec = STAGES[name]
+        stages.append(Stage(
+            name=name,
+            cost=params.pop('cost', spec.cost),
+            reject_rate=params.pop('reject_rate', spec.reject_rate),
+            stat=params.pop('stat', f"{name}_rejected"),
+            transform=spec.transform,
+            fn=spec.factory(**params) if instantiate else None,
+            side_effects=spec.side_effects,
+        ))
+    return Pipeline(
+        stages,
+        reorder=config.get('reorder', True),
+        annotate_all=config.get('annotate_all', False),
+        adaptive=config.get('adaptive', False),
+        adapt_every=config.get('adapt_every', 1000),
+        sweep_stages=config.get('sweep_stages', ()),
+    )
+
+
+def cascade_report(pipeline: Pipeline, stats: dict) -> list[str]:
+    """Describe the measured cost and rejection rate of each stage of an adaptive pipeline (from
+    `stats`, which may be merged across workers), the order they call for, and its expected cost
+    per document next to that of the configured order."""
+    def measured(stage):
+        calls = stats[f'cascade_{stage.name}_calls']
+        if not calls:
+            return declared_estimate(stage)
+        return stats[f'cascade_{stage.name}_ns'] / calls / 1000, stats[f'cascade_{stage.name}_rejections'] / calls
+
+    lines = []
+    for stage in pipeline.stages:
+        cost, reject_rate = measured(stage)
+        lines.append(f"  {stage.name}: {cost:.1f} us/doc, rejects {reject_rate:.1%} "
+                     f"({stats[f'cascade_{stage.name}_calls']} calls)")
+    configured = order_stages(pipeline.stages)
+    chosen = order_stages(pipeline.stages, measured)
+    configured_cost, chosen_cost = expected_cost(configured, measured), expected_cost(chosen, measured)
+    saving = 1 - chosen_cost / configured_cost if configured_cost else 0.0
+    lines.append(f"  Configured order: {' -> '.join(stage.name for stage in configured)} ({configured_cost:.1f} us/doc)")
+    lines.append(f"  Measured order: {' -> '.join(stage.name for stage in chosen)} ({chosen_cost:.1f} us/doc, "
+                 f"{saving:.1%} saved, {stats['cascade_reorders']} reorders)")
+    return lines
+
+
+def to_config_dict(config: dict | DictConfig) -> dict:
+    if isinstance(config, (DictConfig, ListConfig)):
+        return OmegaConf.to_container(config, resolve=True)
+    return config
+
+
+def load_pipeline_config(config_path: str | os.PathLike) -> dict:
+    return to_config_dict(OmegaConf.load(config_path))
+
+
+def load_pipeline(config_path: str | os.PathLike) -> Pipeline:
+    return build_pipeline(load_pipeline_config(config_path))
+
+
+# Pipeline built once per worker process by `_init_parallel_worker`
+_WORKER_PIPELINE = None
+
+
+def _init_parallel_worker(config: dict):
+    global _WORKER_PIPELINE
+    # Building the stages loads each fastText model the pipeline needs, once per worker
+    _WORKER_PIPELINE = build_pipeline(config)
+
+
+def _process_chunk(docs: list[Document], return_rejected: bool = False) -> tuple[list[tuple[Document, bool]], dict]:
+    stats = defaultdict(int)
+    results = []
+    for doc, kept in zip(docs, _WORKER_PIPELINE.process_batch(docs, stats)):
+        if kept or return_rejected:
+            # Only the text and annotations go back to the writer
+            doc.raw = None
+            results.append((doc, kept))
+    return results, stats
+
+
+def _chunks(docs: Iterable[Document], chunk_size: int) -> Iterator[list[Document]]:
+    chunk = []
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_parallel(
+    config: dict | DictConfig,
+    docs: Iterable[Document],
+    stats: dict,
+    num_workers: int,
+    chunk_size: int = 64,
+    max_pending: int | None = None,
+    annotate: Callable[[Document, bool], None] | None = None,
+    preload: bool = False,
+) -> Iterator[Document]:
+    """Like `Pipeline.run`, but spreads chunks of documents over `num_workers` processes.
+
+    `docs` is read lazily in the calling process, at most `max_pending` chunks are in flight, and
+    kept documents are yielded in input order, so the output is identical to a sequential run.
+    Each chunk goes through `Pipeline.process_batch`, so batched stages score it in one call.
+    Documents must carry their payload in `raw`, since record readers cannot cross processes.
+    With `annotate`, rejected documents are sent back too and passed to `annotate(doc, kept)`.
+    With `preload`, the pipeline (and its models) is built once in this process and the workers are
+    forked from it, sharing the models copy-on-write instead of each loading its own.
+    """
+    config = to_config_dict(config)
+    max_pending = max_pending or 4 * num_workers
+    pending = deque()
+    if preload:
+        _init_parallel_worker(config)
+        executor = PreloadedPool(num_workers, start_method="fork")
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_parallel_worker,
+            initargs=(config,)
+        )
+    with executor:
+        for chunk in _chunks(docs, chunk_size):
+            pending.append(executor.submit(_process_chunk, chunk, annotate is not None))
+            if len(pending) >= max_pending:
+                yield from _merge_chunk(pending.popleft(), stats, annotate)
+        while pending:
+            yield from _merge_chunk(pending.popleft(), stats, annotate)
+
+
+def _merge_chunk(future: concurrent.futures.Future, stats: dict, annotate=None) -> Iterator[Document]:
+    results, chunk_stats = future.result()
+    for key, value in chunk_stats.items():
+        stats[key] += value
+    for doc, kept in results:
+        if annotate is not None:
+            annotate(doc, kept)
+        if kept:
+            yield doc
+
+
+# Registered stages
+
+@register_stage("extract", cost=500, transform=True)
+def extract_stage():
+    def fn(doc, stats):
+        doc.text = extract_text_from_html_bytes(doc.read_raw()) or ""
+        return True
+    return fn
+
+
+@register_stage("decode", cost=20, transform=True)
+def decode_stage(encoding: str = "utf-8"):
+    def fn(doc, stats):
+        doc.text = doc.read_raw().decode(encoding, errors='ignore')
+        return True
+    return fn
+
+
+@register_stage("lid", cost=100, reject_rate=0.5)
+def lid_stage(language: str = "en", threshold: float = 0.8):
+    load_fasttext_model(LID_MODEL_PATH)
+
+    def fn(doc, stats):
+        language_code, confidence_score = identify_language(doc.text) if doc.text else ("unknown", 0.0)
+        doc.meta['language'], doc.meta['language_score'] = language_code, confidence_score
+        return language_code == language and confidence_score > threshold
+    return fn
+
+
+@register_stage("pii", cost=150, transform=True)
+def pii_stage():
+    def fn(doc, stats):
+        masked_text_emails, num_emails = mask_emails(doc.text)
+        masked_text_phones, num_phones = mask_phone_numbers(masked_text_emails)
+        masked_text_ips, num_ips = mask_ips(masked_text_phones)
+
+        stats['emails'] += num_emails
+        stats['phones'] += num_phones
+        stats['ips'] += num_ips
+        doc.meta.update(emails=num_emails, phones=num_phones, ips=num_ips)
+        doc.text = masked_text_ips
+        return True
+    return fn
+
+
+@register_stage("gopher", cost=200, reject_rate=0.4)
+def gopher_stage(
+    min_words: int = 50,
+    max_words: int = 100000,
+    min_mean_word_length: float = 3,
+    max_mean_word_length: float = 10,
+    max_ellipsis_lines: float = 0.3,
+    min_alphabetic_words: float = 0.8,
+):
+    bounds = dict(
+        min_words=min_words,
+        max_words=max_words,
+        min_mean_word_length=min_mean_word_length,
+        max_mean_word_length=max_mean_word_length,
+        max_ellipsis_lines=max_ellipsis_lines,
+        min_alphabetic_words=min_alphabetic_words,
+    )
+
+    def fn(doc, stats):
+        doc.meta['gopher_pass'] = gopher_quality_filter(doc.text, **bounds)
+        return doc.meta['gopher_pass']
+    return fn
+
+
+@register_stage("harmful", cost=250, reject_rate=0.02)
+def harmful_stage(nsfw_threshold: float = 0.5, toxic_threshold: float = 0.5):
+    nsfw, toxic = nsfw_stage(nsfw_threshold), toxic_stage(toxic_threshold)
+
+    def fn(doc, stats):
+        # The toxicity model only runs on documents the NSFW model lets through
+        return nsfw(doc, stats) and toxic(doc, stats)
+    return fn
+
+
+# `harmful` as two stages, so an adaptive pipeline can order them on their own
+@register_stage("nsfw", cost=125, reject_rate=0.01)
+def nsfw_stage(threshold: float = 0.5):
+    load_fasttext_model(NSFW_MODEL_PATH)
+
+    def fn(doc, stats):
+        doc.meta['nsfw_label'], doc.meta['nsfw_score'] = classify_nsfw(doc.text)
+        return not (doc.meta['nsfw_label'] == "nsfw" and doc.meta['nsfw_score'] > threshold)
+    return fn
+
+
+@register_stage("toxic", cost=125, reject_rate=0.01)
+def toxic_stage(threshold: float = 0.5):
+    load_fasttext_model(TOXIC_MODEL_PATH)
+
+    def fn(doc, stats):
+        doc.meta['toxic_label'], doc.meta['toxic_score'] = classify_toxic_speech(doc.text)
+        return not (doc.meta['toxic_label'] == "toxic" and doc.meta['toxic_score'] > threshold)
+    return fn
+
+
+@register_stage("quality", cost=150, reject_rate=0.5)
+def quality_stage(label: str = "wiki", threshold: float = 0.5):
+    load_fasttext_model(QUALITY_MODEL_PATH)
+
+    def fn(doc, stats):
+        quality_label, quality_score = classify_quality(doc.text)
+        doc.meta['quality_label'], doc.meta['quality_score'] = quality_label, quality_score
+        return quality_label == label and quality_score >= threshold
+    return fn
+
+
+@register_stage("quality_score", cost=150, reject_rate=0.5)
+def quality_score_stage(label: str = "wiki", cutoff: float | None = None, num_bins: int = 1000):
+    """Score P(`label`) with the (binary) quality classifier as `doc.meta['quality_score']` and keep
+    documents scoring at least `cutoff`. Without a cutoff every document passes, so the scores can
+    pick one afterwards (e.g. the top fraction of a whole run). Scores also go into a mergeable
+    `ScoreSketch` in `stats['quality_sketch']`."""
+    load_fasttext_model(QUALITY_MODEL_PATH)
+
+    def record(docs, stats, predictions):
+        if not stats.get('quality_sketch'):
+            stats['quality_sketch'] = ScoreSketch(num_bins)
+        passed = []
+        for doc, (predicted, score) in zip(docs, predictions):
+            probability = score if predicted == label else 1.0 - score
+            doc.meta['quality_label'], doc.meta['quality_score'] = predicted, probability
+            stats['quality_sketch'].add(probability)
+            passed.append(cutoff is None or probability >= cutoff)
+        return passed
+
+    def fn(doc, stats):
+        return record([doc], stats, [classify_quality(doc.text)])[0]
+
+    fn.batch = lambda docs, stats: record(docs, stats, classify_quality_batch([doc.text for doc in docs]))
+    return fn
+
+
+@register_stage("c4_lines", cost=150, transform=True)
+def c4_lines_stage():
+    def fn(doc, stats):
+        doc.text, num_sentences = c4_filter_lines(doc.text, stats)
+        # Reused by `c4_sentences` as long as no later transform rewrites the text
+        doc.meta['c4_sentences'] = (doc.text, num_sentences)
+        return True
+    return fn
+
+
+@register_stage("c4_sentences", cost=50, reject_rate=0.3)
+def c4_sentences_stage(min_sentences: int = 5):
+    def fn(doc, stats):
+        counted_text, num_sentences = doc.meta.get('c4_sentences', (None, 0))
+        if counted_text is not doc.text:
+            num_sentences = count_sentences(doc.text)
+        doc.meta['num_sentences'] = num_sentences
+        return num_sentences >= min_sentences
+    return fn
+
+
+@register_stage("bad_words", cost=40, reject_rate=0.05)
+def bad_words_stage(path: str = "cs336-basics/bad_words_en.txt"):
+    matcher = PhraseMatcher(load_bad_words(path))
+
+    def fn(doc, stats):
+        matched, count = matcher.match(doc.text)
+        stats['bad_word_matches'] += count
+        doc.meta['bad_word_matches'] = count
+        return not matched
+    return fn
+
+
+# Index of evaluation-set n-grams, written by cs336-basics/decontaminate_paloma.py
+PALOMA_NGRAM_INDEX = "cs336-basics/paloma_ngrams.npy"
+
+
+@register_stage("decontaminate", cost=30, reject_rate=0.001)
+def decontaminate_stage(path: str = PALOMA_NGRAM_INDEX, n: int = DEFAULT_NGRAM, max_overlaps: int = 0):
+    """Drop documents sharing more than `max_overlaps` word n-grams with the evaluation set."""
+    index = NgramIndex(path, n)
+
+    def fn(doc, stats):
+        overlaps = index.count_overlaps(doc.text)
+        doc.meta['eval_overlaps'] = overlaps
+        stats['eval_overlapping_ngrams'] += overlaps
+        return overlaps <= max_overlaps
+    return fn
+
+
+@register_stage("decontaminate_lines", cost=30, transform=True)
+def decontaminate_lines_stage(path: str = PALOMA_NGRAM_INDEX, n: int = DEFAULT_NGRAM):
+    """Mask overlaps with the evaluation set by removing the lines that contain them; n-grams do not
+    span lines here."""
+    index = NgramIndex(path, n)
+
+    def fn(doc, stats):
+        lines = doc.text.split('\n')
+        overlaps = index.count_line_overlaps(lines)
+        if overlaps.any():
+            doc.text = '\n'.join(line for line, count in zip(lines, overlaps) if not count)
+            stats['eval_masked_lines'] += int(np.count_nonzero(overlaps))
+        doc.meta['eval_overlaps'] = int(overlaps.sum())
+        stats['eval_overlapping_ngrams'] += doc.meta['eval_overlaps']
+        return True
+    return fn
@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+
+
+class ScoreSketch:
+    """Mergeable streaming sketch of scores in [0, 1] (classifier probabilities).
+
+    A fixed-resolution histogram: quantiles are accurate to one bin width (1 / num_bins) no matter
+    how many scores were added, and merging two sketches is adding their counts, so per-worker
+    sketches combine exactly. `0 + sketch` works, so a sketch can be summed into a
+    `defaultdict(int)` stats dict like any other counter.
+    """
+
+    def __init__(self, num_bins: int = 1000, counts: np.ndarray | None = None):
+        self.num_bins = num_bins
+        self.counts = np.zeros(num_bins, dtype=np.int64) if counts is None else counts
+
+    def _bins(self, scores) -> np.ndarray:
+        return np.clip((np.asarray(scores, dtype=np.float64) * self.num_bins).astype(np.int64), 0, self.num_bins - 1)
+
+    def add(self, score: float) -> None:
+        self.counts[min(max(int(score * self.num_bins), 0), self.num_bins - 1)] += 1
+
+    def add_many(self, scores) -> None:
+        self.counts += np.bincount(self._bins(scores), minlength=self.num_bins)
+
+    @classmethod
+    def from_scores(cls, scores, num_bins: int = 1000) -> 'ScoreSketch':
+        sketch = cls(num_bins)
+        sketch.add_many(scores)
+        return sketch
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def __add__(self, other):
+        if isinstance(other, int) and other == 0:
+            return ScoreSketch(self.num_bins, self.counts.copy())
+        if other.num_bins != self.num_bins:
+            raise ValueError(f"Cannot merge sketches with {self.num_bins} and {other.num_bins} bins")
+        return ScoreSketch(self.num_bins, self.counts + other.counts)
+
+    __radd__ = __add__
+
+    def quantile(self, q: float) -> float:
+        """Smallest bin edge below which at least a fraction `q` of the scores fall."""
+        cumulative = np.cumsum(self.counts)
+        return (int(np.searchsorted(cumulative, q * cumulative[-1])) + 1) / self.num_bins
+
+    def cutoff_for_top(self, fraction: float) -> float:
+        """Lower edge of the bin holding the boundary of the top `fraction` of scores; keeping scores
+        at or above it keeps at least that fraction."""
+        from_top = np.cumsum(self.counts[::-1])
+        i = int(np.searchsorted(from_top, math.ceil(fraction * from_top[-1])))
+        return (self.num_bins - 1 - min(i, self.num_bins - 1)) / self.num_bins
+
+    def histogram(self, num_bins: int = 10) -> list[int]:
+        """Counts over `num_bins` equal-width bins of [0, 1]."""
+        return [int(c) for c in self.counts.reshape(num_bins, -1).sum(axis=1)]
+
+
+def exact_cutoff_for_top(scores: np.ndarray, fraction: float) -> float:
+    """The score of the ceil(fraction * n)-th best document; keeping scores at or above it keeps the
+    top `fraction` (plus ties). Fractions above 1 keep everything."""
+    k = min(math.ceil(fraction * len(scores)), len(scores))
+    if k <= 0:
+        return math.inf
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
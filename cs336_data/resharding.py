@@ -0,0 +1,159 @@
+import os
+import json
+import math
+import contextlib
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from collections.abc import Iterable
+
+from cs336_data.codecs import Codec
+from cs336_data.manifest import atomic_write
+
+# Written next to the shards; lists every shard with its size and document count
+SHARD_MANIFEST_NAME = "shards.json"
+
+
+@dataclass
+class ShardInfo:
+    # File name, relative to the shard directory
+    path: str
+    # Non-empty lines, the unit parallel_tokenize_gz.py tokenizes as one document
+    documents: int
+    # Uncompressed text bytes
+    bytes: int
+    compressed_bytes: int
+
+
+def balanced_target(total: int, target: int) -> int:
+    """Per-shard size that splits `total` into as many shards as `target` would, but evenly,
+    instead of leaving a small remainder for the last shard."""
+    if total <= 0:
+        return max(target, 1)
+    return math.ceil(total / math.ceil(total / target))
+
+
+class ShardWriter:
+    """Write lines into numbered shards of about `target_bytes` text bytes or `target_documents`
+    documents each (whichever is reached first), regardless of which input the lines came from.
+
+    A shard is closed after the line that reaches its target, so shards hold whole lines and every
+    shard except the last is at least the target. Shards appear under their final names only once
+    complete; `close` writes the manifest (`SHARD_MANIFEST_NAME`) and returns the shard list.
+    """
+
+    def __init__(
+        self,
+        output_dir: str | os.PathLike,
+        prefix: str = "shard",
+        codec: Codec | None = None,
+        target_bytes: int | None = None,
+        target_documents: int | None = None,
+    ):
+        if target_bytes is None and target_documents is None:
+            raise ValueError("ShardWriter needs target_bytes or target_documents")
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+        self.codec = codec or Codec('none')
+        self.target_bytes = target_bytes
+        self.target_documents = target_documents
+        self.shards: list[ShardInfo] = []
+        self._stack = None
+        self._file = None
+        self._documents = 0
+        self._bytes = 0
+
+    def _shard_path(self, index: int) -> Path:
+        # '.final' keeps the shards matching the *.final.* inputs of parallel_tokenize_gz.py
+        return self.output_dir / f"{self.prefix}_{index:05d}.final{self.codec.suffix or '.txt'}"
+
+    def _open_shard(self) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._stack = contextlib.ExitStack()
+        self._file = self._stack.enter_context(
+            atomic_write(self._shard_path(len(self.shards)), 'wt', opener=self.codec.open, encoding='utf-8'))
+        self._documents = 0
+        self._bytes = 0
+
+    def _close_shard(self) -> None:
+        path = self._shard_path(len(self.shards))
+        self._stack.close()
+        self.shards.append(ShardInfo(path.name, self._documents, self._bytes, os.path.getsize(path)))
+        self._stack = self._file = None
+
+    def write(self, line: str) -> None:
+        if self._file is None:
+            self._open_shard()
+        self._file.write(line)
+        self._bytes += len(line.encode('utf-8'))
+        if line.strip():
+            self._documents += 1
+        if ((self.target_bytes is not None and self._bytes >= self.target_bytes)
+                or (self.target_documents is not None and self._documents >= self.target_documents)):
+            self._close_shard()
+
+    def writelines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.write(line)
+
+    def close(self) -> list[ShardInfo]:
+        if self._file is not None:
+            self._close_shard()
+        write_shard_manifest(self.output_dir, self.shards, self.target_bytes, self.target_documents)
+        return list(self.shards)
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.output_dir / SHARD_MANIFEST_NAME
+
+    def __enter__(self) -> 'ShardWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._stack is not None:
+            # Discard the unfinished shard
+            self._stack.__exit__(exc_type, exc, tb)
+
+
+def write_shard_manifest(
+    output_dir: str | os.PathLike,
+    shards: list[ShardInfo],
+    target_bytes: int | None = None,
+    target_documents: int | None = None,
+) -> Path:
+    """Write the manifest of `shards` (files in `output_dir`) and return its path."""
+    path = Path(output_dir) / SHARD_MANIFEST_NAME
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'target_bytes': target_bytes,
+        'target_documents': target_documents,
+        'documents': sum(shard.documents for shard in shards),
+        'bytes': sum(shard.bytes for shard in shards),
+        'shards': [asdict(shard) for shard in shards],
+    }
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return path
+
+
+def clear_final_outputs(output_dir: str | os.PathLike) -> list[Path]:
+    """Remove the outputs of an earlier run from `output_dir`: its manifest and every `*.final.*`
+    file, whether per-file outputs or shards, so a run in the other mode leaves none of them behind
+    for the readers of the directory. Returns the removed paths."""
+    output_dir = Path(output_dir)
+    removed = sorted(output_dir.glob("*.final.*"))
+    if (output_dir / SHARD_MANIFEST_NAME).exists():
+        removed.append(output_dir / SHARD_MANIFEST_NAME)
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def load_shard_manifest(shard_dir: str | os.PathLike) -> list[ShardInfo] | None:
+    """Shards listed in a directory's manifest, or None if it has none."""
+    path = Path(shard_dir) / SHARD_MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return [ShardInfo(**shard) for shard in json.load(f)['shards']]
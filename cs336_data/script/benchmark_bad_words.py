@@ -0,0 +1,49 @@
+import sys
+import time
+from pathlib import Path
+
+from cs336_data.utilities import load_bad_words
+from cs336_data.phrase_matcher import PhraseMatcher
+
+# Usage: python cs336_data/script/benchmark_bad_words.py [documents.txt ...]
+# Each non-empty line of the input files is one document (e.g. a decompressed .final.gz shard)
+bad_words_path = "cs336-basics/bad_words_en.txt"
+fixture_paths = ["tests/fixtures/moby_extracted.txt", "tests/fixtures/low_quality_cc.txt",
+                 "tests/fixtures/high_quality_wiki_reference.txt"]
+repeats = 3
+
+# Previous check from parallel_process_wets.py: substring search per phrase
+def contains_bad_word_loop(text, bad_words):
+    return any(word in text.lower() for word in bad_words)
+
+def load_documents(paths):
+    if paths:
+        documents = []
+        for path in paths:
+            with open(path, encoding='utf-8', errors='ignore') as f:
+                documents.extend(line for line in f if line.strip())
+        return documents
+    # Fixtures only: each file is one document, repeated to get a stable timing
+    return [Path(path).read_text(encoding='utf-8') for path in fixture_paths] * 200
+
+def benchmark(name, check, documents):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        flagged = sum(1 for document in documents if check(document))
+        best = min(best, time.perf_counter() - start)
+    megabytes = sum(len(document) for document in documents) / 1e6
+    print(f"{name:>14}: {best:.2f}s, {len(documents) / best:,.0f} docs/sec, {megabytes / best:.1f} MB/s, flagged {flagged}")
+    return best
+
+if __name__ == "__main__":
+    bad_words = load_bad_words(bad_words_path)
+    documents = load_documents(sys.argv[1:])
+    start = time.perf_counter()
+    matcher = PhraseMatcher(bad_words)
+    print(f"{len(bad_words)} phrases, automaton built in {(time.perf_counter() - start) * 1e3:.1f} ms, {len(documents)} documents")
+
+    loop_time = benchmark("substring loop", lambda text: contains_bad_word_loop(text, bad_words), documents)
+    matcher_time = benchmark("aho-corasick", lambda text: matcher.match(text)[0], documents)
+    # The loop also flags phrases inside longer words ("ass" in "class"); the matcher does not
+    print(f"Speedup: {loop_time / matcher_time:.2f}x")
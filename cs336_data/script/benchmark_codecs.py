@@ -0,0 +1,74 @@
+import os
+import sys
+import gzip
+import time
+import tempfile
+from pathlib import Path
+
+from cs336_data.codecs import Codec, open_input
+
+# Usage: python cs336_data/script/benchmark_codecs.py [cs336-basics/final_output/*.final.gz ...]
+# Inputs may be compressed; their text is recompressed with every codec below
+fixture_paths = ["tests/fixtures/moby_extracted.txt", "tests/fixtures/low_quality_cc.txt",
+                 "tests/fixtures/high_quality_wiki_reference.txt"]
+codec_specs = ["gzip:1:0", "gzip:6:0", "gzip:6:4", "gzip:9:0", "zstd:3:0", "zstd:3:4", "zstd:10:4", "zstd:19:4"]
+repeats = 3
+
+# Previous writer: Python's gzip module, one thread, default level 9
+class PythonGzip:
+    suffix = '.gz'
+
+    def open(self, path, mode='rt', **kwargs):
+        return gzip.open(path, mode, encoding='utf-8')
+
+def load_lines(paths):
+    if paths:
+        lines = []
+        for path in paths:
+            with open_input(path, 'rt', encoding='utf-8', errors='ignore') as f:
+                lines.extend(f)
+        return lines
+    # Fixtures only, repeated to get a stable timing; zstd's ratio is inflated by the repetition, so
+    # only the speeds are meaningful here
+    print("No input files given, using the test fixtures")
+    return [line for path in fixture_paths for line in open(path, encoding='utf-8')] * 50
+
+def best_of(fn):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark(name, codec, lines, text_megabytes, tmp_dir):
+    path = Path(tmp_dir) / f"output{codec.suffix}"
+
+    def write():
+        with codec.open(path, 'wt') as f:
+            f.writelines(lines)
+
+    def read():
+        with open_input(path, 'rt', encoding='utf-8') as f:
+            for _ in f:
+                pass
+
+    try:
+        write_time = best_of(write)
+    except Exception as exc:
+        print(f"{name:>16}: skipped ({exc})")
+        return
+    read_time = best_of(read)
+    ratio = text_megabytes * 1e6 / os.path.getsize(path)
+    print(f"{name:>16}: write {text_megabytes / write_time:7.1f} MB/s, read {text_megabytes / read_time:7.1f} MB/s, "
+          f"ratio {ratio:5.2f}x, {os.path.getsize(path) / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    lines = load_lines(sys.argv[1:])
+    text_megabytes = sum(len(line.encode('utf-8')) for line in lines) / 1e6
+    print(f"{len(lines)} lines, {text_megabytes:.1f} MB of text, {len(os.sched_getaffinity(0))} CPUs")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmark("python gzip:9", PythonGzip(), lines, text_megabytes, tmp_dir)
+        for spec in codec_specs:
+            benchmark(spec, Codec.parse(spec), lines, text_megabytes, tmp_dir)
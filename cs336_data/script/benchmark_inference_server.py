@@ -0,0 +1,71 @@
+import os
+import time
+import argparse
+import tempfile
+
+from cs336_data.inference_server import start_inference_server
+from cs336_data.utilities import INFERENCE_SOCKET_ENV, LID_MODEL_PATH, load_fasttext_model
+from cs336_data.worker_pool import PreloadedPool, unique_set_size
+
+# Usage: python cs336_data/script/benchmark_inference_server.py [--model lid.176.bin] [--workers 4]
+# Classifies the same documents with every worker holding its own copy of the model, then with all
+# workers sending their documents to one inference server, and reports throughput and total USS
+fixture_paths = ["tests/fixtures/moby_extracted.txt", "tests/fixtures/low_quality_cc.txt",
+                 "tests/fixtures/high_quality_wiki_reference.txt"]
+chunk_size = 64
+
+def load_documents(num_documents):
+    lines = [line.strip() for path in fixture_paths for line in open(path, encoding='utf-8') if line.strip()]
+    return [lines[i % len(lines)] for i in range(num_documents)]
+
+def init_worker(model_path, socket_path):
+    if socket_path:
+        os.environ[INFERENCE_SOCKET_ENV] = socket_path
+    load_fasttext_model(model_path)
+
+def classify_chunk(model_path, texts):
+    # One predict call per document, like the pipeline's stages
+    model = load_fasttext_model(model_path)
+    for text in texts:
+        model.predict(text)
+    return len(texts)
+
+def benchmark(name, model_path, documents, num_workers, socket_path=None, server=None):
+    chunks = [documents[i:i + chunk_size] for i in range(0, len(documents), chunk_size)]
+    with PreloadedPool(num_workers, start_method="fork", initializer=init_worker,
+                       initargs=(model_path, socket_path)) as pool:
+        # Start every worker before timing
+        list(pool.map(classify_chunk, [model_path] * num_workers, [chunks[0][:1]] * num_workers))
+        start = time.perf_counter()
+        classified = sum(pool.map(classify_chunk, [model_path] * len(chunks), chunks))
+        elapsed = time.perf_counter() - start
+        memory = pool.worker_memory()
+    total_uss = sum(uss or 0 for uss in memory.values())
+    line = f"{name:>20}: {classified / elapsed:9.0f} docs/s, workers USS {total_uss / 2**20:7.1f} MB"
+    if server is not None:
+        server_uss = unique_set_size(server.pid) or 0
+        line += f" + server {server_uss / 2**20:.1f} MB = {(total_uss + server_uss) / 2**20:.1f} MB"
+    print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-worker fastText models with a shared inference server")
+    parser.add_argument('--model', default=LID_MODEL_PATH)
+    parser.add_argument('--workers', type=int, default=len(os.sched_getaffinity(0)))
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay', type=float, default=0.002)
+    args = parser.parse_args()
+
+    documents = load_documents(args.documents)
+    model_path = os.path.abspath(args.model)
+    print(f"{len(documents)} documents, {args.workers} workers, {len(os.sched_getaffinity(0))} CPUs, "
+          f"model {args.model} ({os.path.getsize(model_path) / 2**20:.1f} MB)")
+
+    benchmark("per-worker models", model_path, documents, args.workers)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "fasttext.sock")
+        server = start_inference_server(socket_path, args.max_batch, args.max_delay)
+        try:
+            benchmark("inference server", model_path, documents, args.workers, socket_path, server)
+        finally:
+            server.terminate()
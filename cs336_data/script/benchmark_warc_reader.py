@@ -0,0 +1,47 @@
+import sys
+import gzip
+import time
+from fastwarc.warc import ArchiveIterator, WarcRecordType
+
+from cs336_data.warc_reader import iter_warc_records
+
+# Usage: python cs336_data/script/benchmark_warc_reader.py [path/to/sample.warc.gz]
+warc_file_path = sys.argv[1] if len(sys.argv) > 1 else "CC-MAIN-20250417135010-20250417165010-00065.warc.gz"
+repeats = 3
+
+# Previous reader: Python gzip, every record parsed, type checked through the headers
+def read_python_gzip(path):
+    count = 0
+    with gzip.open(path, 'rb') as warc_file:
+        for record in ArchiveIterator(warc_file):
+            if record.headers.get('WARC-Type') == 'response':
+                # Every header copied into a dict; a comprehension over the map gives keys that do not
+                # hash like equal str keys, so lookups in it would all miss
+                headers = record.headers.asdict()
+                # Response records all have a URI; counting them keeps the lookup from being skipped
+                count += bool(headers.get('WARC-Target-URI'))
+                record.reader.read()
+    return count
+
+# Native fastwarc streams, response records only, one header looked up
+def read_native(path):
+    count = 0
+    for record in iter_warc_records(path, record_types=WarcRecordType.response, parse_http=True):
+        count += bool(record.headers.get('WARC-Target-URI'))
+        record.reader.read()
+    return count
+
+def benchmark(name, reader):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        count = reader(warc_file_path)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:>12}: {count} records in {best:.2f}s ({count / best:,.0f} records/sec)")
+    return best
+
+if __name__ == "__main__":
+    print(f"Benchmarking {warc_file_path} (best of {repeats})")
+    python_time = benchmark("python gzip", read_python_gzip)
+    native_time = benchmark("native", read_native)
+    print(f"Speedup: {python_time / native_time:.2f}x")
@@ -1,50 +1,49 @@
 import re
-import gzip
 import pandas as pd
 import random
-from fastwarc.warc import ArchiveIterator
 
 from cs336_data.utilities import extract_text_from_html_bytes, identify_language
 from cs336_data.utilities import mask_emails, mask_phone_numbers, mask_ips
 from cs336_data.utilities import classify_nsfw, classify_toxic_speech
 from cs336_data.utilities import gopher_quality_filter
+from cs336_data.warc_index import ensure_warc_index, iter_indexed_records, sample_index_entries
 
 warc_file_path = "CC-MAIN-20250417135010-20250417165010-00065.warc.gz"
+# Only these WARC headers are read from each record
+header_fields = ['WARC-Target-URI', 'WARC-Record-ID', 'WARC-Date']
+# Responses sampled uniformly from the whole file, read by seeking to them through its index
+sample_count = 200
+sample_seed = 0
 
 def extract_warc(warc_file_path: str) -> list:
     records = []
-    with gzip.open(warc_file_path, 'rb') as warc_file:
-        iterator = ArchiveIterator(warc_file)
-        count = 0
-        for record in iterator:
-            if record.headers.get('WARC-Type') == 'response':
-                headers = {header: value for header, value in record.headers}
-                content = record.reader.read()
-                text = extract_text_from_html_bytes(content) or ""
-
-                # Identify language
-                language_code, confidence_score = identify_language(text) if text else ("unknown", 0.0)
-
-                # Mask PII
-                masked_text_emails, num_emails = mask_emails(text)
-                masked_text_phones, num_phones = mask_phone_numbers(masked_text_emails)
-                masked_text_ips, num_ips = mask_ips(masked_text_phones)
-
-                # Store record data
-                record_data = headers.copy()
-                record_data['original_text'] = text
-                record_data['masked_text'] = masked_text_ips
-                record_data['language_code'] = language_code
-                record_data['confidence_score'] = confidence_score
-                record_data['num_emails'] = num_emails
-                record_data['num_phones'] = num_phones
-                record_data['num_ips'] = num_ips
-
-                records.append(record_data)
-
-                count += 1
-                if count >= 200:  # Limit to 200 records
-                    break
+    ensure_warc_index(warc_file_path)
+    sample = sample_index_entries([warc_file_path], sample_count, record_type='response', seed=sample_seed)
+    iterator = iter_indexed_records(warc_file_path, [entry for _, entry in sample], parse_http=True)
+    for record in iterator:
+        headers = {header: record.headers.get(header) for header in header_fields}
+        content = record.reader.read()
+        text = extract_text_from_html_bytes(content) or ""
+
+        # Identify language
+        language_code, confidence_score = identify_language(text) if text else ("unknown", 0.0)
+
+        # Mask PII
+        masked_text_emails, num_emails = mask_emails(text)
+        masked_text_phones, num_phones = mask_phone_numbers(masked_text_emails)
+        masked_text_ips, num_ips = mask_ips(masked_text_phones)
+
+        # Store record data
+        record_data = headers.copy()
+        record_data['original_text'] = text
+        record_data['masked_text'] = masked_text_ips
+        record_data['language_code'] = language_code
+        record_data['confidence_score'] = confidence_score
+        record_data['num_emails'] = num_emails
+        record_data['num_phones'] = num_phones
+        record_data['num_ips'] = num_ips
+
+        records.append(record_data)
 
     return records
 
@@ -0,0 +1,213 @@
+import os
+import inspect
+import itertools
+from dataclasses import dataclass
+from typing import Any
+from collections.abc import Callable
+
+import numpy as np
+from omegaconf import OmegaConf
+
+from cs336_data.dry_run import GPT2_BYTES_PER_TOKEN
+from cs336_data.pipeline import STAGES, Document, to_config_dict
+from cs336_data.utilities import gopher_features
+
+
+@dataclass
+class SweepStage:
+    # Values the stage leaves in doc.meta (or derives from the text), by column name
+    features: Callable[[Document], dict[str, Any]]
+    # Mask of the documents the stage keeps, from those columns and the stage's parameters
+    keep: Callable[..., np.ndarray]
+
+
+def _meta(*keys):
+    return lambda doc: {key: doc.meta.get(key) for key in keys}
+
+
+def _classifier_keeps(columns, name, label, threshold):
+    # Missing scores (e.g. toxicity of documents `harmful` rejected as NSFW) count as a pass
+    scores = np.nan_to_num(columns[f'{name}_score'], nan=0.0)
+    return ~((columns[f'{name}_label'] == label) & (scores > threshold))
+
+
+def _gopher_keeps(columns, min_words, max_words, min_mean_word_length, max_mean_word_length,
+                  max_ellipsis_lines, min_alphabetic_words):
+    words = columns['gopher_words']
+    mean_word_length = columns['gopher_mean_word_length']
+    return ((words >= min_words) & (words <= max_words)
+            & (mean_word_length >= min_mean_word_length) & (mean_word_length <= max_mean_word_length)
+            & (columns['gopher_ellipsis_lines'] <= max_ellipsis_lines)
+            & (columns['gopher_alphabetic_words'] >= min_alphabetic_words))
+
+
+# Stages a sweep can re-evaluate with other parameters; `keep` mirrors each stage's rule
+SWEEP_STAGES = {
+    'lid': SweepStage(
+        _meta('language', 'language_score'),
+        lambda columns, language, threshold: (columns['language'] == language) & (columns['language_score'] > threshold),
+    ),
+    'nsfw': SweepStage(
+        _meta('nsfw_label', 'nsfw_score'),
+        lambda columns, threshold: _classifier_keeps(columns, 'nsfw', 'nsfw', threshold),
+    ),
+    'toxic': SweepStage(
+        _meta('toxic_label', 'toxic_score'),
+        lambda columns, threshold: _classifier_keeps(columns, 'toxic', 'toxic', threshold),
+    ),
+    'harmful': SweepStage(
+        _meta('nsfw_label', 'nsfw_score', 'toxic_label', 'toxic_score'),
+        lambda columns, nsfw_threshold, toxic_threshold: (_classifier_keeps(columns, 'nsfw', 'nsfw', nsfw_threshold)
+                                                          & _classifier_keeps(columns, 'toxic', 'toxic', toxic_threshold)),
+    ),
+    'quality': SweepStage(
+        _meta('quality_label', 'quality_score'),
+        lambda columns, label, threshold: (columns['quality_label'] == label) & (columns['quality_score'] >= threshold),
+    ),
+    'quality_score': SweepStage(
+        _meta('quality_score'),
+        lambda columns, cutoff: np.ones(len(columns['quality_score']), dtype=bool) if cutoff is None
+        else columns['quality_score'] >= cutoff,
+    ),
+    'c4_sentences': SweepStage(
+        _meta('num_sentences'),
+        lambda columns, min_sentences: columns['num_sentences'] >= min_sentences,
+    ),
+    # Measured on the final text, which is what gopher saw as long as no transform runs after it
+    'gopher': SweepStage(lambda doc: gopher_features(doc.text), _gopher_keeps),
+}
+
+
+def load_sweep_grid(path: str | os.PathLike) -> dict[str, dict[str, list]]:
+    """Read a grid of stage name -> parameter -> values to try (a single value is a list of one)."""
+    grid = OmegaConf.to_container(OmegaConf.load(path), resolve=True)
+    for stage, params in grid.items():
+        if stage not in SWEEP_STAGES:
+            raise KeyError(f"Stage '{stage}' cannot be swept, sweepable stages: {sorted(SWEEP_STAGES)}")
+        grid[stage] = {name: values if isinstance(values, list) else [values] for name, values in params.items()}
+    return grid
+
+
+def stage_parameters(config: dict, stage: str) -> dict[str, Any]:
+    """Parameters `stage` runs with in a pipeline config: its factory's defaults, overridden by the
+    config entry."""
+    spec = STAGES[stage]
+    params = {name: parameter.default for name, parameter in inspect.signature(spec.factory).parameters.items()}
+    for entry in to_config_dict(config)['stages']:
+        if entry['name'] == stage and entry.get('enabled', True):
+            params.update((key, value) for key, value in entry.items() if key in params)
+            return params
+    raise KeyError(f"Stage '{stage}' is not enabled in the pipeline config")
+
+
+def grid_configurations(grid: dict[str, dict[str, list]]) -> list[dict[tuple[str, str], Any]]:
+    """Every combination of the grid's values, as (stage, parameter) -> value."""
+    keys = [(stage, name) for stage, params in grid.items() for name in params]
+    values = [grid[stage][name] for stage, name in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+class FeatureTable:
+    """Columns of the features the swept stages need, one row per document no other stage rejected.
+
+    Add every document after `Pipeline.process` with `sweep_stages` set to the swept stages (it
+    can be passed as an `annotate` callback); rows from several workers combine with `extend`.
+    """
+
+    def __init__(self, stages: list[str]):
+        self.stages = list(stages)
+        self.columns = {'text_bytes': []}
+        # Every document added, including those another stage rejected
+        self.documents = 0
+
+    def add(self, doc: Document, kept: bool | None = None) -> None:
+        self.documents += 1
+        if any(name not in self.stages for name in doc.meta.get('rejected_stages', ())):
+            return
+        if 'rejected_by' in doc.meta and 'rejected_stages' not in doc.meta:
+            # Rejected by a pipeline that was not sweeping
+            return
+        row = {'text_bytes': len(doc.text.encode('utf-8')) + 1}
+        for stage in self.stages:
+            row.update(SWEEP_STAGES[stage].features(doc))
+        for name, value in row.items():
+            self.columns.setdefault(name, []).append(value)
+
+    def extend(self, other: 'FeatureTable') -> None:
+        self.documents += other.documents
+        for name, values in other.columns.items():
+            self.columns.setdefault(name, []).extend(values)
+
+    def __len__(self) -> int:
+        return len(self.columns['text_bytes'])
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        arrays = {}
+        for name, values in self.columns.items():
+            if values and all(value is None or isinstance(value, str) for value in values):
+                arrays[name] = np.array(values, dtype=object)
+            else:
+                arrays[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        return arrays
+
+
+@dataclass
+class SweepResult:
+    # (stage, parameter) -> value of this configuration
+    params: dict[tuple[str, str], Any]
+    documents: int
+    bytes: int
+    tokens: float
+
+
+def sweep(
+    table: FeatureTable,
+    config: dict,
+    grid: dict[str, dict[str, list]],
+    bytes_per_token: float = GPT2_BYTES_PER_TOKEN,
+) -> list[SweepResult]:
+    """Documents, text bytes and estimated tokens the pipeline of `config` would keep with every
+    configuration of `grid`. Each stage's mask is computed once per distinct parameter combination
+    of that stage and combined with the others per configuration."""
+    columns = table.arrays()
+    text_bytes = columns['text_bytes'].astype(np.int64) if len(table) else np.zeros(0, dtype=np.int64)
+    base = {stage: stage_parameters(config, stage) for stage in grid}
+    masks = {}
+    results = []
+    for configuration in grid_configurations(grid):
+        keep = np.ones(len(table), dtype=bool)
+        for stage in grid:
+            params = dict(base[stage])
+            params.update((name, value) for (swept_stage, name), value in configuration.items() if swept_stage == stage)
+            key = (stage, tuple(sorted(params.items(), key=lambda item: item[0])))
+            if key not in masks:
+                sweep_stage = SWEEP_STAGES[stage]
+                accepted = inspect.signature(sweep_stage.keep).parameters
+                masks[key] = np.asarray(sweep_stage.keep(columns, **{name: value for name, value in params.items()
+                                                                     if name in accepted}), dtype=bool)
+            keep &= masks[key]
+        kept_bytes = int(text_bytes[keep].sum())
+        results.append(SweepResult(configuration, int(keep.sum()), kept_bytes, kept_bytes / bytes_per_token))
+    return results
+
+
+def format_sweep(results: list[SweepResult], table: FeatureTable, config: dict) -> list[str]:
+    """One row per configuration; '*' marks the one the pipeline config uses."""
+    if not results:
+        return ["Empty grid"]
+    keys = list(results[0].params)
+    current = {(stage, name): stage_parameters(config, stage)[name] for stage, name in keys}
+    names = [f"{stage}.{name}" for stage, name in keys]
+    widths = [max(len(name), 8) for name in names]
+    lines = [
+        f"{len(results)} configurations over {table.documents:,} documents "
+        f"({len(table):,} not rejected by the stages that are not swept)",
+        "  " + "  ".join(f"{name:>{width}}" for name, width in zip(names, widths))
+        + f"  {'documents':>10}  {'kept':>6}  {'MB':>10}  {'tokens':>14}",
+    ]
+    for result in results:
+        marker = "*" if result.params == current else " "
+        values = "  ".join(f"{str(result.params[key]):>{width}}" for key, width in zip(keys, widths))
+        lines.append(f"{marker} {values}  {result.documents:>10,}  {result.documents / max(table.documents, 1):>6.1%}"
+                     f"  {result.bytes / 2**20:>10,.2f}  {result.tokens:>14,.0f}")
+    return lines
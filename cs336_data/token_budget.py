@@ -0,0 +1,51 @@
+import multiprocessing
+
+from cs336_data.dry_run import GPT2_BYTES_PER_TOKEN
+
+
+class TokenBudget:
+    """Token budget with a counter of the text kept so far, shared by every worker of a process pool,
+    and a projection of how many tokens the work scheduled so far will yield.
+
+    Workers `add` the text bytes they keep and the input bytes they have read as they go. The
+    scheduler `schedule`s the input bytes of each unit it hands out (in the process that created
+    the budget) and stops handing out new work once `met`: the input scheduled but not read yet is
+    assumed to yield text at the rate observed so far. Tokens are estimated from text bytes.
+
+    Like `SharedBloomFilter`, the counter has to reach the workers at process creation time; pass
+    the pool's multiprocessing `context` when its workers are not forked from this process.
+    """
+
+    def __init__(self, tokens: int, bytes_per_token: float = GPT2_BYTES_PER_TOKEN, context=None):
+        assert tokens > 0, "the token budget must be positive"
+        context = context or multiprocessing
+        self.tokens = tokens
+        self.bytes_per_token = bytes_per_token
+        # Kept text bytes and input bytes read, by all workers
+        self.counts = context.RawArray("q", 2)
+        self.lock = context.Lock()
+        self.scheduled_bytes = 0
+
+    def add(self, kept_bytes: int, input_bytes: int) -> None:
+        with self.lock:
+            self.counts[0] += kept_bytes
+            self.counts[1] += input_bytes
+
+    def schedule(self, input_bytes: int) -> None:
+        self.scheduled_bytes += input_bytes
+
+    @property
+    def kept_tokens(self) -> float:
+        return self.counts[0] / self.bytes_per_token
+
+    def projected_tokens(self) -> float:
+        """Tokens kept so far plus those expected from the input scheduled but not read yet."""
+        with self.lock:
+            kept_bytes, read_bytes = self.counts[0], self.counts[1]
+        if read_bytes == 0:
+            return kept_bytes / self.bytes_per_token
+        unread = max(self.scheduled_bytes - read_bytes, 0)
+        return (kept_bytes + kept_bytes / read_bytes * unread) / self.bytes_per_token
+
+    def met(self) -> bool:
+        return self.projected_tokens() >= self.tokens
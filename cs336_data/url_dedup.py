@@ -0,0 +1,91 @@
+import math
+import multiprocessing
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import mmh3
+
+# Query parameters that only track the visitor and never change the page content
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "ref", "sessionid", "phpsessid"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonicalize a URL so that trivially different spellings of the same page compare equal."""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url.lower()
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ]
+    query.sort()
+
+    # The scheme is dropped: http/https captures of the same page are the same document
+    normalized = host + path
+    if query:
+        normalized += "?" + urlencode(query)
+    return normalized
+
+
+def hash_url(url: str) -> tuple[int, int]:
+    """128-bit hash of the normalized URL, as the two 64-bit halves used by `SharedBloomFilter`."""
+    return mmh3.hash64(normalize_url(url), signed=False)
+
+
+class SharedBloomFilter:
+    """Fixed-size Bloom filter living in shared memory, usable from every worker of a process pool.
+
+    The bit array is a `multiprocessing.RawArray`, so it has to reach the workers at process creation
+    time (e.g. through `ProcessPoolExecutor(initializer=..., initargs=(bloom,))`). Pass the pool's
+    multiprocessing `context` when its workers are not forked from this process.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-3, context=None):
+        assert capacity > 0 and 0 < error_rate < 1, "capacity must be positive and error_rate in (0, 1)"
+        context = context or multiprocessing
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = context.RawArray("B", (self.num_bits + 7) // 8)
+        self.lock = context.Lock()
+
+    def _positions(self, h1: int, h2: int) -> list[int]:
+        # Kirsch-Mitzenmacher double hashing: k positions from one 128-bit hash
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        positions = self._positions(*mmh3.hash64(key, signed=False))
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, key: str) -> bool:
+        """Insert key and return True if it was (probably) already present."""
+        return self.add_hash(*mmh3.hash64(key, signed=False))
+
+    def add_hash(self, h1: int, h2: int) -> bool:
+        """Like `add`, for a key already hashed with `mmh3.hash64(key, signed=False)` (see `hash_url`)."""
+        positions = self._positions(h1, h2)
+        with self.lock:
+            seen = all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions)
+            if not seen:
+                for p in positions:
+                    self.bits[p >> 3] |= 1 << (p & 7)
+        return seen
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.bits)
@@ -3,17 +3,42 @@ import re
 import hashlib
 import fasttext
 from typing import Any
+from collections.abc import Callable, Iterable, Iterator
 from pathlib import Path
-from collections import defaultdict
 from resiliparse.parse.encoding import detect_encoding, bytes_to_str
 from resiliparse.extract.html2text import extract_plain_text
 
+LID_MODEL_PATH = "lid.176.bin"
+NSFW_MODEL_PATH = "jigsaw_fasttext_bigrams_nsfw_final.bin"
+TOXIC_MODEL_PATH = "jigsaw_fasttext_bigrams_hatespeech_final.bin"
+QUALITY_MODEL_PATH = "output/quality_classifier.bin"
+
+# Experimental and off unless set: Unix socket of a running inference server (python -m
+# cs336_data.inference_server) that serves the models instead of every process loading its own.
+# It keeps one copy of each model however many processes use it, but predicts several times slower
+# than a local model (cs336_data/script/benchmark_inference_server.py), and workers forked from a
+# preloaded parent already share its models copy-on-write
+INFERENCE_SOCKET_ENV = "CS336_EXPERIMENTAL_FASTTEXT_SOCKET"
+
+# fastText models loaded by this process, keyed by path
+_MODELS = {}
+
+def load_fasttext_model(path: str):
+    if path not in _MODELS:
+        socket_path = os.environ.get(INFERENCE_SOCKET_ENV)
+        if socket_path:
+            from cs336_data.inference_server import RemoteModel, shared_client
+            _MODELS[path] = RemoteModel(shared_client(socket_path), path)
+        else:
+            _MODELS[path] = fasttext.load_model(path)
+    return _MODELS[path]
+
 def extract_text_from_html_bytes(html_bytes: bytes) -> str | None:
     decoded = bytes_to_str(html_bytes, detect_encoding(html_bytes))
     return extract_plain_text(decoded)
 
 def identify_language(text: str) -> tuple[Any, float]:
-    model = fasttext.load_model("lid.176.bin")
+    model = load_fasttext_model(LID_MODEL_PATH)
     # Remove newlines by replacing them with spaces
     cleaned_text = text.replace('\n', ' ').strip()
     # Predict language, take first label and score
@@ -53,58 +78,178 @@ def mask_ips(text: str) -> tuple[str, int]:
     return masked_text, len(ips)
 
 def classify_nsfw(text: str) -> tuple[Any, float]:
-    model = fasttext.load_model("jigsaw_fasttext_bigrams_nsfw_final.bin")
+    model = load_fasttext_model(NSFW_MODEL_PATH)
     cleaned_text = text.replace('\n', ' ').strip()
     predictions, scores = model.predict(cleaned_text)
     predicted_language = predictions[0].replace('__label__', '')
     return predicted_language, scores[0]
 
 def classify_toxic_speech(text: str) -> tuple[Any, float]:
-    model = fasttext.load_model("jigsaw_fasttext_bigrams_hatespeech_final.bin")
+    model = load_fasttext_model(TOXIC_MODEL_PATH)
     cleaned_text = text.replace('\n', ' ').strip()
     predictions, scores = model.predict(cleaned_text)
     predicted_language = predictions[0].replace('__label__', '')
     return predicted_language, scores[0]
 
-def gopher_quality_filter(text: str) -> bool:
+def gopher_quality_filter(
+    text: str,
+    min_words: int = 50,
+    max_words: int = 100000,
+    min_mean_word_length: float = 3,
+    max_mean_word_length: float = 10,
+    max_ellipsis_lines: float = 0.3,
+    min_alphabetic_words: float = 0.8,
+) -> bool:
     words = text.split()
-    # Check if the number of words is less than 50 or more than 100,000
-    if len(words) < 50 or len(words) > 100000:
+    # Check if the number of words is less than 50 or more than 100,000 (by default)
+    if len(words) < min_words or len(words) > max_words:
         return False
 
-    # Check if the mean word length is outside the range of 3 to 10 characters
+    # Check if the mean word length is outside the range of 3 to 10 characters (by default)
     mean_word_length = sum(map(len, words)) / len(words)
-    if mean_word_length < 3 or mean_word_length > 10:
+    if mean_word_length < min_mean_word_length or mean_word_length > max_mean_word_length:
         return False
 
-    # Check if more than 30% of lines end with an ellipsis
+    # Check if more than 30% (by default) of lines end with an ellipsis
     lines = text.split('\n')
     ellipsis_lines = sum(1 for line in lines if line.rstrip().endswith("..."))
-    if ellipsis_lines / len(lines) > 0.3:
+    if ellipsis_lines / len(lines) > max_ellipsis_lines:
         return False
 
-    # Check if less than 80% of words have at least one alphabetic character
+    # Check if less than 80% (by default) of words have at least one alphabetic character
     alphabetic_words = sum(1 for word in words if re.search('[a-zA-Z]', word))
-    if alphabetic_words / len(words) < 0.8:
+    if alphabetic_words / len(words) < min_alphabetic_words:
         return False
 
     return True
 
+def gopher_features(text: str) -> dict[str, float]:
+    """Every quantity `gopher_quality_filter` bounds, so other bounds can be tried without the text."""
+    words = text.split()
+    lines = text.split('\n')
+    return {
+        'gopher_words': len(words),
+        'gopher_mean_word_length': sum(map(len, words)) / len(words) if words else 0.0,
+        'gopher_ellipsis_lines': sum(1 for line in lines if line.rstrip().endswith("...")) / len(lines),
+        'gopher_alphabetic_words': sum(1 for word in words if re.search('[a-zA-Z]', word)) / len(words) if words else 0.0,
+    }
+
+# C4 heuristic functions
+C4_LINE_ENDINGS = ('.', '!', '?', '"', "’", "”")
+# Whitespace after a '.' or '?' that does not close an abbreviation like "e.g." or "Mr."
+SENTENCE_BOUNDARY = re.compile(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s')
+# Same look-behinds at the end of a line: the newline joining it to the next kept line splits there
+SENTENCE_BOUNDARY_AT_END = re.compile(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\Z')
+
+def count_sentences(text: str) -> int:
+    return len(SENTENCE_BOUNDARY.split(text.strip()))
+
+def c4_filter_lines(text: str, stats: dict | None = None) -> tuple[str, int]:
+    """Single pass of the C4 line rules over `text`.
+
+    Returns the cleaned text and `count_sentences` of it, counted line by line as lines are kept.
+    Dropped lines are counted per rule in `stats` (`c4_empty_lines`, `c4_no_punctuation_lines`,
+    `c4_short_lines`, `c4_junk_lines`) along with `c4_kept_lines`.
+    """
+    cleaned_lines = []
+    empty = no_punctuation = short = junk = 0
+    boundaries = 0
+    previous_ends_sentence = False
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            empty += 1
+            continue
+        if not line.endswith(C4_LINE_ENDINGS):
+            no_punctuation += 1
+            continue
+        # Only need to know whether there are at least 3 words
+        if len(line.split(None, 2)) < 3:
+            short += 1
+            continue
+        if '{' in line or '}' in line:
+            junk += 1
+            continue
+        lowered = line.lower()
+        if 'javascript' in lowered or 'lorem ipsum' in lowered:
+            junk += 1
+            continue
+        # Kept lines never start with whitespace, so no look-behind can reach across the joining newline
+        boundaries += previous_ends_sentence + len(SENTENCE_BOUNDARY.findall(line))
+        previous_ends_sentence = SENTENCE_BOUNDARY_AT_END.search(line) is not None
+        cleaned_lines.append(line)
+
+    if stats is not None:
+        stats['c4_empty_lines'] += empty
+        stats['c4_no_punctuation_lines'] += no_punctuation
+        stats['c4_short_lines'] += short
+        stats['c4_junk_lines'] += junk
+        stats['c4_kept_lines'] += len(cleaned_lines)
+    return '\n'.join(cleaned_lines), boundaries + 1
+
+def load_bad_words(file_path: str | os.PathLike) -> set[str]:
+    bad_words_set = set()
+    try:
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                phrase = line.strip().lower()
+                if phrase:
+                    bad_words_set.add(phrase)
+    except FileNotFoundError:
+        print(f"⚠️ 警告：找不到 {file_path}，使用默認過濾規則或請確認檔案存在。")
+    return bad_words_set
+
 def classify_quality(text: str) -> tuple[Any, float]:
-    model = fasttext.load_model("output/quality_classifier.bin")
+    model = load_fasttext_model(QUALITY_MODEL_PATH)
     cleaned_text = text.replace('\n', ' ').strip()
     predictions, scores = model.predict(cleaned_text)
     predicted_language = predictions[0].replace('__label__', '')
     return predicted_language, scores[0]
 
-def exact_line_deduplication(input_files: list[os.PathLike], output_directory: os.PathLike):
-    freq = defaultdict(int)
+def classify_quality_batch(texts: list[str]) -> list[tuple[Any, float]]:
+    """`classify_quality` for many texts with a single fastText call."""
+    model = load_fasttext_model(QUALITY_MODEL_PATH)
+    predictions, scores = model.predict([text.replace('\n', ' ').strip() for text in texts])
+    return [(labels[0].replace('__label__', ''), float(probs[0])) for labels, probs in zip(predictions, scores)]
+
+def read_lines(input_file: os.PathLike) -> Iterator[str]:
+    with open(input_file, encoding='utf-8') as f:
+        yield from f
+
+def line_hash(line: str) -> bytes:
+    return hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+
+def find_duplicate_lines(
+    input_files: list[os.PathLike], stats: dict | None = None, read_lines: Callable[[os.PathLike], Iterable[str]] = read_lines
+) -> set[bytes]:
+    """Hashes of the lines that occur more than once across `input_files`, i.e. the lines exact line
+    deduplication drops. Counts the non-empty lines read as `stats['lines']`. `read_lines(path)`
+    yields the lines of one file, e.g. only those of documents that pass a filter."""
+    seen, duplicates = set(), set()
+    num_lines = 0
     for input_file in input_files:
-        with open(input_file, 'r') as f:
-            for line in f.readlines():
-                sha256_hash = hashlib.sha256(line.encode("utf-8")).hexdigest()
-                freq[sha256_hash] += 1
-    
+        for line in read_lines(input_file):
+            h = line_hash(line)
+            if h in seen:
+                duplicates.add(h)
+            else:
+                seen.add(h)
+            if line.strip():
+                num_lines += 1
+    if stats is not None:
+        stats['lines'] += num_lines
+    return duplicates
+
+def iter_unique_lines(
+    input_file: os.PathLike, duplicate_lines: set[bytes], read_lines: Callable[[os.PathLike], Iterable[str]] = read_lines
+) -> Iterator[str]:
+    for line in read_lines(input_file):
+        if line_hash(line) not in duplicate_lines:
+            yield line
+
+def exact_line_deduplication(input_files: list[os.PathLike], output_directory: os.PathLike):
+    duplicate_lines = find_duplicate_lines(input_files)
+
     output_dir = Path(output_directory)
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -112,9 +257,5 @@ def exact_line_deduplication(input_files: list[os.PathLike], output_directory: o
         input_path = Path(input_file)
         output_path = output_dir / input_path.name
 
-        with open(input_file, 'r') as fin, \
-            open(output_path, 'w') as fout:
-            for line in fin:
-                sha256_hash = hashlib.sha256(line.encode("utf-8")).hexdigest()
-                if freq[sha256_hash] == 1:
-                    fout.write(line)
\ No newline at end of file
+        with open(output_path, 'w', encoding='utf-8') as fout:
+            fout.writelines(iter_unique_lines(input_file, duplicate_lines))
@@ -0,0 +1,165 @@
+import os
+import random
+import concurrent.futures
+from pathlib import Path
+from typing import NamedTuple
+from collections.abc import Iterable, Iterator
+
+from fastwarc.stream_io import BytesIOStream, GZipStream
+from fastwarc.warc import ArchiveIterator, WarcRecord, WarcRecordType
+
+from cs336_data.manifest import atomic_write
+from cs336_data.warc_reader import open_warc_stream, split_warc_file
+
+
+class IndexEntry(NamedTuple):
+    """One record of a WARC/WET file: where its gzip member starts, how many compressed bytes it
+    spans, its WARC-Type and WARC-Target-URI."""
+    offset: int
+    length: int
+    record_type: str
+    uri: str
+
+
+def warc_index_path(warc_path: str | os.PathLike) -> Path:
+    """The index sits next to the WARC file: `x.warc.gz` -> `x.warc.gz.cdx`."""
+    return Path(f"{warc_path}.cdx")
+
+
+def scan_warc_index(warc_path: str | os.PathLike) -> list[IndexEntry]:
+    """Index every record of a WARC/WET file with one sequential pass.
+
+    Offsets come from fastwarc's `stream_pos`, which is the compressed position of the record's
+    gzip member; a record ends where the next one starts.
+    """
+    starts = []
+    stream = open_warc_stream(warc_path)
+    try:
+        for record in ArchiveIterator(stream, record_types=WarcRecordType.any_type, parse_http=False):
+            starts.append((record.stream_pos, record.record_type.name, record.headers.get('WARC-Target-URI', '')))
+    finally:
+        stream.close()
+    ends = [offset for offset, _, _ in starts[1:]] + [os.path.getsize(warc_path)]
+    return [IndexEntry(offset, end - offset, record_type, uri) for (offset, record_type, uri), end in zip(starts, ends)]
+
+
+def write_warc_index(warc_path: str | os.PathLike) -> int:
+    """Scan a WARC/WET file and write its tab-separated index (offset, length, type, URI);
+    returns the number of records."""
+    entries = scan_warc_index(warc_path)
+    with atomic_write(warc_index_path(warc_path), 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(f"{entry.offset}\t{entry.length}\t{entry.record_type}\t{entry.uri}\n")
+    return len(entries)
+
+
+def build_warc_indexes(warc_paths: Iterable[str | os.PathLike], num_workers: int, rebuild: bool = False) -> dict[str, int]:
+    """Index several WARC/WET files in parallel, one file per task, skipping files that already
+    have a current index unless `rebuild`; returns the record count of each newly indexed file."""
+    todo = [str(path) for path in warc_paths if rebuild or not warc_index_path(path).exists()
+            or not index_is_current(path, load_warc_index(path))]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return dict(zip(todo, executor.map(write_warc_index, todo)))
+
+
+def load_warc_index(warc_path: str | os.PathLike) -> list[IndexEntry]:
+    entries = []
+    with open(warc_index_path(warc_path), encoding='utf-8') as f:
+        for line in f:
+            offset, length, record_type, uri = line.rstrip('\n').split('\t', 3)
+            entries.append(IndexEntry(int(offset), int(length), record_type, uri))
+    return entries
+
+
+def index_is_current(warc_path: str | os.PathLike, entries: list[IndexEntry]) -> bool:
+    """Whether `entries` end at the end of the file; an index that does not (e.g. left over from an
+    earlier download of the file) is stale."""
+    end = entries[-1].offset + entries[-1].length if entries else 0
+    return end == os.path.getsize(warc_path)
+
+
+def ensure_warc_index(warc_path: str | os.PathLike) -> list[IndexEntry]:
+    """The file's index, written first if it is missing or stale."""
+    if warc_index_path(warc_path).exists():
+        entries = load_warc_index(warc_path)
+        if index_is_current(warc_path, entries):
+            return entries
+    write_warc_index(warc_path)
+    return load_warc_index(warc_path)
+
+
+def iter_indexed_records(
+    warc_path: str | os.PathLike, entries: Iterable[IndexEntry], parse_http: bool = True
+) -> Iterator[WarcRecord]:
+    """Seek straight to each entry's gzip member and yield its record, without decompressing
+    anything in between. As with `iter_warc_records`, a record is only valid until the next one is
+    requested; `parse_http` only applies to response records."""
+    compressed = str(warc_path).endswith('.gz')
+    with open(warc_path, 'rb') as f:
+        for entry in entries:
+            f.seek(entry.offset)
+            stream = BytesIOStream(f.read(entry.length))
+            if compressed:
+                stream = GZipStream(stream)
+            parse = parse_http and entry.record_type in ('response', 'request')
+            record = next(iter(ArchiveIterator(stream, record_types=WarcRecordType.any_type, parse_http=parse)), None)
+            if record is not None:
+                yield record
+
+
+def sample_index_entries(
+    warc_paths: Iterable[str | os.PathLike], k: int, record_type: str | None = None, seed: int | None = None
+) -> list[tuple[str, IndexEntry]]:
+    """Uniformly sample `k` records (optionally only of one WARC-Type) across the indexed files,
+    as (path, entry) pairs sorted by file and offset so each file is read front to back once."""
+    population = [
+        (str(path), entry)
+        for path in warc_paths
+        for entry in load_warc_index(path)
+        if record_type is None or entry.record_type == record_type
+    ]
+    sample = random.Random(seed).sample(population, min(k, len(population)))
+    return sorted(sample, key=lambda item: (item[0], item[1].offset))
+
+
+def sample_index_fraction(
+    warc_paths: Iterable[str | os.PathLike], fraction: float, record_type: str | None = None, seed: int | None = None
+) -> tuple[int, dict[str, list[IndexEntry]]]:
+    """Sample `fraction` of the records (optionally only of one WARC-Type) of every indexed file,
+    so each file is represented in proportion to its size, loading one index at a time. A file's
+    fractional share of a record is rounded up or down at random, keeping the expected sample size
+    exactly `fraction` of the records. Returns the number of records sampled from and the sampled
+    entries of each file, sorted by offset."""
+    rng = random.Random(seed)
+    population = 0
+    sample = {}
+    for path in warc_paths:
+        entries = [entry for entry in load_warc_index(path) if record_type is None or entry.record_type == record_type]
+        population += len(entries)
+        share = fraction * len(entries)
+        k = min(int(share) + (rng.random() < share - int(share)), len(entries))
+        if k:
+            sample[str(path)] = sorted(rng.sample(entries, k), key=lambda entry: entry.offset)
+    return population, sample
+
+
+def index_byte_ranges(entries: list[IndexEntry], chunk_bytes: int) -> list[tuple[int, int]]:
+    """Group consecutive records into byte ranges of about `chunk_bytes`, like `split_warc_file`
+    but without probing the file for member boundaries."""
+    ranges = []
+    for entry in entries:
+        if ranges and entry.offset + entry.length - ranges[-1][0] <= chunk_bytes:
+            ranges[-1] = (ranges[-1][0], entry.offset + entry.length)
+        else:
+            ranges.append((entry.offset, entry.offset + entry.length))
+    return ranges
+
+
+def split_indexed_warc_file(warc_path: str | os.PathLike, chunk_bytes: int) -> list[tuple[int, int]]:
+    """`split_warc_file` from the index if the file has one, otherwise by probing the file."""
+    if not str(warc_path).endswith('.gz') or not warc_index_path(warc_path).exists():
+        return split_warc_file(warc_path, chunk_bytes)
+    entries = load_warc_index(warc_path)
+    if not entries or not index_is_current(warc_path, entries):
+        return split_warc_file(warc_path, chunk_bytes)
+    return index_byte_ranges(entries, chunk_bytes)
@@ -0,0 +1,92 @@
+import os
+import zlib
+from collections.abc import Iterator
+
+from fastwarc.stream_io import BytesIOStream, FileStream, GZipStream
+from fastwarc.warc import ArchiveIterator, WarcRecord, WarcRecordType
+
+# ID1, ID2 and the deflate method byte that start every gzip member
+GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def open_warc_stream(path: str | os.PathLike, byte_range: tuple[int, int] | None = None):
+    """Open a WARC/WET file with fastwarc's native streams, decompressing gzip in C instead of Python.
+
+    With `byte_range`, only the compressed bytes `[start, end)` are read; both ends must be member
+    boundaries as returned by `split_warc_file`.
+    """
+    if byte_range is None:
+        stream = FileStream(str(path), 'rb')
+    else:
+        start, end = byte_range
+        with open(path, 'rb') as f:
+            f.seek(start)
+            stream = BytesIOStream(f.read(end - start))
+    if str(path).endswith('.gz'):
+        stream = GZipStream(stream)
+    return stream
+
+
+def _starts_warc_member(f, offset: int) -> bool:
+    f.seek(offset)
+    try:
+        return zlib.decompressobj(wbits=31).decompress(f.read(1 << 16), 5) == b"WARC/"
+    except zlib.error:
+        return False
+
+
+def next_warc_member(f, offset: int, size: int, block_size: int = 1 << 16) -> int:
+    """Offset of the first gzip member at or after `offset` that starts a WARC record, or `size`.
+
+    Candidates are found by their magic bytes and confirmed by inflating the first few bytes, so
+    only a few blocks around `offset` are read.
+    """
+    pos = offset
+    while pos < size:
+        f.seek(pos)
+        # Two extra bytes so a magic number straddling the block end is still found
+        block = f.read(block_size + len(GZIP_MAGIC) - 1)
+        i = block.find(GZIP_MAGIC)
+        while i != -1:
+            if _starts_warc_member(f, pos + i):
+                return pos + i
+            i = block.find(GZIP_MAGIC, i + 1)
+        pos += block_size
+    return size
+
+
+def split_warc_file(path: str | os.PathLike, chunk_bytes: int) -> list[tuple[int, int]]:
+    """Split a WARC/WET file into byte ranges of about `chunk_bytes` compressed bytes that each hold
+    whole records, for `iter_warc_records(..., byte_range=...)`.
+
+    Common Crawl writes every record as its own gzip member, so ranges end on member boundaries.
+    Uncompressed and single-member files come back as one range.
+    """
+    size = os.path.getsize(path)
+    if not str(path).endswith('.gz') or size <= chunk_bytes:
+        return [(0, size)]
+    bounds = [0]
+    with open(path, 'rb') as f:
+        while bounds[-1] < size:
+            bounds.append(next_warc_member(f, bounds[-1] + chunk_bytes, size))
+    return list(zip(bounds, bounds[1:]))
+
+
+def iter_warc_records(
+    path: str | os.PathLike,
+    record_types: WarcRecordType = WarcRecordType.response,
+    parse_http: bool = True,
+    byte_range: tuple[int, int] | None = None,
+) -> Iterator[WarcRecord]:
+    """Yield the records of `record_types` from a WARC/WET file.
+
+    Records of other types are skipped by fastwarc before their headers reach Python. With
+    `parse_http`, `record.reader` starts at the HTTP body; WET conversion records have no HTTP
+    headers, so pass `parse_http=False` for them. Read headers with `record.headers.get(name)`
+    instead of copying them all. `byte_range` restricts reading to one range from `split_warc_file`.
+    """
+    stream = open_warc_stream(path, byte_range)
+    try:
+        yield from ArchiveIterator(stream, record_types=record_types, parse_http=parse_http)
+    finally:
+        stream.close()
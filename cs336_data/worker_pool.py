@@ -0,0 +1,133 @@
+import gc
+import os
+import time
+import statistics
+import importlib
+import multiprocessing
+import concurrent.futures
+from dataclasses import dataclass
+from collections.abc import Callable, Iterable
+
+
+def unique_set_size(pid: int | str = "self") -> int | None:
+    """Memory only this process uses (its private pages), in bytes; None where /proc is unavailable.
+
+    Pages a forked worker still shares copy-on-write with its parent are not counted.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return sum(int(line.split()[1]) * 1024 for line in f if line.startswith(("Private_Clean:", "Private_Dirty:")))
+    except OSError:
+        return None
+
+
+@dataclass
+class WorkerStartup:
+    pid: int
+    # Seconds from the creation of the pool until the worker's initializer returned
+    latency: float
+    # Unique set size right after the initializer, in bytes
+    uss: int | None
+
+
+def _init_pool_worker(created_at: float, startup_queue, initializer, initargs):
+    # A forked worker inherits the collector disabled while the pool started (see `PreloadedPool`);
+    # the preloaded objects stay frozen here
+    gc.enable()
+    if initializer is not None:
+        initializer(*initargs)
+    startup_queue.put(WorkerStartup(os.getpid(), time.time() - created_at, unique_set_size()))
+
+
+def _started() -> None:
+    pass
+
+
+class PreloadedPool(concurrent.futures.ProcessPoolExecutor):
+    """Process pool whose workers start with `preload` modules (and everything they load at import
+    time: models, lookup tables) already in memory, shared copy-on-write with the process they were
+    forked from instead of loaded once per worker.
+
+    With `start_method='fork'` the modules are imported here and every worker is forked while the
+    pool is built: a fork pool starts all its workers on the first task, so a no-op task is run
+    with the objects alive at that point moved out of the garbage collector's reach (`gc.freeze`),
+    so collections in the workers do not copy their pages, and handed back to it (`gc.unfreeze`)
+    in this process right after. With 'forkserver' the modules are imported once by the fork server
+    (`'__main__'` imports the running script), which is safe when this process has threads.
+    'spawn' imports everything again in every worker and is only useful as a baseline.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        start_method: str = "fork",
+        preload: Iterable[str] = (),
+        initializer: Callable | None = None,
+        initargs: tuple = (),
+    ):
+        context = multiprocessing.get_context(start_method)
+        preload = list(preload)
+        if start_method == "forkserver":
+            context.set_forkserver_preload(preload)
+        else:
+            for module in preload:
+                if module != "__main__":
+                    importlib.import_module(module)
+        self.start_method = start_method
+        self._startup_queue = context.SimpleQueue()
+        self._startups = []
+        if start_method != "fork":
+            self._start(max_workers, context, initializer, initargs)
+            return
+        # No collection between the freeze and the forks, so the workers' heap pages stay as they are
+        enabled = gc.isenabled()
+        gc.disable()
+        gc.freeze()
+        try:
+            self._start(max_workers, context, initializer, initargs)
+            self.submit(_started).result()
+        finally:
+            gc.unfreeze()
+            if enabled:
+                gc.enable()
+
+    def _start(self, max_workers, context, initializer, initargs) -> None:
+        super().__init__(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_pool_worker,
+            initargs=(time.time(), self._startup_queue, initializer, initargs),
+        )
+
+    def worker_startups(self) -> list[WorkerStartup]:
+        """Startup reports of the workers started so far."""
+        while not self._startup_queue.empty():
+            self._startups.append(self._startup_queue.get())
+        return list(self._startups)
+
+    def worker_memory(self) -> dict[int, int | None]:
+        """Current unique set size of every worker that has reported its startup, by pid (None
+        once it has exited)."""
+        return {startup.pid: unique_set_size(startup.pid) for startup in self.worker_startups()}
+
+
+def format_startups(startups: list[WorkerStartup], memory: dict[int, int | None] | None = None) -> list[str]:
+    """One summary line and one line per worker: startup latency, USS after startup and, with
+    `memory` (from `worker_memory`), USS now."""
+    if not startups:
+        return ["No worker started"]
+    latencies = [startup.latency for startup in startups]
+    known_uss = [startup.uss for startup in startups if startup.uss is not None]
+    summary = (f"{len(startups)} workers, startup latency min/median/max "
+               f"{min(latencies):.2f}/{statistics.median(latencies):.2f}/{max(latencies):.2f}s")
+    if known_uss:
+        summary += f", USS after startup {statistics.median(known_uss) / 2**20:.1f} MB median, {sum(known_uss) / 2**20:.1f} MB total"
+    lines = [summary]
+    for startup in sorted(startups, key=lambda startup: startup.pid):
+        line = f"  pid {startup.pid}: ready after {startup.latency:.2f}s"
+        if startup.uss is not None:
+            line += f", USS {startup.uss / 2**20:.1f} MB"
+        if memory and memory.get(startup.pid) is not None:
+            line += f" -> {memory[startup.pid] / 2**20:.1f} MB now"
+        lines.append(line)
+    return lines
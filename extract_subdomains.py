@@ -1,5 +1,6 @@
 import csv
 from urllib.parse import urlparse
+from cs336_data.domain_index import EXTRACTED_DOMAINS_INDEX, write_domain_index
 
 def extract_subdomain(url):
     try:
@@ -21,6 +22,8 @@ def extract_subdomain(url):
 
 input_file = "enwiki_urls.txt"
 output_file = "results.csv"
+# Same sorted-hash file as cs336-basics/build_domain_index.py writes, where parallel_process_wets.py reads it
+output_index = EXTRACTED_DOMAINS_INDEX
 
 seen_domains = set()
 count = 1
@@ -29,7 +32,7 @@ with open(output_file, mode="w", newline="", encoding="utf-8") as csvfile:
     writer = csv.writer(csvfile)
     writer.writerow(["subdomain"])  # 寫入 header
 
-    with open(input_file, "r", encoding="utf-8") as f:
+    with open(input_file, encoding="utf-8") as f:
         for line in f:
             subdomain = extract_subdomain(line)
             if subdomain and subdomain not in seen_domains:
@@ -39,4 +42,6 @@ with open(output_file, mode="w", newline="", encoding="utf-8") as csvfile:
                 if count > 100000:
                     break
 
-print(f"已成功寫出 {count - 1} 個唯一 subdomains 到 {output_file}")
\ No newline at end of file
+write_domain_index(seen_domains, output_index)
+
+print(f"已成功寫出 {count - 1} 個唯一 subdomains 到 {output_file} 與 {output_index}")
\ No newline at end of file
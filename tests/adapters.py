@@ -10,6 +10,8 @@ from cs336_data.utilities import gopher_quality_filter
 from cs336_data.utilities import classify_quality
 from cs336_data.utilities import exact_line_deduplication
 from cs336_data.minhash_deduplication import minhash_deduplication
+from cs336_data.url_dedup import normalize_url, SharedBloomFilter
+from cs336_data.pipeline import Pipeline, build_pipeline, load_pipeline, run_parallel
 
 def run_extract_text_from_html_bytes(html_bytes: bytes) -> str | None:
     return extract_text_from_html_bytes(html_bytes)
@@ -62,3 +64,23 @@ def run_minhash_deduplication(
     output_directory: os.PathLike,
 ):
     return minhash_deduplication(input_files, num_hashes, num_bands, ngrams, jaccard_threshold, output_directory)
+
+
+def run_normalize_url(url: str) -> str:
+    return normalize_url(url)
+
+
+def run_shared_bloom_filter(capacity: int, error_rate: float) -> SharedBloomFilter:
+    return SharedBloomFilter(capacity, error_rate)
+
+
+def run_build_pipeline(config: dict) -> Pipeline:
+    return build_pipeline(config)
+
+
+def run_load_pipeline(config_path: os.PathLike) -> Pipeline:
+    return load_pipeline(config_path)
+
+
+def run_pipeline_parallel(config: dict, docs, stats: dict, num_workers: int, chunk_size: int):
+    return run_parallel(config, docs, stats, num_workers=num_workers, chunk_size=chunk_size)
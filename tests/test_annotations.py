@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+import pyarrow.compute as pc
+
+from cs336_data.annotations import AnnotationWriter, load_annotations
+from cs336_data.pipeline import Document, build_pipeline, register_stage, run_parallel
+
+
+@register_stage("test_score_length", cost=1, reject_rate=0.5)
+def score_length_stage(threshold: float = 0.5):
+    def fn(doc, stats):
+        doc.meta['quality_label'], doc.meta['quality_score'] = "wiki", min(len(doc.text) / 20, 1.0)
+        return doc.meta['quality_score'] >= threshold
+    return fn
+
+
+@register_stage("test_score_sentences", cost=2, reject_rate=0.5)
+def score_sentences_stage(min_sentences: int = 2):
+    def fn(doc, stats):
+        doc.meta['num_sentences'] = doc.text.count('.')
+        return doc.meta['num_sentences'] >= min_sentences
+    return fn
+
+
+CONFIG = {"reorder": False, "stages": [{"name": "test_score_length"}, {"name": "test_score_sentences"}]}
+TEXTS = ["Short.", "A long enough text. With two sentences.", "A long enough text without a stop", "One. Two."]
+
+
+def make_docs():
+    return [Document(url=f"http://example.com/{i}", text=text) for i, text in enumerate(TEXTS)]
+
+
+def test_annotations_keep_rejected_documents(tmp_path):
+    path = tmp_path / "annotations.parquet"
+    stats = defaultdict(int)
+    pipeline = build_pipeline(CONFIG)
+    with AnnotationWriter(path, row_group_size=2) as writer:
+        kept = list(pipeline.run(make_docs(), stats, annotate=writer.add))
+    assert [doc.url for doc in kept] == ["http://example.com/1"]
+
+    table = load_annotations(path)
+    df = table.to_pandas()
+    assert list(df.url) == [f"http://example.com/{i}" for i in range(4)]
+    assert list(df.kept) == [False, True, False, False]
+    assert table.column('rejected_by').to_pylist() == [
+        "test_score_length_rejected", None, "test_score_sentences_rejected", "test_score_length_rejected"
+    ]
+    assert list(df.text) == TEXTS
+    # The first rejection stops the pipeline, so later scores stay null
+    assert df.num_sentences.isna().tolist() == [True, False, False, True]
+
+    # Re-filtering with a lower threshold is a query over the scores
+    relaxed = load_annotations(path, filter=pc.field('quality_score') >= 0.4, columns=['url'])
+    assert relaxed.column('url').to_pylist() == [f"http://example.com/{i}" for i in (1, 2, 3)]
+
+
+def test_annotate_all_scores_rejected_documents(tmp_path):
+    path = tmp_path / "annotations.parquet"
+    stats = defaultdict(int)
+    pipeline = build_pipeline({**CONFIG, "annotate_all": True})
+    with AnnotationWriter(path) as writer:
+        kept = list(pipeline.run(make_docs(), stats, annotate=writer.add))
+    assert [doc.url for doc in kept] == ["http://example.com/1"]
+    assert stats['test_score_length_rejected'] == 2 and stats['test_score_sentences_rejected'] == 1
+
+    df = load_annotations(path).to_pandas()
+    assert df.num_sentences.tolist() == [1, 2, 0, 2]
+    assert df.rejected_by.tolist()[3] == "test_score_length_rejected"
+
+
+def test_annotations_from_parallel_run_match_sequential(tmp_path):
+    sequential, parallel = tmp_path / "sequential.parquet", tmp_path / "parallel.parquet"
+    with AnnotationWriter(sequential) as writer:
+        list(build_pipeline(CONFIG).run(make_docs(), defaultdict(int), annotate=writer.add))
+    with AnnotationWriter(parallel) as writer:
+        list(run_parallel(CONFIG, make_docs(), defaultdict(int), num_workers=2, chunk_size=1, annotate=writer.add))
+    assert load_annotations(parallel).equals(load_annotations(sequential))
+
+
+def test_annotation_file_only_appears_on_success(tmp_path):
+    path = tmp_path / "annotations.parquet"
+    try:
+        with AnnotationWriter(path) as writer:
+            writer.add(Document(url="u", text="t"), True)
+            raise RuntimeError("worker crashed")
+    except RuntimeError:
+        pass
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+import numpy as np
+
+from cs336_data.boilerplate import BoilerplateStripper, CountMinSketch, hash_lines
+
+
+def page(i, domain="example.com"):
+    return "\n".join([
+        f"Home | About | Contact {domain}",
+        f"Article {i} talks about something only it says.",
+        f"Another line unique to article {i}.",
+        "",
+        f"Copyright {domain}. All rights reserved.",
+    ])
+
+
+def test_sketch_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=3)
+    hashes = hash_lines([f"line {i}" for i in range(500)])
+    for times in range(1, 4):
+        sketch.add(hashes[: 100 * times])
+    counts = np.array([3] * 100 + [2] * 100 + [1] * 100 + [0] * 200)
+    assert (sketch.estimate(hashes) >= counts).all()
+    assert (CountMinSketch().estimate(hashes) == 0).all()
+
+
+def test_strips_template_lines_of_a_domain():
+    stripper = BoilerplateStripper(min_pages=3, min_fraction=0.5)
+    stats = defaultdict(int)
+    texts = stripper.strip("example.com", [page(i) for i in range(4)], stats)
+    for i, text in enumerate(texts):
+        assert text == f"Article {i} talks about something only it says.\nAnother line unique to article {i}.\n"
+    assert stats['boilerplate_lines'] == 8
+    # Too few pages of another domain to tell its template apart
+    assert stripper.strip("other.org", [page(0, "other.org"), page(1, "other.org")]) == [page(0, "other.org"), page(1, "other.org")]
+    # Counts carry over to later pages of a domain
+    assert stripper.strip("example.com", [page(9)])[0].startswith("Article 9")
+
+
+def test_keeps_lines_shared_across_domains():
+    stripper = BoilerplateStripper(min_pages=2)
+    shared = "A sentence that many unrelated sites quote."
+    texts = [stripper.strip(f"site{i}.org", [f"{shared}\nPage of site {i}."])[0] for i in range(5)]
+    assert all(text.startswith(shared) for text in texts)
+
+
+def test_domain_tables_are_bounded():
+    stripper = BoilerplateStripper(max_domains=2, width=128)
+    stats = defaultdict(int)
+    for i in range(5):
+        stripper.strip(f"site{i}.org", [page(0)], stats)
+    assert list(stripper.tables) == ["site3.org", "site4.org"]
+    assert stats['boilerplate_evicted_domains'] == 3
+    assert stripper.size_bytes == 2 * 4 * 128 * 2
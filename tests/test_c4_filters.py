@@ -0,0 +1,57 @@
+import random
+import re
+from collections import defaultdict
+
+from cs336_data.utilities import c4_filter_lines
+
+
+def reference_c4_filter(text: str) -> tuple[str, int]:
+    # Line-by-line rules followed by a sentence split over the joined text
+    cleaned_lines = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line or not line.endswith(('.', '!', '?', '"', "’", "”")):
+            continue
+        if len(line.split()) < 3:
+            continue
+        if 'javascript' in line.lower() or 'lorem ipsum' in line.lower() or '{' in line or '}' in line:
+            continue
+        cleaned_lines.append(line)
+    cleaned = '\n'.join(cleaned_lines)
+    return cleaned, len(re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', cleaned.strip()))
+
+
+def test_c4_filter_lines_counts_rules():
+    text = "\n".join([
+        "  A complete sentence here.  ",
+        "",
+        "no punctuation at the end",
+        "Too short.",
+        "Enable JavaScript to continue.",
+        "function() { return 1; }.",
+        "Mr. Smith went to Washington. He met e.g. a friend? Yes!",
+    ])
+    stats = defaultdict(int)
+    cleaned, num_sentences = c4_filter_lines(text, stats)
+    assert cleaned == "A complete sentence here.\nMr. Smith went to Washington. He met e.g. a friend? Yes!"
+    assert num_sentences == 4
+    assert dict(stats) == {
+        'c4_empty_lines': 1,
+        'c4_no_punctuation_lines': 1,
+        'c4_short_lines': 1,
+        'c4_junk_lines': 2,
+        'c4_kept_lines': 2,
+    }
+
+
+def test_c4_filter_lines_matches_reference():
+    rng = random.Random(0)
+    pieces = ["word", "Mr.", "U.S.", "e.g.", "end.", "why?", "wow!", '"quote"', "x", "A.", "{", "lorem ipsum",
+              "JavaScript", "İ", " ", "  ", "\t", " ", "\r", "."]
+    for _ in range(2000):
+        lines = [
+            "".join(rng.choice(pieces) + rng.choice([" ", "", "\t"]) for _ in range(rng.randint(0, 8)))
+            for _ in range(rng.randint(0, 6))
+        ]
+        text = "\n".join(lines)
+        assert c4_filter_lines(text) == reference_c4_filter(text)
@@ -0,0 +1,16 @@
+from cs336_data.clean_warc import main
+
+from .test_warc_index import write_warc_with_responses
+
+
+def test_entry_point_defaults_and_overrides(tmp_path):
+    warc = tmp_path / "pages.warc.gz"
+    write_warc_with_responses(warc, 6)
+    config = tmp_path / "pipeline.yaml"
+    config.write_text("reorder: false\nstages:\n  - name: extract\n")
+    output = tmp_path / "out.train"
+
+    main(["--workers", "1", "--output", str(output)], warc=str(warc), label="wiki", config=str(config))
+    assert output.read_text().splitlines() == [f"__label__wiki page {i}" for i in range(6)]
+    main(["--workers", "1", "--test-count", "2", "--label", "cc"], warc=str(warc), output=str(output), config=str(config))
+    assert output.read_text().splitlines() == [f"__label__cc page {i}" for i in range(3)]
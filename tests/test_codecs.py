@@ -0,0 +1,39 @@
+import shutil
+import importlib.util
+
+import pytest
+
+from cs336_data.codecs import Codec, open_input
+
+
+def test_codec_parse():
+    assert Codec.parse("gzip") == Codec("gzip")
+    assert Codec.parse("gzip:6") == Codec("gzip", level=6)
+    assert Codec.parse("zstd:3:8") == Codec("zstd", level=3, threads=8)
+    with pytest.raises(ValueError):
+        Codec.parse("lzma")
+
+
+def test_codec_for_path():
+    assert Codec.for_path("shard.final.gz") == Codec("gzip")
+    assert Codec.for_path("shard.final.zst") == Codec("zstd")
+    assert Codec.for_path("shard.final.txt") == Codec("none")
+
+
+# zstd is optional: it needs the zstandard package or the zstd binary
+HAS_ZSTD = importlib.util.find_spec("zstandard") is not None or shutil.which("zstd") is not None
+
+
+@pytest.mark.parametrize("spec", [
+    "none", "gzip:1:0", "gzip:6:2",
+    pytest.param("zstd:3:0", marks=pytest.mark.skipif(not HAS_ZSTD, reason="zstd not available")),
+])
+def test_codec_round_trip_without_suffix(tmp_path, spec):
+    codec = Codec.parse(spec)
+    text = "Ünïcode line\n" * 1000
+    # Written under a temporary name, as atomic_write does; readers detect the codec from the content
+    path = tmp_path / "output.tmp"
+    with codec.open(path, 'wt') as f:
+        f.write(text)
+    with open_input(path) as f:
+        assert f.read() == text
@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+import numpy as np
+
+from cs336_data.decontamination import NgramIndex, iter_token_file_documents, ngram_hashes, write_ngram_index
+from cs336_data.pipeline import Document, build_pipeline
+
+EVAL_DOCUMENTS = [
+    "The quick brown fox jumps over the lazy dog while the cat watches from the window sill.",
+    "Paloma measures language model fit across many domains of text from the web.",
+]
+
+
+def test_ngram_hashes_ignore_case_and_punctuation():
+    assert np.array_equal(ngram_hashes("The quick, brown fox!", 3), ngram_hashes("the quick brown\nfox", 3))
+    assert len(ngram_hashes("only four words here", 5)) == 0
+    assert len(ngram_hashes("one two three four five six", 5)) == 2
+
+
+def test_index_finds_overlapping_lines(tmp_path):
+    index_path = tmp_path / "ngrams.npy"
+    assert write_ngram_index(EVAL_DOCUMENTS, index_path, n=5) == 13 + 9
+    index = NgramIndex(index_path, n=5)
+    lines = [
+        "Unrelated text about something else entirely and more words.",
+        "As noted, THE QUICK BROWN FOX JUMPS over a fence.",
+        "Paloma measures language model fit",
+        "",
+    ]
+    assert index.count_line_overlaps(lines).tolist() == [0, 2, 1, 0]
+    assert index.count_overlaps(" ".join(lines)) == 3
+
+
+def test_token_file_documents(tmp_path):
+    token_path = tmp_path / "eval.bin"
+    np.array([1, 2, 50256, 3, 50256, 4, 5], dtype=np.uint16).tofile(token_path)
+
+    def decode(tokens):
+        return " ".join(map(str, tokens))
+    assert list(iter_token_file_documents(token_path, decode)) == ["1 2", "3", "4 5"]
+
+
+def test_decontaminate_stages(tmp_path):
+    index_path = tmp_path / "ngrams.npy"
+    write_ngram_index(EVAL_DOCUMENTS, index_path, n=5)
+    text = "A clean first line with plenty of words.\nthe quick brown fox jumps over the lazy dog"
+
+    stats = defaultdict(int)
+    drop = build_pipeline({"stages": [{"name": "decontaminate", "path": str(index_path), "n": 5}]})
+    assert not drop.process(Document(text=text), stats)
+    assert drop.process(Document(text=text.split("\n")[0]), stats)
+    assert stats["decontaminate_rejected"] == 1 and stats["eval_overlapping_ngrams"] == 5
+
+    mask = build_pipeline({"stages": [{"name": "decontaminate_lines", "path": str(index_path), "n": 5}]})
+    doc = Document(text=text)
+    assert mask.process(doc, stats)
+    assert doc.text == "A clean first line with plenty of words."
+    assert doc.meta["eval_overlaps"] == 5 and stats["eval_masked_lines"] == 1
@@ -0,0 +1,37 @@
+from collections import defaultdict
+
+from cs336_data.minhash_deduplication import minhash_deduplication, minhash_keep_ids
+from cs336_data.utilities import exact_line_deduplication, find_duplicate_lines, iter_unique_lines
+
+from .common import FIXTURES_PATH
+
+
+def test_dedup_decisions_match_materialized_dedup(tmp_path):
+    input_files = sorted(
+        list((FIXTURES_PATH / "documents_with_line_duplicates").glob("doc*.txt"))
+        + list((FIXTURES_PATH / "documents_with_fuzzy_duplicates").glob("*.txt"))
+    )
+    # Same file names in both fixture directories; keep them apart in the outputs
+    renamed = []
+    for i, path in enumerate(input_files):
+        renamed.append(tmp_path / f"{i:02d}_{path.name}")
+        renamed[-1].write_bytes(path.read_bytes())
+
+    exact_line_deduplication(renamed, tmp_path / "lines")
+    minhash_deduplication(
+        [tmp_path / "lines" / path.name for path in renamed], 100, 10, 5, 0.8, tmp_path / "minhash"
+    )
+    expected = {path.name: path.read_text() for path in (tmp_path / "minhash").iterdir()}
+
+    stats = defaultdict(int)
+    duplicate_lines = find_duplicate_lines(renamed, stats)
+    keep_ids = minhash_keep_ids(
+        lambda i: "".join(iter_unique_lines(renamed[i], duplicate_lines)), len(renamed), 100, 10, 5, 0.8
+    )
+    kept = {renamed[i].name: "".join(iter_unique_lines(renamed[i], duplicate_lines)) for i in keep_ids}
+
+    assert kept == expected
+    assert len(kept) < len(renamed)
+    assert stats['lines'] == sum(
+        1 for path in renamed for line in path.read_text().splitlines() if line.strip()
+    )
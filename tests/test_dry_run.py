@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+import numpy as np
+
+from cs336_data.dry_run import (
+    DryRunSample,
+    estimate_run,
+    format_estimate,
+    profile_documents,
+    proportion_interval,
+    total_interval,
+)
+from cs336_data.pipeline import Document, build_pipeline, register_stage
+from cs336_data.warc_index import sample_index_fraction, write_warc_index
+
+from .test_warc_reader import write_wet
+
+
+@register_stage("test_dry_run_even", cost=1)
+def even_stage():
+    def fn(doc, stats):
+        return int(doc.url) % 2 == 0
+    return fn
+
+
+@register_stage("test_dry_run_small", cost=2)
+def small_stage():
+    def fn(doc, stats):
+        return int(doc.url) < 60
+    return fn
+
+
+def profile_sample(num_docs):
+    pipeline = build_pipeline({"reorder": False, "stages": [{"name": "test_dry_run_even"}, {"name": "test_dry_run_small"}]})
+    docs = (Document(url=str(i), text="x" * i) for i in range(num_docs))
+    return profile_documents(pipeline, docs, defaultdict(int))
+
+
+def test_profile_records_where_each_document_stopped():
+    sample = profile_sample(100)
+    assert sample.stage_names == ["test_dry_run_even", "test_dry_run_small"]
+    assert len(sample) == 100 and sample.stage_ns.shape == (100, 2)
+    assert list(sample.rejected_at[:4]) == [2, 0, 2, 0] and sample.rejected_at[60] == 1
+    # Kept documents count their text and newline
+    assert sample.kept_bytes[4] == 5 and sample.kept_bytes[3] == 0 and sample.kept_bytes[62] == 0
+    # The second stage only ran on documents the first one kept
+    assert (sample.stage_ns[1::2, 1] == 0).all()
+    assert (sample.total_ns >= sample.stage_ns.sum(axis=1)).all()
+
+    merged = DryRunSample.concatenate([sample, profile_sample(10)])
+    assert len(merged) == 110
+
+
+def test_estimate_extrapolates_to_the_population():
+    sample = profile_sample(100)
+    estimate = estimate_run(sample, population=10_000, num_cores=4)
+    assert estimate.survivors["test_dry_run_even"].estimate == 5000
+    assert estimate.survivors["test_dry_run_small"].estimate == 3000
+    survivors = estimate.survivors["test_dry_run_small"]
+    assert survivors.low < 3000 < survivors.high
+    kept = estimate.kept_bytes
+    assert kept.estimate == sum(i + 1 for i in range(0, 60, 2)) * 100
+    assert kept.low < kept.estimate < kept.high
+    assert estimate.wall_hours.estimate * 4 == estimate.cpu_hours.estimate
+    lines = format_estimate(estimate)
+    assert lines[0].startswith("Sampled 100 of 10,000 records (1.00%)")
+
+
+def test_intervals():
+    # Nothing sampled hit, yet the interval allows for a few in the population
+    empty = proportion_interval(0, 50, 1000, 0.95)
+    assert empty.estimate == 0 and empty.low == 0 and 0 < empty.high < 100
+    # A census has no sampling error
+    values = np.arange(10, dtype=float)
+    census = total_interval(values, 10, 0.95)
+    assert census.low == census.estimate == census.high == 45
+    wide, narrow = total_interval(values, 1000, 0.99), total_interval(values, 1000, 0.9)
+    assert wide.high - wide.low > narrow.high - narrow.low
+
+
+def test_fraction_sample_covers_every_file(tmp_path):
+    paths = []
+    for i, num_records in enumerate([200, 50, 400]):
+        path = tmp_path / f"shard{i}.warc.wet.gz"
+        write_wet(path, num_records)
+        write_warc_index(path)
+        paths.append(path)
+    population, sample = sample_index_fraction(paths, 0.1, record_type="conversion", seed=1)
+    assert population == 650
+    assert {path: len(entries) for path, entries in sample.items()} == {str(paths[0]): 20, str(paths[1]): 5, str(paths[2]): 40}
+    assert all(entries == sorted(entries, key=lambda entry: entry.offset) for entries in sample.values())
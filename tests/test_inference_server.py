@@ -0,0 +1,110 @@
+import shutil
+import threading
+import time
+
+import fasttext
+import numpy as np
+import pytest
+
+from cs336_data import utilities
+from cs336_data.inference_server import InferenceClient, RemoteModel, shared_client, start_inference_server
+
+from .common import FIXTURES_PATH
+
+TEXTS = ["the cat sat on the mat", "stock markets fell sharply today", "a dog chased the cat",
+         "shares and bonds rallied", "the cat and the dog", "investors sold their shares"]
+# Two-label (pets/money) model trained on TEXTS, small enough to keep as a fixture
+MODEL_PATH = str(FIXTURES_PATH / "tiny_fasttext_classifier.bin")
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("server") / "fasttext.sock")
+    server = start_inference_server(path, max_batch=64, max_delay=0.05)
+    yield path
+    server.terminate()
+
+
+def test_remote_predictions_match_the_local_model(socket_path):
+    local = fasttext.load_model(MODEL_PATH)
+    remote = RemoteModel(InferenceClient(socket_path), MODEL_PATH)
+    labels, scores = remote.predict(TEXTS[0], k=2)
+    expected_labels, expected_scores = local.predict(TEXTS[0], k=2)
+    assert labels == expected_labels
+    assert np.allclose(scores, expected_scores, atol=1e-6)
+
+    labels, scores = remote.predict(TEXTS)
+    expected_labels, expected_scores = local.predict(TEXTS)
+    assert [tuple(item) for item in labels] == [tuple(item) for item in expected_labels]
+    assert np.allclose(np.concatenate(scores), np.concatenate(expected_scores), atol=1e-6)
+
+
+def test_concurrent_requests_are_batched(socket_path):
+    clients = [InferenceClient(socket_path) for _ in range(4)]
+    before = clients[0].stats().get(MODEL_PATH, {'batches': 0, 'texts': 0})
+    results = {}
+    barrier = threading.Barrier(len(clients))
+
+    def classify(i):
+        barrier.wait()
+        results[i] = [clients[i].predict(MODEL_PATH, [text])[0][0][0] for text in TEXTS]
+
+    threads = [threading.Thread(target=classify, args=(i,)) for i in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    after = clients[0].stats()[MODEL_PATH]
+    assert all(labels == results[0] for labels in results.values())
+    assert after['texts'] - before['texts'] == len(clients) * len(TEXTS)
+    assert after['batches'] - before['batches'] < len(clients) * len(TEXTS)
+
+
+def test_load_fasttext_model_uses_the_configured_server(socket_path, monkeypatch):
+    monkeypatch.setenv(utilities.INFERENCE_SOCKET_ENV, socket_path)
+    monkeypatch.setattr(utilities, "_MODELS", {})
+    monkeypatch.setattr(utilities, "QUALITY_MODEL_PATH", MODEL_PATH)
+    assert isinstance(utilities.load_fasttext_model(MODEL_PATH), RemoteModel)
+    label, score = utilities.classify_quality("the cat sat\non the mat")
+    assert label == fasttext.load_model(MODEL_PATH).predict("the cat sat on the mat")[0][0].replace('__label__', '')
+    assert 0 < score <= 1
+    assert [label for label, _ in utilities.classify_quality_batch(TEXTS[:2])] == ["pets", "money"]
+
+
+def test_models_sharing_a_client_do_not_wait_for_the_deadline(socket_path, tmp_path):
+    # Like a worker using lid and nsfw: two models, one connection, one request in flight at a time
+    second_path = str(tmp_path / "second.bin")
+    shutil.copy(MODEL_PATH, second_path)
+    client = shared_client(socket_path)
+    assert shared_client(socket_path) is client
+    models = [RemoteModel(client, MODEL_PATH), RemoteModel(client, second_path)]
+    idle = InferenceClient(socket_path)
+    idle.stats()
+    models[0].predict(TEXTS[0]), models[1].predict(TEXTS[0])
+    start = time.perf_counter()
+    for i in range(10):
+        models[i % 2].predict(TEXTS[i % len(TEXTS)])
+    # The server's max_delay is 0.05 s per request
+    assert time.perf_counter() - start < 0.1
+
+
+def test_a_bad_text_only_fails_its_own_request(socket_path):
+    clients = [InferenceClient(socket_path) for _ in range(2)]
+    texts = [[TEXTS[0]], ["two\nlines"]]
+    results = {}
+    barrier = threading.Barrier(2)
+
+    def classify(i):
+        barrier.wait()
+        try:
+            results[i] = clients[i].predict(MODEL_PATH, texts[i])[0][0][0]
+        except RuntimeError as exc:
+            results[i] = exc
+
+    threads = [threading.Thread(target=classify, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results[0] == "__label__pets"
+    assert isinstance(results[1], RuntimeError)
@@ -0,0 +1,111 @@
+import os
+import time
+import multiprocessing
+
+import pytest
+
+from cs336_data.lease_queue import LeaseQueue
+
+
+def run_worker(root, worker_id):
+    queue = LeaseQueue(root, lease_timeout=30, worker_id=worker_id)
+    with queue.keep_alive():
+        for key in queue.iter_claimed(poll_interval=0.01):
+            time.sleep(0.001)
+            queue.complete(key, {'worker': worker_id, 'value': int(key)})
+
+
+def test_lease_queue_splits_tasks_between_processes(tmp_path):
+    keys = [f"{i:03d}" for i in range(60)]
+    LeaseQueue(tmp_path).add(keys)
+
+    workers = [multiprocessing.Process(target=run_worker, args=(tmp_path, f"worker-{i}")) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    queue = LeaseQueue(tmp_path)
+    results = queue.results()
+    assert sorted(results) == keys
+    assert sum(result['value'] for result in results.values()) == sum(range(60))
+    assert queue.unfinished() == []
+    assert os.listdir(tmp_path / 'leases') == []
+
+
+def test_lease_queue_reclaims_expired_leases(tmp_path):
+    crashed = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="crashed")
+    crashed.add(["a"])
+    assert crashed.claim() == "a"
+
+    other = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="other")
+    assert other.claim() is None
+    time.sleep(0.3)
+    assert other.claim() == "a"
+    other.complete("a", {'ok': True})
+    assert other.results() == {"a": {'ok': True}}
+    assert other.claim() is None and other.unfinished() == []
+
+
+def test_lease_queue_heartbeat_keeps_lease_and_failures_are_retried(tmp_path):
+    owner = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="owner")
+    owner.add(["a", "b"])
+    other = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="other")
+
+    with owner.keep_alive(interval=0.02):
+        key = owner.claim()
+        time.sleep(0.4)
+        assert other.claim() != key
+    owner.fail(key, "boom")
+
+    assert owner.failures() == {key: "boom"}
+    assert key not in owner.unfinished()
+    assert owner.retry_failed() == [key]
+    assert owner.claim() == key
+
+
+def test_late_worker_does_not_touch_a_taken_over_lease(tmp_path):
+    slow = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="slow")
+    slow.add(["a"])
+    assert slow.claim() == "a"
+    time.sleep(0.3)
+    other = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="other")
+    assert other.claim() == "a"
+
+    lease = tmp_path / 'leases' / "a"
+    os.utime(lease, (0, 0))
+    slow.heartbeat()
+    assert os.stat(lease).st_mtime == 0 and slow.held == set()
+    os.utime(lease)
+    slow.complete("a", {'by': "slow"})
+    assert lease.exists() and other.owns("a") and not slow.owns("a")
+    other.complete("a", {'by': "other"})
+    assert not lease.exists()
+
+
+def test_run_once_is_taken_over_when_its_worker_crashes(tmp_path):
+    # Claimed by a worker that then died without completing it or refreshing its lease
+    crashed = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="crashed")
+    crashed.add(["finalize"])
+    assert crashed.claim() == "finalize"
+
+    calls = []
+    other = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="other")
+    assert other.run_once("finalize", lambda: calls.append("other") or {'by': "other"}, poll_interval=0.05)
+    assert calls == ["other"] and other.results() == {"finalize": {'by': "other"}}
+
+    late = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="late")
+    assert not late.run_once("finalize", lambda: calls.append("late"), poll_interval=0.05)
+    assert calls == ["other"]
+
+
+def test_run_once_failure_is_reported_to_waiting_workers(tmp_path):
+    def boom():
+        raise ValueError("boom")
+
+    owner = LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="owner")
+    with pytest.raises(ValueError):
+        owner.run_once("finalize", boom, poll_interval=0.05)
+    with pytest.raises(RuntimeError, match="boom"):
+        LeaseQueue(tmp_path, lease_timeout=0.2, worker_id="other").run_once("finalize", dict, poll_interval=0.05)
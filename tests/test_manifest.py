@@ -0,0 +1,50 @@
+import gzip
+
+import pytest
+
+from cs336_data.manifest import RunManifest, atomic_write
+
+
+def test_atomic_write_renames_on_success(tmp_path):
+    path = tmp_path / "out.txt.gz"
+    with atomic_write(path, "wt", opener=gzip.open, encoding="utf-8") as f:
+        f.write("hello\n")
+        assert not path.exists()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert f.read() == "hello\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt.gz"]
+
+
+def test_atomic_write_leaves_nothing_on_failure(tmp_path):
+    path = tmp_path / "out.txt"
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as f:
+            f.write("partial")
+            raise RuntimeError("crash")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_manifest_resume(tmp_path):
+    manifest_path = tmp_path / "manifest.jsonl"
+    output_a = tmp_path / "a.txt"
+    output_b = tmp_path / "b.txt"
+    output_a.write_text("shard a\n")
+    output_b.write_text("shard b\n")
+
+    manifest = RunManifest(manifest_path)
+    manifest.record("process", "a", outputs=[output_a], stats={"kept": 3})
+    manifest.record("process", "b", outputs=[output_b], stats={"kept": 5})
+    # Simulate a crash in the middle of appending the next entry
+    with open(manifest_path, "a") as f:
+        f.write('{"step": "process", "key": "c", "outp')
+
+    resumed = RunManifest(manifest_path)
+    assert resumed.get("process", "a")["stats"] == {"kept": 3}
+    assert resumed.get("process", "c") is None
+
+    # Outputs that were removed or changed since no longer count as finished
+    output_b.unlink()
+    assert resumed.get("process", "b") is None
+    output_a.write_text("shard A\n")
+    assert resumed.get("process", "a") is not None
+    assert resumed.get("process", "a", verify_checksums=True) is None
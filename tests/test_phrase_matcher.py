@@ -0,0 +1,30 @@
+from cs336_data.phrase_matcher import PhraseMatcher
+
+
+def test_phrase_matcher_counts_overlapping_phrases():
+    matcher = PhraseMatcher(["bad", "very bad", "bad word", "s&m", "g-spot"])
+    assert matcher.match("A very bad word.") == (True, 3)
+    assert matcher.match("Nothing to see here.") == (False, 0)
+    assert matcher.match("S&M and the G-spot") == (True, 2)
+
+
+def test_phrase_matcher_respects_word_boundaries():
+    matcher = PhraseMatcher(["ass", "two words"])
+    assert matcher.match("This class is about bass guitars.") == (False, 0)
+    assert matcher.match("What an ass!") == (True, 1)
+    assert matcher.match("two wordsmiths") == (False, 0)
+    assert matcher.match("Two\nwords") == (True, 1)
+
+
+def test_phrase_matcher_matches_brute_force():
+    phrases = ["a", "a b", "b a", "b b b", "c a b"]
+    matcher = PhraseMatcher(phrases)
+    phrase_tokens = {tuple(phrase.split()) for phrase in phrases}
+    text = "c a b b b a b c a a b b"
+    tokens = text.split()
+    expected = sum(
+        tuple(tokens[i:j]) in phrase_tokens
+        for i in range(len(tokens))
+        for j in range(i + 1, len(tokens) + 1)
+    )
+    assert matcher.match(text) == (True, expected)
@@ -0,0 +1,223 @@
+import time
+from collections import defaultdict
+
+import pytest
+
+from cs336_data.pipeline import Document, cascade_report, register_stage
+
+from .adapters import run_build_pipeline, run_load_pipeline, run_pipeline_parallel
+
+CALLS = []
+
+
+@register_stage("test_reject_short", cost=10, reject_rate=0.5)
+def reject_short_stage(min_length: int = 10):
+    def fn(doc, stats):
+        CALLS.append("test_reject_short")
+        return len(doc.text) >= min_length
+    return fn
+
+
+@register_stage("test_expensive", cost=1000, reject_rate=0.5)
+def expensive_stage():
+    def fn(doc, stats):
+        CALLS.append("test_expensive")
+        return True
+    return fn
+
+
+@register_stage("test_upper", cost=1, transform=True)
+def upper_stage():
+    def fn(doc, stats):
+        CALLS.append("test_upper")
+        doc.text = doc.text.upper()
+        return True
+    return fn
+
+
+# URLs seen by `test_seen_url`, like the seen-URL filter of parallel_process_wets.py
+SEEN = set()
+
+
+@register_stage("test_seen_url", cost=1, reject_rate=0.1, side_effects=True)
+def seen_url_stage():
+    def fn(doc, stats):
+        if doc.url in SEEN:
+            return False
+        SEEN.add(doc.url)
+        return True
+    return fn
+
+
+def test_filters_ordered_cheap_and_selective_first():
+    pipeline = run_build_pipeline({"stages": [{"name": "test_expensive"}, {"name": "test_reject_short"}]})
+    assert [stage.name for stage in pipeline.stages] == ["test_reject_short", "test_expensive"]
+
+    pipeline = run_build_pipeline(
+        {"reorder": False, "stages": [{"name": "test_expensive"}, {"name": "test_reject_short"}]}
+    )
+    assert [stage.name for stage in pipeline.stages] == ["test_expensive", "test_reject_short"]
+
+
+def test_filters_not_moved_across_transforms():
+    pipeline = run_build_pipeline(
+        {"stages": [{"name": "test_expensive"}, {"name": "test_upper"}, {"name": "test_reject_short"}]}
+    )
+    assert [stage.name for stage in pipeline.stages] == ["test_expensive", "test_upper", "test_reject_short"]
+
+
+def test_config_overrides_cost():
+    pipeline = run_build_pipeline(
+        {"stages": [{"name": "test_expensive", "cost": 1}, {"name": "test_reject_short"}]}
+    )
+    assert [stage.name for stage in pipeline.stages] == ["test_expensive", "test_reject_short"]
+
+
+def test_pipeline_short_circuits_and_counts():
+    pipeline = run_build_pipeline({
+        "stages": [
+            {"name": "test_upper"},
+            {"name": "test_expensive"},
+            {"name": "test_reject_short", "min_length": 5, "stat": "too_short"},
+        ]
+    })
+    stats = defaultdict(int)
+    CALLS.clear()
+    kept = list(pipeline.run([Document(text="hello world"), Document(text="hi")], stats))
+    assert [doc.text for doc in kept] == ["HELLO WORLD"]
+    assert stats["documents"] == 2
+    assert stats["kept"] == 1
+    assert stats["too_short"] == 1
+    # The expensive filter never sees the rejected document
+    assert CALLS.count("test_expensive") == 1
+
+
+def test_disabled_and_unknown_stages():
+    pipeline = run_build_pipeline({"stages": [{"name": "test_expensive", "enabled": False}]})
+    assert pipeline.stages == []
+    with pytest.raises(KeyError):
+        run_build_pipeline({"stages": [{"name": "no_such_stage"}]})
+
+
+def test_c4_stages_from_yaml(tmp_path):
+    config_path = tmp_path / "pipeline.yaml"
+    config_path.write_text(
+        "stages:\n"
+        "  - name: decode\n"
+        "  - name: c4_lines\n"
+        "  - name: c4_sentences\n"
+        "    min_sentences: 2\n"
+        "    stat: too_few_sentences\n"
+    )
+    pipeline = run_load_pipeline(config_path)
+    raw = (
+        b"Home | About | Contact\n"
+        b"This is the first real sentence of the page.\n"
+        b"Enable javascript to see this page.\n"
+        b"And this is the second real sentence here.\n"
+    )
+    stats = defaultdict(int)
+    doc = Document(raw=raw)
+    assert pipeline.process(doc, stats)
+    assert doc.text == (
+        "This is the first real sentence of the page.\n"
+        "And this is the second real sentence here."
+    )
+    assert not pipeline.process(Document(raw=b"Only one sentence is here."), stats)
+    assert stats["too_few_sentences"] == 1
+
+
+def test_parallel_run_matches_sequential():
+    config = {
+        "stages": [
+            {"name": "decode"},
+            {"name": "c4_lines"},
+            {"name": "c4_sentences", "min_sentences": 3},
+        ]
+    }
+
+    def make_docs():
+        for i in range(500):
+            sentences = "\n".join(f"Document {i} has sentence number {j}." for j in range(i % 6))
+            yield Document(url=f"https://example.com/{i}", raw=sentences.encode())
+
+    sequential_stats = defaultdict(int)
+    sequential = [doc.text for doc in run_build_pipeline(config).run(make_docs(), sequential_stats)]
+    parallel_stats = defaultdict(int)
+    parallel = [
+        doc.text
+        for doc in run_pipeline_parallel(config, make_docs(), parallel_stats, num_workers=3, chunk_size=16)
+    ]
+    assert parallel == sequential
+    assert parallel_stats == sequential_stats
+
+
+@register_stage("test_slow_filter", cost=1, reject_rate=0.5)
+def slow_filter_stage():
+    # Declared cheap, but busy-waits, so only measuring its cost shows it should go last
+    def fn(doc, stats):
+        deadline = time.perf_counter() + 200e-6
+        while time.perf_counter() < deadline:
+            pass
+        return hash(doc.url + "slow") % 2 == 0
+    return fn
+
+
+@register_stage("test_fast_filter", cost=1000, reject_rate=0.5)
+def fast_filter_stage():
+    def fn(doc, stats):
+        return hash(doc.url + "fast") % 3 != 0
+    return fn
+
+
+def test_adaptive_pipeline_reorders_by_measured_cost():
+    config = {"stages": [{"name": "test_slow_filter"}, {"name": "test_fast_filter"}]}
+    docs = [Document(url=f"https://example.com/{i}") for i in range(400)]
+    fixed = run_build_pipeline({**config, "reorder": False})
+    expected = [doc.url for doc in fixed.run(docs, defaultdict(int))]
+
+    adaptive = run_build_pipeline({**config, "adaptive": True, "adapt_every": 100})
+    assert [stage.name for stage in adaptive.stages] == ["test_slow_filter", "test_fast_filter"]
+    stats = defaultdict(int)
+    docs = [Document(url=f"https://example.com/{i}") for i in range(400)]
+    assert [doc.url for doc in adaptive.run(docs, stats)] == expected
+    assert [stage.name for stage in adaptive.stages] == ["test_fast_filter", "test_slow_filter"]
+    assert stats["cascade_reorders"] == 1
+    # Every document reaches the first filter, only the survivors the second
+    assert stats["cascade_test_fast_filter_calls"] + stats["cascade_test_slow_filter_calls"] < 2 * len(docs)
+
+    report = cascade_report(adaptive, stats)
+    assert report[-1].startswith("  Measured order: test_fast_filter -> test_slow_filter")
+
+
+def test_harmful_skips_toxicity_model_after_nsfw_rejection(monkeypatch):
+    import cs336_data.pipeline as pipeline_module
+
+    toxic_calls = []
+    monkeypatch.setattr(pipeline_module, "load_fasttext_model", lambda path: None)
+    monkeypatch.setattr(pipeline_module, "classify_nsfw",
+                        lambda text: ("nsfw", 0.9) if "nsfw" in text else ("non-nsfw", 0.9))
+    monkeypatch.setattr(pipeline_module, "classify_toxic_speech",
+                        lambda text: toxic_calls.append(text) or ("non-toxic", 0.9))
+    pipeline = run_build_pipeline({"stages": [{"name": "harmful"}]})
+    stats = defaultdict(int)
+    kept = list(pipeline.run([Document(text="some nsfw text"), Document(text="fine text")], stats))
+    assert [doc.text for doc in kept] == ["fine text"]
+    assert toxic_calls == ["fine text"]
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_annotate_all_keeps_the_same_documents(batch):
+    config = {"reorder": False, "stages": [{"name": "test_reject_short", "min_length": 5}, {"name": "test_seen_url"}]}
+    docs = [("a", "hi"), ("a", "hello world"), ("b", "hello there"), ("b", "again, b")]
+    kept = {}
+    for annotate_all in (False, True):
+        SEEN.clear()
+        pipeline = run_build_pipeline(dict(config, annotate_all=annotate_all))
+        batch_docs = [Document(url=url, text=text) for url, text in docs]
+        if batch:
+            kept[annotate_all] = [doc.text for doc, ok in zip(batch_docs, pipeline.process_batch(batch_docs, defaultdict(int))) if ok]
+        else:
+            kept[annotate_all] = [doc.text for doc in pipeline.run(batch_docs, defaultdict(int))]
+    # The short "a" page is rejected before the URL filter, so it does not claim the URL
+    assert kept[True] == kept[False] == ["hello world", "hello there"]
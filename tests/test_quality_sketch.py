@@ -0,0 +1,86 @@
+from collections import defaultdict
+
+import numpy as np
+
+from cs336_data.pipeline import Document, build_pipeline, register_stage, run_parallel
+from cs336_data.quality_sketch import ScoreSketch, exact_cutoff_for_top
+
+
+@register_stage("test_batched_length_score", cost=1, reject_rate=0.5)
+def batched_length_score_stage(cutoff: float = 0.5):
+    def score(doc):
+        doc.meta['quality_score'] = min(len(doc.text) / 40, 1.0)
+        return doc.meta['quality_score'] >= cutoff
+
+    def fn(doc, stats):
+        stats['single_calls'] += 1
+        return score(doc)
+
+    def batch(docs, stats):
+        stats['batch_calls'] += 1
+        return [score(doc) for doc in docs]
+
+    fn.batch = batch
+    return fn
+
+
+@register_stage("test_has_period", cost=2, reject_rate=0.5)
+def has_period_stage():
+    def fn(doc, stats):
+        return '.' in doc.text
+    return fn
+
+
+CONFIG = {"reorder": False, "stages": [{"name": "test_has_period"}, {"name": "test_batched_length_score"}]}
+TEXTS = ["Short.", "A long enough text. With two sentences.", "A long enough text without a stop",
+         "One. Two.", "Another document that is long enough.", "tiny"]
+
+
+def make_docs():
+    return [Document(url=f"http://example.com/{i}", text=text) for i, text in enumerate(TEXTS)]
+
+
+def test_merged_sketches_match_one_sketch():
+    rng = np.random.default_rng(0)
+    scores = rng.beta(2, 5, size=10_000)
+    merged = sum((ScoreSketch.from_scores(part) for part in np.array_split(scores, 7)), 0)
+    assert np.array_equal(merged.counts, ScoreSketch.from_scores(scores).counts)
+    assert merged.count == len(scores)
+    assert sum(merged.histogram(10)) == len(scores)
+
+
+def test_sketch_cutoff_is_within_one_bin_of_exact():
+    rng = np.random.default_rng(1)
+    scores = rng.beta(5, 2, size=20_000).astype(np.float32)
+    sketch = ScoreSketch.from_scores(scores, num_bins=1000)
+    for fraction in (0.01, 0.1, 0.5, 0.9):
+        exact = exact_cutoff_for_top(scores, fraction)
+        assert (scores >= exact).sum() == int(np.ceil(fraction * len(scores)))
+        estimate = sketch.cutoff_for_top(fraction)
+        assert estimate <= exact < estimate + 1 / 1000
+        assert (scores >= estimate).mean() >= fraction
+        assert abs(sketch.quantile(1 - fraction) - exact) <= 1 / 1000
+    assert exact_cutoff_for_top(scores, 1.5) == scores.min()
+    assert exact_cutoff_for_top(scores[:0], 0.5) == np.inf
+
+
+def test_process_batch_matches_process():
+    sequential_stats, batched_stats = defaultdict(int), defaultdict(int)
+    docs, pipeline = make_docs(), build_pipeline(CONFIG)
+    sequential = [pipeline.process(doc, sequential_stats) for doc in docs]
+    batched_docs = make_docs()
+    batched = build_pipeline(CONFIG).process_batch(batched_docs, batched_stats)
+    assert batched == sequential == [False, True, False, False, True, False]
+    assert [doc.meta for doc in batched_docs] == [doc.meta for doc in docs]
+    assert batched_stats['batch_calls'] == 1 and batched_stats['single_calls'] == 0
+    for key in ('documents', 'kept', 'test_has_period_rejected', 'test_batched_length_score_rejected'):
+        assert batched_stats[key] == sequential_stats[key]
+
+
+def test_batched_runs_match_sequential():
+    expected = [doc.url for doc in build_pipeline(CONFIG).run(make_docs(), defaultdict(int))]
+    stats = defaultdict(int)
+    assert [doc.url for doc in build_pipeline(CONFIG).run(make_docs(), stats, batch_size=4)] == expected
+    assert stats['batch_calls'] == 2
+    parallel = run_parallel(CONFIG, make_docs(), defaultdict(int), num_workers=2, chunk_size=3)
+    assert [doc.url for doc in parallel] == expected
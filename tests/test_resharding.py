@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from cs336_data.codecs import Codec, open_input
+from cs336_data.resharding import (
+    SHARD_MANIFEST_NAME, ShardInfo, ShardWriter, balanced_target, clear_final_outputs, load_shard_manifest,
+    write_shard_manifest,
+)
+
+
+def read_shards(shard_dir, shards):
+    lines = []
+    for shard in shards:
+        with open_input(shard_dir / shard.path, 'rt', encoding='utf-8') as f:
+            lines.extend(f)
+    return lines
+
+
+def test_shards_cut_at_the_document_target_across_inputs(tmp_path):
+    inputs = [[f"file {i} line {j}\n" for j in range(n)] for i, n in enumerate([3, 0, 17, 1, 9])]
+    with ShardWriter(tmp_path, codec=Codec.parse("gzip:1"), target_documents=4) as writer:
+        for lines in inputs:
+            writer.writelines(lines)
+    shards = load_shard_manifest(tmp_path)
+    assert [shard.documents for shard in shards] == [4, 4, 4, 4, 4, 4, 4, 2]
+    assert [shard.path for shard in shards][:2] == ["shard_00000.final.gz", "shard_00001.final.gz"]
+    assert read_shards(tmp_path, shards) == [line for lines in inputs for line in lines]
+    manifest = json.loads((tmp_path / SHARD_MANIFEST_NAME).read_text())
+    assert manifest['documents'] == 30 and manifest['bytes'] == sum(shard.bytes for shard in shards)
+
+
+def test_byte_target_keeps_lines_whole(tmp_path):
+    lines = ["x" * 10 + "\n", "\n", "y" * 25 + "\n", "z" * 5 + "\n"]
+    with ShardWriter(tmp_path, target_bytes=12) as writer:
+        writer.writelines(lines)
+    shards = writer.shards
+    assert [shard.bytes for shard in shards] == [12, 26, 6]
+    # Blank lines are written but are not documents
+    assert [shard.documents for shard in shards] == [1, 1, 1]
+    assert read_shards(tmp_path, shards) == lines
+
+
+def test_balanced_target_spreads_the_remainder():
+    assert balanced_target(100, 30) == 25
+    assert balanced_target(90, 30) == 30
+    assert balanced_target(0, 30) == 30
+
+
+def test_failed_write_leaves_no_partial_shard(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ShardWriter(tmp_path, target_documents=2) as writer:
+            writer.writelines(["a\n", "b\n", "c\n"])
+            raise RuntimeError("interrupted")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["shard_00000.final.txt"]
+    assert load_shard_manifest(tmp_path) is None
+
+
+def test_clearing_outputs_between_modes(tmp_path):
+    lines = [f"line {i}\n" for i in range(10)]
+    with ShardWriter(tmp_path, target_documents=4) as writer:
+        writer.writelines(lines)
+    # A per-file run after a sharded run leaves no manifest pointing at the old shards
+    assert len(clear_final_outputs(tmp_path)) == 4
+    assert load_shard_manifest(tmp_path) is None
+    (tmp_path / "a.final.txt").write_text("".join(lines))
+    (tmp_path / "notes.txt").write_text("kept")
+    # and a sharded run after a per-file run leaves no per-file outputs next to the shards
+    clear_final_outputs(tmp_path)
+    with ShardWriter(tmp_path, target_documents=4) as writer:
+        writer.writelines(lines)
+    assert sorted(path.name for path in tmp_path.glob("*.final.*")) == [shard.path for shard in writer.shards]
+    assert (tmp_path / "notes.txt").exists()
+
+
+def test_rewritten_manifest_keeps_the_shard_order(tmp_path):
+    shards = [ShardInfo("shard_00001.final.gz", 3, 30, 20), ShardInfo("shard_00000.final.gz", 0, 0, 10)]
+    assert write_shard_manifest(tmp_path, shards) == tmp_path / SHARD_MANIFEST_NAME
+    assert load_shard_manifest(tmp_path) == shards
+    manifest = json.loads((tmp_path / SHARD_MANIFEST_NAME).read_text())
+    assert manifest['documents'] == 3 and manifest['bytes'] == 30 and manifest['target_documents'] is None
@@ -0,0 +1,120 @@
+from collections import defaultdict
+
+import pytest
+
+from cs336_data.boilerplate import BoilerplateStripper
+from cs336_data.pipeline import Document, build_pipeline, register_stage
+from cs336_data.threshold_sweep import FeatureTable, format_sweep, grid_configurations, load_sweep_grid, sweep
+from cs336_data.utilities import gopher_features, gopher_quality_filter
+
+
+@register_stage("test_sweep_odd", cost=1)
+def odd_stage():
+    def fn(doc, stats):
+        return int(doc.url) % 2 == 1
+    return fn
+
+
+# Like the boilerplate stage of parallel_process_wets.py, for a single domain
+@register_stage("test_sweep_boilerplate", cost=1, transform=True, side_effects=True)
+def boilerplate_stage():
+    stripper = BoilerplateStripper(min_pages=2, min_fraction=0.1)
+
+    def fn(doc, stats):
+        doc.text = stripper.strip("example.com", [doc.text], stats)[0]
+        return True
+    return fn
+
+
+def config(min_sentences=5):
+    return {"reorder": False, "stages": [{"name": "test_sweep_odd"},
+                                         {"name": "c4_sentences", "min_sentences": min_sentences}]}
+
+
+def docs():
+    return [Document(url=str(i), text="one more sentence. " * (i % 10) + "x" * i) for i in range(100)]
+
+
+def run(config, docs, sweep_stages=()):
+    pipeline = build_pipeline(dict(config, sweep_stages=list(sweep_stages)))
+    table = FeatureTable(list(sweep_stages))
+    kept = list(pipeline.run(docs, defaultdict(int), annotate=table.add))
+    return kept, table
+
+
+def test_sweep_matches_separate_runs():
+    _, table = run(config(), docs(), ["c4_sentences"])
+    assert table.documents == 100 and len(table) == 50
+    grid = {"c4_sentences": {"min_sentences": [2, 5, 9]}}
+    results = sweep(table, config(), grid, bytes_per_token=2)
+    for result in results:
+        min_sentences = result.params[("c4_sentences", "min_sentences")]
+        kept, _ = run(config(min_sentences), docs())
+        assert result.documents == len(kept)
+        assert result.bytes == sum(len(doc.text) + 1 for doc in kept) > 0
+        assert result.tokens == result.bytes / 2
+    lines = format_sweep(results, table, config())
+    assert lines[3].startswith("*") and not lines[2].startswith("*")
+
+
+def test_sweeping_pipeline_keeps_the_same_documents():
+    kept, _ = run(config(), docs())
+    swept, _ = run(config(), docs(), ["c4_sentences"])
+    assert [doc.url for doc in swept] == [doc.url for doc in kept]
+    rejected = Document(url="2", text="")
+    build_pipeline(dict(config(), sweep_stages=["c4_sentences"])).process(rejected, defaultdict(int))
+    assert rejected.meta['rejected_stages'] == ["test_sweep_odd"]
+
+
+def test_sweep_sees_the_transforms_after_a_swept_rejection():
+    def boilerplate_config(min_sentences=5):
+        return {"reorder": False, "stages": [{"name": "c4_sentences", "min_sentences": min_sentences},
+                                             {"name": "test_sweep_boilerplate"}]}
+
+    def pages():
+        # The first two pages pass every setting, so the template is stripped from the third on
+        return [Document(url=str(i), text="Home | About | Contact\n" + "one more sentence. " * (9 if i < 2 else i % 10))
+                for i in range(30)]
+
+    _, table = run(boilerplate_config(), pages(), ["c4_sentences"])
+    grid = {"c4_sentences": {"min_sentences": [2, 5, 9]}}
+    for result in sweep(table, boilerplate_config(), grid):
+        kept, _ = run(boilerplate_config(result.params[("c4_sentences", "min_sentences")]), pages())
+        assert result.documents == len(kept)
+        assert result.bytes == sum(len(doc.text) + 1 for doc in kept)
+        assert all(not doc.text.startswith("Home") for doc in kept[2:])
+
+
+def test_sweep_stages_per_call():
+    pipeline = build_pipeline(config())
+    swept = Document(url="1", text="too short.")
+    assert not pipeline.process(swept, defaultdict(int), sweep_stages=["c4_sentences"])
+    assert swept.meta['rejected_stages'] == ["c4_sentences"]
+    assert pipeline.sweep_stages == set()
+    plain = Document(url="1", text="too short.")
+    pipeline.process_batch([plain], defaultdict(int))
+    assert 'rejected_stages' not in plain.meta
+
+
+def test_gopher_features_reproduce_the_filter():
+    grid = {"gopher": {"min_words": [5, 50], "max_ellipsis_lines": [0.3, 1.0]}}
+    texts = ["the cat sat on the mat " * 20, "short text here", "word...\n" * 60, "123 456 " * 40]
+    table = FeatureTable(["gopher"])
+    for text in texts:
+        table.add(Document(url="", text=text))
+    gopher_config = {"stages": [{"name": "gopher"}]}
+    for result in sweep(table, gopher_config, grid):
+        bounds = {name: value for (_, name), value in result.params.items()}
+        assert result.documents == sum(gopher_quality_filter(text, **bounds) for text in texts)
+    assert gopher_features("")["gopher_words"] == 0
+
+
+def test_grid(tmp_path):
+    path = tmp_path / "grid.yaml"
+    path.write_text("lid:\n  threshold: [0.8, 0.9]\n  language: en\nc4_sentences:\n  min_sentences: [3, 5]\n")
+    grid = load_sweep_grid(path)
+    assert grid["lid"]["language"] == ["en"]
+    assert len(grid_configurations(grid)) == 4
+    path.write_text("decode:\n  encoding: [utf-8]\n")
+    with pytest.raises(KeyError):
+        load_sweep_grid(path)
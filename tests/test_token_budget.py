@@ -0,0 +1,37 @@
+import concurrent.futures
+import multiprocessing
+
+from cs336_data.token_budget import TokenBudget
+
+BUDGET = None
+
+
+def init_worker(budget):
+    global BUDGET
+    BUDGET = budget
+
+
+def report(kept_bytes):
+    BUDGET.add(kept_bytes, 100)
+
+
+def test_projection_extrapolates_the_observed_yield():
+    budget = TokenBudget(1000, bytes_per_token=4)
+    budget.schedule(10_000)
+    assert budget.projected_tokens() == 0 and not budget.met()
+    # A quarter of the scheduled input read, keeping 10% of it as text
+    budget.add(250, 2_500)
+    assert budget.kept_tokens == 62.5
+    assert budget.projected_tokens() == 250
+    budget.schedule(30_000)
+    assert budget.projected_tokens() == 1000 and budget.met()
+
+
+def test_workers_share_the_counter():
+    context = multiprocessing.get_context("fork")
+    budget = TokenBudget(10, context=context)
+    with concurrent.futures.ProcessPoolExecutor(2, mp_context=context, initializer=init_worker,
+                                                initargs=(budget,)) as pool:
+        list(pool.map(report, [4] * 50))
+    assert budget.counts[0] == 200 and budget.counts[1] == 5000
+    assert budget.kept_tokens == 50
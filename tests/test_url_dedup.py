@@ -0,0 +1,57 @@
+import concurrent.futures
+
+from .adapters import run_normalize_url, run_shared_bloom_filter
+
+SEEN_URLS = None
+
+
+def _init_worker(seen_urls):
+    global SEEN_URLS
+    SEEN_URLS = seen_urls
+
+
+def _add_urls(urls):
+    return [SEEN_URLS.add(url) for url in urls]
+
+
+def test_normalize_url_equivalent_spellings():
+    expected = run_normalize_url("https://example.com/a/b?x=1&y=2")
+    assert run_normalize_url("http://www.Example.com/a/b/?y=2&x=1") == expected
+    assert run_normalize_url("https://example.com:443/a/b?x=1&y=2#section") == expected
+    assert run_normalize_url("https://example.com/a/b?x=1&utm_source=feed&y=2&fbclid=abc") == expected
+
+
+def test_normalize_url_distinct_pages():
+    assert run_normalize_url("https://example.com/a") != run_normalize_url("https://example.com/b")
+    assert run_normalize_url("https://example.com/a?page=1") != run_normalize_url("https://example.com/a?page=2")
+    assert run_normalize_url("https://example.com:8080/a") != run_normalize_url("https://example.com/a")
+    assert run_normalize_url("https://blog.example.com/a") != run_normalize_url("https://example.com/a")
+
+
+def test_shared_bloom_filter_add():
+    bloom = run_shared_bloom_filter(capacity=1000, error_rate=1e-3)
+    assert not bloom.add("example.com/a")
+    assert bloom.add("example.com/a")
+    assert "example.com/a" in bloom
+    assert "example.com/b" not in bloom
+
+
+def test_shared_bloom_filter_false_positive_rate():
+    bloom = run_shared_bloom_filter(capacity=10_000, error_rate=1e-2)
+    for i in range(10_000):
+        bloom.add(f"example.com/page/{i}")
+    false_positives = sum(f"example.org/page/{i}" in bloom for i in range(10_000))
+    assert false_positives / 10_000 < 0.03
+
+
+def test_shared_bloom_filter_across_processes():
+    bloom = run_shared_bloom_filter(capacity=1000, error_rate=1e-3)
+    urls = [f"example.com/{i}" for i in range(100)]
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=4, initializer=_init_worker, initargs=(bloom,)
+    ) as executor:
+        results = list(executor.map(_add_urls, [urls] * 4))
+    # Every URL is inserted exactly once across all workers, every other insert sees it
+    first_inserts = sum(not seen for result in results for seen in result)
+    assert first_inserts == len(urls)
+    assert all(url in bloom for url in urls)
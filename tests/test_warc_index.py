@@ -0,0 +1,84 @@
+import gzip
+
+from fastwarc.warc import WarcRecordType
+
+from cs336_data.warc_index import (
+    build_warc_indexes,
+    ensure_warc_index,
+    iter_indexed_records,
+    load_warc_index,
+    sample_index_entries,
+    split_indexed_warc_file,
+    write_warc_index,
+)
+from cs336_data.warc_reader import iter_warc_records
+
+from .test_warc_reader import read_urls, write_wet
+
+
+def write_warc_with_responses(path, num_records):
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(b"WARC/1.0\r\nWARC-Type: warcinfo\r\nContent-Length: 0\r\n\r\n\r\n\r\n"))
+        for i in range(num_records):
+            http = f"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<p>page {i}</p>".encode()
+            record = (
+                b"WARC/1.0\r\nWARC-Type: response\r\n"
+                + f"WARC-Target-URI: http://example.com/{i}\r\n".encode()
+                + f"Content-Type: application/http; msgtype=response\r\nContent-Length: {len(http)}\r\n\r\n".encode()
+                + http + b"\r\n\r\n"
+            )
+            f.write(gzip.compress(record))
+
+
+def test_index_records_every_member(tmp_path):
+    path = tmp_path / "shard.warc.wet.gz"
+    write_wet(path, 50)
+    assert write_warc_index(path) == 50
+    entries = load_warc_index(path)
+    assert [entry.uri for entry in entries] == read_urls(path)
+    assert {entry.record_type for entry in entries} == {"conversion"}
+    assert entries[0].offset == 0 and entries[-1].offset + entries[-1].length == path.stat().st_size
+    assert all(a.offset + a.length == b.offset for a, b in zip(entries, entries[1:]))
+
+
+def test_indexed_reads_seek_to_sampled_records(tmp_path):
+    path = tmp_path / "crawl.warc.gz"
+    write_warc_with_responses(path, 30)
+    build_warc_indexes([path], num_workers=2)
+    sample = sample_index_entries([path], 5, record_type="response", seed=3)
+    assert len(sample) == 5 and all(entry.record_type == "response" for _, entry in sample)
+    records = iter_indexed_records(path, [entry for _, entry in sample], parse_http=True)
+    bodies = [(record.headers.get('WARC-Target-URI'), record.reader.read()) for record in records]
+    assert bodies == [(entry.uri, f"<p>page {entry.uri.rsplit('/', 1)[1]}</p>".encode()) for _, entry in sample]
+
+
+def test_split_from_index_covers_every_record_once(tmp_path):
+    path = tmp_path / "shard.warc.wet.gz"
+    write_wet(path, 300)
+    write_warc_index(path)
+    ranges = split_indexed_warc_file(path, chunk_bytes=2000)
+    assert len(ranges) > 1
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    urls = [
+        record.headers.get('WARC-Target-URI')
+        for byte_range in ranges
+        for record in iter_warc_records(path, WarcRecordType.conversion, parse_http=False, byte_range=byte_range)
+    ]
+    assert urls == read_urls(path)
+
+    # A stale index (file rewritten since) falls back to probing the file
+    write_wet(path, 301)
+    assert split_indexed_warc_file(path, chunk_bytes=2000)[-1][1] == path.stat().st_size
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = tmp_path / "shard.warc.wet.gz"
+    write_wet(path, 10)
+    write_warc_index(path)
+    # A new download of the file under the same name
+    write_wet(path, 20)
+    assert len(load_warc_index(path)) == 10
+    assert [entry.uri for entry in ensure_warc_index(path)] == read_urls(path)
+    write_wet(path, 5)
+    assert build_warc_indexes([path], num_workers=1) == {str(path): 5}
+    assert build_warc_indexes([path], num_workers=1) == {}
@@ -0,0 +1,47 @@
+import gzip
+
+from fastwarc.warc import WarcRecordType
+
+from cs336_data.warc_reader import iter_warc_records, split_warc_file
+
+
+def write_wet(path, num_records):
+    # One gzip member per record, like Common Crawl
+    with open(path, 'wb') as f:
+        for i in range(num_records):
+            body = f"Record number {i} with some text.\n".encode() * (i % 5 + 1)
+            record = (
+                b"WARC/1.0\r\nWARC-Type: conversion\r\n"
+                + f"WARC-Target-URI: http://example.com/{i}\r\n".encode()
+                + f"Content-Type: text/plain\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                + body + b"\r\n\r\n"
+            )
+            f.write(gzip.compress(record))
+
+
+def read_urls(path, byte_range=None):
+    records = iter_warc_records(path, WarcRecordType.conversion, parse_http=False, byte_range=byte_range)
+    return [record.headers.get('WARC-Target-URI') for record in records]
+
+
+def test_split_warc_file_covers_every_record_once(tmp_path):
+    path = tmp_path / "shard.warc.wet.gz"
+    write_wet(path, 500)
+    expected = read_urls(path)
+    assert len(expected) == 500
+
+    ranges = split_warc_file(path, chunk_bytes=2000)
+    assert len(ranges) > 1
+    assert ranges[0][0] == 0 and ranges[-1][1] == path.stat().st_size
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert [url for byte_range in ranges for url in read_urls(path, byte_range)] == expected
+
+
+def test_split_warc_file_keeps_small_and_single_member_files_whole(tmp_path):
+    path = tmp_path / "small.warc.wet.gz"
+    write_wet(path, 3)
+    assert split_warc_file(path, chunk_bytes=1 << 20) == [(0, path.stat().st_size)]
+
+    single = tmp_path / "single.warc.wet.gz"
+    single.write_bytes(gzip.compress(gzip.decompress(path.read_bytes())))
+    assert split_warc_file(single, chunk_bytes=16) == [(0, single.stat().st_size)]
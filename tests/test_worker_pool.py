@@ -0,0 +1,68 @@
+import gc
+import os
+import time
+from collections import defaultdict
+
+from cs336_data.pipeline import Document, register_stage, run_parallel
+from cs336_data.worker_pool import PreloadedPool, format_startups, unique_set_size
+
+# Set in the parent before the pool forks; workers see it without loading anything
+TABLE = {}
+
+
+def lookup(key):
+    return os.getpid(), TABLE.get(key)
+
+
+def freeze_count(_):
+    return gc.get_freeze_count()
+
+
+def set_worker_flag(value):
+    TABLE['flag'] = value
+
+
+@register_stage("test_built_in", cost=1)
+def built_in_stage():
+    built_in = os.getpid()
+
+    def fn(doc, stats):
+        doc.meta['built_in'] = built_in
+        return True
+    return fn
+
+
+def test_forked_workers_share_preloaded_state():
+    TABLE['answer'] = 42
+    with PreloadedPool(2, start_method="fork", initializer=set_worker_flag, initargs=("ready",)) as pool:
+        results = list(pool.map(lookup, ["answer", "flag"] * 4))
+        frozen = list(pool.map(freeze_count, range(4)))
+        # Both workers are forked with the pool, but one may still be reporting its startup
+        deadline = time.monotonic() + 10
+        while len(pool.worker_startups()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        memory = pool.worker_memory()
+        startups = pool.worker_startups()
+    assert {value for _, value in results} == {42, "ready"}
+    # The workers keep the objects of this process frozen
+    assert min(frozen) > 0
+    assert all(pid != os.getpid() for pid, _ in results)
+    assert len(startups) == 2 and {startup.pid for startup in startups} == set(memory)
+    assert all(startup.latency >= 0 for startup in startups)
+    lines = format_startups(startups, memory)
+    assert lines[0].startswith("2 workers, startup latency") and len(lines) == 3
+    # Nothing stays frozen in this process once the workers are forked
+    assert gc.get_freeze_count() == 0 and gc.isenabled()
+
+
+def test_unique_set_size_of_this_process():
+    uss = unique_set_size()
+    assert uss is None or uss > 0
+
+
+def test_preloaded_run_parallel_builds_the_pipeline_once():
+    config = {"stages": [{"name": "test_built_in"}]}
+    docs = [Document(url=str(i), text="text") for i in range(20)]
+    kept = list(run_parallel(config, docs, defaultdict(int), num_workers=2, chunk_size=4, preload=True))
+    assert [doc.url for doc in kept] == [str(i) for i in range(20)]
+    assert {doc.meta['built_in'] for doc in kept} == {os.getpid()}